@@ -0,0 +1,172 @@
+"""
+Indicateurs du dashboard (KPIs, agrégat par zone, couleurs des cartes).
+
+Les calculs sont vectorisés (sommes de booléens / tables de correspondance
+NumPy, sans lambda ni apply ligne à ligne). Les fonctions `*_for(conn,
+filters)` sont mémoïsées par version de données: l'agrégat par zone est
+calculé une seule fois par jeu de filtres et partagé par toutes les sections.
+"""
+import numpy as np
+import pandas as pd
+
+import cache
+import database as db
+import risk_rules
+
+ZONE_COLUMNS = ["zone", "menages", "pct_eau", "pct_san", "vuln_elevee_pct", "sans_san_pct", "besoins_moy", "score"]
+COMBINATION_COLUMNS = ["zone", "needs_mask", "combinaison", "nb_besoins", "menages", "pct_zone"]
+
+# Libellés des besoins, dans l'ordre des bits de needs_mask (db.NEED_COLUMNS)
+NEED_LABELS = ["Eau", "Assainissement", "Habitat", "Éducation", "Santé", "Activités économiques"]
+
+# needs_mask -> nombre de besoins (popcount) et libellé de la combinaison
+NEED_COUNT_LUT = np.array([bin(m).count("1") for m in range(db.NEED_COMBINATIONS)], dtype=np.int8)
+COMBINATION_LABELS = np.array([
+    " + ".join(label for i, label in enumerate(NEED_LABELS) if m >> i & 1) or "Aucun besoin"
+    for m in range(db.NEED_COMBINATIONS)
+], dtype=object)
+
+# ------------------ Ménages ------------------
+
+def has_any_need(df, needs) -> np.ndarray:
+    """Ménages ayant au moins un des besoins `needs` (colonnes needs_*): un ET bit à bit sur needs_mask."""
+    return (df["needs_mask"].to_numpy() & db.needs_bits(needs)) != 0
+
+def needs_count(df) -> pd.Series:
+    """Nombre de besoins déclarés par ménage (needs_mask, sinon colonnes needs_*; absentes = 0)."""
+    if "needs_mask" in df.columns:
+        return pd.Series(NEED_COUNT_LUT[df["needs_mask"].to_numpy()], index=df.index)
+    cols = [c for c in db.NEED_COLUMNS if c in df.columns]
+    if not cols:
+        return pd.Series(0, index=df.index, dtype="int64")
+    values = df[cols].to_numpy(dtype="float64", na_value=0.0)
+    return pd.Series(values.sum(axis=1), index=df.index)
+
+# ------------------ Agrégats (sur le rollup) ------------------
+
+def compute_kpis(r, target_total):
+    n = int(r["households"].sum()) if len(r) else 0
+    if n == 0:
+        return dict(
+            pct_water=0, pct_san=0, pct_school=0, pct_3needs=0,
+            surveyed=0, target=target_total
+        )
+    pct_water = 100 * r["water_improved"].sum() / n
+    pct_san = 100 * r["sanitation"].sum() / n
+    pct_school = 100 * r["children_schooling"].sum() / n
+    pct_3needs = 100 * r["households"].to_numpy()[r["need_count"].to_numpy() >= 3].sum() / n
+    return dict(
+        pct_water=pct_water,
+        pct_san=pct_san,
+        pct_school=pct_school,
+        pct_3needs=pct_3needs,
+        surveyed=n,
+        target=target_total
+    )
+
+def zone_aggregate(r):
+    """Agrégat par zone (une ligne par zone), trié par score de priorité décroissant."""
+    if len(r) == 0:
+        return pd.DataFrame(columns=ZONE_COLUMNS)
+    hh = r["households"].to_numpy()
+    tmp = pd.DataFrame({
+        "zone": r["zone"].to_numpy(),
+        "households": hh,
+        "water_improved": r["water_improved"].to_numpy(),
+        "sanitation": r["sanitation"].to_numpy(),
+        "vuln_elevee": hh * (r["vulnerability"].to_numpy() == "Élevé"),
+        "need_total": hh * r["need_count"].to_numpy(),
+    })
+    s = tmp.groupby("zone", sort=False).sum()
+    n = s["households"]
+    g = pd.DataFrame({
+        "menages": n,
+        "pct_eau": 100 * s["water_improved"] / n,
+        "pct_san": 100 * s["sanitation"] / n,
+        "vuln_elevee_pct": 100 * s["vuln_elevee"] / n,
+        "sans_san_pct": 100 * (n - s["sanitation"]) / n,
+        "besoins_moy": s["need_total"] / n,
+    }).reset_index()
+    g["score"] = g["vuln_elevee_pct"]*0.45 + g["sans_san_pct"]*0.35 + g["besoins_moy"]*10*0.20
+    return g.sort_values("score", ascending=False)[ZONE_COLUMNS]
+
+def need_totals(r) -> dict:
+    """Nombre de ménages par besoin (colonne needs_* -> effectif)."""
+    if len(r) == 0:
+        return {c: 0 for c in db.NEED_COLUMNS}
+    masks = r["needs_mask"].to_numpy()
+    hh = r["households"].to_numpy()
+    return {c: int(hh[(masks >> i) & 1 == 1].sum()) for i, c in enumerate(db.NEED_COLUMNS)}
+
+def need_combinations(r):
+    """Ménages par zone × combinaison de besoins (histogramme à 64 cases de
+    needs_mask par zone), combinaisons les plus fréquentes d'abord."""
+    if len(r) == 0:
+        return pd.DataFrame(columns=COMBINATION_COLUMNS)
+    code, zones = pd.factorize(r["zone"], sort=True)
+    hist = np.bincount(
+        code * db.NEED_COMBINATIONS + r["needs_mask"].to_numpy(),
+        weights=r["households"].to_numpy(),
+        minlength=len(zones) * db.NEED_COMBINATIONS,
+    ).reshape(len(zones), db.NEED_COMBINATIONS)
+    z, m = np.nonzero(hist)
+    out = pd.DataFrame({
+        "zone": np.asarray(zones)[z],
+        "needs_mask": m,
+        "combinaison": COMBINATION_LABELS[m],
+        "nb_besoins": NEED_COUNT_LUT[m],
+        "menages": hist[z, m].astype("int64"),
+        "pct_zone": 100 * hist[z, m] / hist.sum(axis=1)[z],
+    })
+    return out.sort_values(["zone", "menages"], ascending=[True, False], ignore_index=True)
+
+@cache.memoize("households")
+def rollup_for(conn, filters):
+    return db.query_rollup(conn, filters)
+
+@cache.memoize("households", "targets")
+def kpis_for(conn, filters):
+    return compute_kpis(rollup_for(conn, filters), db.get_target(conn))
+
+@cache.memoize("households")
+def zones_for(conn, filters):
+    return zone_aggregate(rollup_for(conn, filters))
+
+@cache.memoize("households")
+def combinations_for(conn, filters):
+    return need_combinations(rollup_for(conn, filters))
+
+# ------------------ Couleurs des cartes ------------------
+# Tables de correspondance RGBA indexées par code (nombre de besoins plafonné
+# à 4 / niveau de risque); les couleurs sont posées en colonnes r, g, b, a et
+# lues par pydeck via l'accessor "[r, g, b, a]".
+
+NEED_COLOR_LUT = np.array([
+    [170, 200, 220, 150],  # 0 besoin
+    [170, 200, 220, 150],  # 1
+    [68, 160, 201, 170],   # 2
+    [44, 110, 161, 170],   # 3
+    [45, 51, 129, 170],    # ≥ 4
+], dtype=np.uint8)
+
+RISK_LEVELS = risk_rules.LEVELS
+RISK_COLOR_LUT = np.array([
+    [0, 200, 120, 180],
+    [255, 165, 0, 180],
+    [255, 0, 0, 180],
+    [120, 120, 120, 180],  # niveau inconnu / manquant
+], dtype=np.uint8)
+
+COLOR_ACCESSOR = "[r, g, b, a]"
+
+def _assign_rgba(df, rgba):
+    return df.assign(r=rgba[:, 0], g=rgba[:, 1], b=rgba[:, 2], a=rgba[:, 3])
+
+def with_need_colors(df, need_count):
+    idx = np.clip(np.asarray(need_count, dtype="float64"), 0, len(NEED_COLOR_LUT) - 1).astype(np.intp)
+    return _assign_rgba(df, NEED_COLOR_LUT[idx])
+
+def with_risk_colors(df):
+    codes = pd.Categorical(df["risk_level"], categories=RISK_LEVELS).codes
+    # code -1 (hors catégories) -> dernière ligne (gris)
+    return _assign_rgba(df, RISK_COLOR_LUT[codes])
@@ -1,9 +1,19 @@
+import time
+STARTED = time.perf_counter()
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import pydeck as pdk
 from datetime import datetime, date
 import database as db
+import cache
+import analysis
+import baselines
+import mapping
+import exports
+import reports
+import risk_rules
+import simulation
+import spatial
+import perf
 
 # ------------------ Page config ------------------
 st.set_page_config(
@@ -11,6 +21,8 @@ st.set_page_config(
     page_icon="🌊",
     layout="wide",
 )
+perf.start_rerun()
+perf.startup("import", time.perf_counter() - STARTED)
 
 # ------------------ Styling amélioré ------------------
 CSS = """
@@ -69,10 +81,6 @@ html, body, [class*="css"] { font-family: 'Inter', sans-serif !important; }
 .legend-item { display: flex; align-items: center; gap: 6px; font-size: 0.82rem; font-weight: 500; }
 .legend-dot { width: 12px; height: 12px; border-radius: 50%; }
 
-.stTabs [data-baseweb="tab-list"] { gap: 8px; background: rgba(255,255,255,0.5); padding: 6px; border-radius: 14px; }
-.stTabs [data-baseweb="tab"] { border-radius: 10px; padding: 10px 20px; font-weight: 600; }
-.stTabs [aria-selected="true"] { background: white; box-shadow: var(--shadow-soft); }
-
 section[data-testid="stSidebar"] { background: linear-gradient(180deg, #f8fafc 0%, #f1f5f9 100%); }
 
 #MainMenu {visibility: hidden;}
@@ -82,18 +90,28 @@ footer {visibility: hidden;}
 st.markdown(CSS, unsafe_allow_html=True)
 
 # ------------------ DB init ------------------
-conn = db.get_connection()
-db.init_db(conn)
+# Schéma vérifié une fois par processus; connexion de lecture ouverte une fois
+# par session (chaque rerun s'exécute dans un nouveau thread: une connexion par
+# thread serait rouverte, cache de pages vide, à chaque interaction).
+
+@st.cache_resource(show_spinner=False)
+def init_database(path):
+    with perf.span("startup.init_db"):
+        with db.writer(path) as wconn:
+            db.init_db(wconn)
+    return path
+
+def session_connection():
+    path = init_database(db.DB_PATH)
+    if st.session_state.get("db_path") != path:
+        st.session_state["db_conn"] = db.open_reader(path)
+        st.session_state["db_path"] = path
+    return st.session_state["db_conn"]
+
+conn = session_connection()
 
 # ------------------ Helpers ------------------
-NEED_COLS = {
-    "Eau": "needs_water",
-    "Assainissement": "needs_sanitation",
-    "Habitat": "needs_housing",
-    "Éducation": "needs_education",
-    "Santé": "needs_health",
-    "Activités économiques": "needs_economic",
-}
+NEED_COLS = dict(zip(analysis.NEED_LABELS, db.NEED_COLUMNS))
 
 def banner():
     st.markdown(
@@ -127,38 +145,43 @@ def tag(level):
         return '<span class="tag tag-warn">⚠ ATTENTION</span>'
     return '<span class="tag tag-bad">⚠ CRITIQUE</span>'
 
-def parse_dt(s):
-    try:
-        return pd.to_datetime(s)
-    except Exception:
-        return pd.NaT
-
-def needs_count(df):
-    cols = list(NEED_COLS.values())
-    for c in cols:
-        if c not in df.columns:
-            df[c] = 0
-    return df[cols].fillna(0).sum(axis=1)
-
-def filtered_data():
-    h = db.households_df(conn)
-    w = db.water_df(conn)
-
-    if len(h):
-        h["collected_at"] = pd.to_datetime(h["collected_at"])
-    if len(w):
-        w["collected_at"] = pd.to_datetime(w["collected_at"])
+# ------------------ Chargements (cache invalidé par version de données) ------------------
+
+@cache.memoize("households", "water_samples")
+def sidebar_options(conn):
+    return db.distinct_zones(conn), db.date_bounds(conn)
+
+# Colonnes utilisées par les sections (les cartes et les exports ont leurs propres requêtes)
+HOUSEHOLD_COLUMNS = ["household_id", "collected_at", "zone", "hh_size", "main_activity", "vulnerability", "needs_mask"]
+WATER_COLUMNS = ["sample_id", "collected_at", "zone", "season", "ph", "turbidity", "conductivity", "e_coli", "risk_level"]
+
+# Après de simples ajouts (formulaires reçus), seules les nouvelles lignes sont lues
+@cache.memoize_append("households")
+def households_for(conn, filters):
+    return db.query_households(conn, filters, columns=HOUSEHOLD_COLUMNS)
 
+@cache.memoize_append("water_samples")
+def water_for(conn, filters):
+    return db.query_water(conn, filters, columns=WATER_COLUMNS)
+
+# Tenus à jour à l'insertion (baselines.py): lus tels quels, sans parcourir l'historique
+ALERTS_SHOWN = 50
+
+@cache.memoize("water_samples")
+def latest_water_for(conn, filters):
+    return db.latest_water(conn, filters)
+
+@cache.memoize("water_samples")
+def alerts_for(conn, filters):
+    return db.query_alerts(conn, filters, limit=ALERTS_SHOWN)
+
+def sidebar_filters():
     # Sidebar filters (comme décrit dans l’annexe)
     st.sidebar.header("Filtres")
-    zones = sorted(list(set(h["zone"].dropna().unique().tolist() + w["zone"].dropna().unique().tolist())))
+    zones, (dmin, dmax) = sidebar_options(conn)
     zone_sel = st.sidebar.multiselect("Quartier / zone", zones, default=zones)
 
-    if len(h):
-        dmin, dmax = h["collected_at"].min().date(), h["collected_at"].max().date()
-    elif len(w):
-        dmin, dmax = w["collected_at"].min().date(), w["collected_at"].max().date()
-    else:
+    if dmin is None:
         dmin, dmax = date.today(), date.today()
 
     dr = st.sidebar.date_input("Période d’analyse", value=(dmin, dmax))
@@ -170,116 +193,196 @@ def filtered_data():
     vuln_sel = st.sidebar.multiselect("Niveau de vulnérabilité", ["Faible", "Moyen", "Élevé"], default=["Faible", "Moyen", "Élevé"])
     need_sel = st.sidebar.multiselect("Type de besoin", list(NEED_COLS.keys()), default=list(NEED_COLS.keys()))
 
-    # Apply filters
-    if len(h):
-        h = h[h["zone"].isin(zone_sel)]
-        h = h[(h["collected_at"].dt.date >= start) & (h["collected_at"].dt.date <= end)]
-        h = h[h["vulnerability"].isin(vuln_sel)]
-        # keep households that have at least one selected need
-        sel_cols = [NEED_COLS[n] for n in need_sel]
-        if sel_cols:
-            h = h[h[sel_cols].fillna(0).sum(axis=1) >= 1]
+    # Filtres appliqués côté SQLite (seules les lignes retenues sont chargées)
+    filters = {
+        "zones": zone_sel,
+        "start": start,
+        "end": end,
+        "vuln": vuln_sel,
+        "needs": [NEED_COLS[n] for n in need_sel],
+    }
+    return {"zones": zone_sel, "start": start, "end": end, "vuln": vuln_sel, "needs": need_sel}, filters
 
-    if len(w):
-        w = w[w["zone"].isin(zone_sel)]
-        w = w[(w["collected_at"].dt.date >= start) & (w["collected_at"].dt.date <= end)]
+# Chargements à la demande: chaque section ne lit que ce qu'elle affiche
+def households_data(filters):
+    with perf.span("data.households"):
+        return households_for(conn, filters)
 
-    return h, w, {"zones": zone_sel, "start": start, "end": end, "vuln": vuln_sel, "needs": need_sel}
+def water_data(filters):
+    with perf.span("data.water"):
+        return water_for(conn, filters)
 
-def compute_kpis(h, target_total):
-    if len(h) == 0:
-        return dict(
-            pct_water=0, pct_san=0, pct_school=0, pct_3needs=0,
-            surveyed=0, target=target_total
-        )
-    pct_water = 100 * h["water_improved"].fillna(0).mean()
-    pct_san = 100 * h["sanitation"].fillna(0).mean()
-    pct_school = 100 * h["children_schooling"].fillna(0).mean()
-    needc = needs_count(h)
-    pct_3needs = 100 * (needc >= 3).mean()
-    return dict(
-        pct_water=pct_water,
-        pct_san=pct_san,
-        pct_school=pct_school,
-        pct_3needs=pct_3needs,
-        surveyed=len(h),
-        target=target_total
-    )
+def latest_water_data(filters):
+    with perf.span("data.water_latest"):
+        return latest_water_for(conn, filters)
 
-def top_zones(h):
-    if len(h) == 0:
-        return pd.DataFrame(columns=["zone", "vuln_elevee_pct", "sans_san_pct", "besoins_moy"])
-    tmp = h.copy()
-    tmp["need_count"] = needs_count(tmp)
-    g = tmp.groupby("zone").agg(
-        vuln_elevee_pct=("vulnerability", lambda s: 100*(s=="Élevé").mean()),
-        sans_san_pct=("sanitation", lambda s: 100*(s.fillna(0)==0).mean()),
-        besoins_moy=("need_count", "mean"),
-        menages=("household_id","count")
-    ).reset_index()
-    g["score"] = g["vuln_elevee_pct"]*0.45 + g["sans_san_pct"]*0.35 + g["besoins_moy"]*10*0.20
-    return g.sort_values("score", ascending=False)
-
-def water_map(w):
-    if len(w) == 0 or w[["lat","lon"]].dropna().empty:
-        st.info("Aucun point d’eau géolocalisé sur la période / filtres.")
-        return
-    df = w.dropna(subset=["lat","lon"]).copy()
-    color = {
-        "Conforme": [0, 200, 120, 180],
-        "A_surveiller": [255, 165, 0, 180],
-        "A_risque": [255, 0, 0, 180],
-    }
-    df["color"] = df["risk_level"].apply(lambda x: color.get(x, [120,120,120,180]))
-    layer = pdk.Layer(
+def alerts_data(filters):
+    with perf.span("data.water_alerts"):
+        return alerts_for(conn, filters)
+
+def rollup_data(filters):
+    with perf.span("analysis.rollup"):
+        return analysis.rollup_for(conn, filters)
+
+def kpis_data(filters):
+    with perf.span("analysis.kpis"):
+        return analysis.kpis_for(conn, filters)
+
+def zones_data(filters):
+    with perf.span("analysis.top_zones"):
+        return analysis.zones_for(conn, filters)
+
+COMBINATIONS_SHOWN = 8
+
+def combinations_data(filters):
+    with perf.span("analysis.combinaisons"):
+        return analysis.combinations_for(conn, filters)
+
+SIM_METRICS = {"pct_water": ("Accès eau améliorée", "🚰"), "pct_san": ("Assainissement", "🚽"), "pct_3needs": ("≥ 3 besoins", "⚠️")}
+SWEEP_GAINS = list(range(0, 45, 5))
+
+def simulation_data(filters, scenario):
+    with perf.span("simulation.scenario"):
+        return simulation.simulate_for(conn, filters, scenario)
+
+def sweep_data(filters, scenarios):
+    with perf.span("simulation.balayage"):
+        return simulation.sweep_for(conn, filters, scenarios)
+
+def map_controls(key):
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        cell_m = st.select_slider("Taille des cellules (m)", mapping.CELL_SIZES_M, value=mapping.DEFAULT_CELL_M, key=f"{key}_cell")
+    with c2:
+        raw = st.toggle("Points individuels (zoom élevé)", value=False, key=f"{key}_raw", help=f"Affiché automatiquement sous {mapping.POINT_THRESHOLD} points; désactivé au-delà de {mapping.MAX_RAW_POINTS}.")
+    return cell_m, raw
+
+def deck_layer(kind, df, radius, cell_m):
+    import pydeck as pdk
+    if kind == "grid":
+        return pdk.Layer(
+            "GridCellLayer",
+            data=df,
+            get_position='[lon, lat]',
+            get_fill_color=analysis.COLOR_ACCESSOR,
+            cell_size=cell_m,
+            extruded=False,
+            pickable=True,
+        )
+    return pdk.Layer(
         "ScatterplotLayer",
         data=df,
         get_position='[lon, lat]',
-        get_fill_color="color",
-        get_radius=55,
+        get_fill_color=analysis.COLOR_ACCESSOR,
+        get_radius=radius,
         pickable=True,
     )
-    view_state = pdk.ViewState(latitude=float(df["lat"].mean()), longitude=float(df["lon"].mean()), zoom=11, pitch=0)
-    deck = pdk.Deck(
-        layers=[layer],
-        initial_view_state=view_state,
-        tooltip={"text": "Zone: {zone}\nRisque: {risk_level}\npH: {ph}\nTurbidité: {turbidity}\nE. coli: {e_coli}"},
-    )
-    st.pydeck_chart(deck, use_container_width=True)
 
-def households_map(h):
-    if len(h) == 0 or h[["lat","lon"]].dropna().empty:
+def water_map(filters):
+    import pydeck as pdk
+    cell_m, raw = map_controls("water_map")
+    with perf.span("map.water.prepare"):
+        kind, df, n = mapping.water_map_for(conn, filters, cell_m, raw)
+    if n == 0:
+        st.info("Aucun point d’eau géolocalisé sur la période / filtres.")
+        return
+    view_state = pdk.ViewState(latitude=float(df["lat"].mean()), longitude=float(df["lon"].mean()), zoom=11, pitch=0)
+    if kind == "grid":
+        tooltip = {"text": "Prélèvements: {count}\nPire niveau: {risk_level}"}
+        st.caption(f"{n} prélèvements agrégés en {len(df)} cellules de {cell_m} m.")
+    else:
+        tooltip = {"text": "Zone: {zone}\nRisque: {risk_level}\npH: {ph}\nTurbidité: {turbidity}\nE. coli: {e_coli}"}
+    with perf.span("map.water.pydeck"):
+        deck = pdk.Deck(
+            layers=[deck_layer(kind, df, 55, cell_m)],
+            initial_view_state=view_state,
+            tooltip=tooltip,
+        )
+        st.pydeck_chart(deck, use_container_width=True)
+
+def households_map(filters, extra_layer=None):
+    import pydeck as pdk
+    cell_m, raw = map_controls("households_map")
+    with perf.span("map.households.prepare"):
+        kind, df, n = mapping.households_map_for(conn, filters, cell_m, raw)
+    if n == 0:
         st.info("Aucun ménage géolocalisé sur la période / filtres.")
         return
-    df = h.dropna(subset=["lat","lon"]).copy()
-    df["need_count"] = needs_count(df)
-    # scale to colors (blue gradients)
-    def col(n):
-        if n >= 4: return [45,51,129,170]
-        if n == 3: return [44,110,161,170]
-        if n == 2: return [68,160,201,170]
-        return [170, 200, 220, 150]
-    df["color"] = df["need_count"].apply(col)
-    layer = pdk.Layer(
+    view_state = pdk.ViewState(latitude=float(df["lat"].mean()), longitude=float(df["lon"].mean()), zoom=11, pitch=0)
+    if kind == "grid":
+        tooltip = {"text": "Ménages: {count}\nBesoins moy. (#): {need_mean}"}
+        st.caption(f"{n} ménages agrégés en {len(df)} cellules de {cell_m} m.")
+    else:
+        tooltip = {"text": "Zone: {zone}\nVulnérabilité: {vulnerability}\nBesoins (#): {need_count}"}
+    with perf.span("map.households.pydeck"):
+        deck = pdk.Deck(
+            layers=[deck_layer(kind, df, 25, cell_m)] + ([extra_layer] if extra_layer is not None else []),
+            initial_view_state=view_state,
+            tooltip=tooltip,
+        )
+        st.pydeck_chart(deck, use_container_width=True)
+
+def exposure_data(filters, radius_m):
+    with perf.span("spatial.exposure"):
+        return spatial.exposure_for(conn, filters, radius_m)
+
+def risk_circles_layer(filters, radius_m):
+    import pydeck as pdk
+    # Cercles d'exposition autour des points à risque (rayon réel, en mètres)
+    risk = spatial.indexes_for(conn, filters)["risk_points"][["lat", "lon", "zone"]]
+    return pdk.Layer(
         "ScatterplotLayer",
-        data=df,
+        data=risk,
         get_position='[lon, lat]',
-        get_fill_color="color",
-        get_radius=25,
-        pickable=True,
+        get_fill_color=[220, 38, 38, 40],
+        get_line_color=[220, 38, 38, 160],
+        stroked=True,
+        line_width_min_pixels=1,
+        get_radius=radius_m,
+        pickable=False,
     )
-    view_state = pdk.ViewState(latitude=float(df["lat"].mean()), longitude=float(df["lon"].mean()), zoom=11, pitch=0)
-    deck = pdk.Deck(
-        layers=[layer],
-        initial_view_state=view_state,
-        tooltip={"text": "Zone: {zone}\nVulnérabilité: {vulnerability}\nBesoins (#): {need_count}"},
-    )
-    st.pydeck_chart(deck, use_container_width=True)
 
-def insights(h, w):
+def exposure_map(filters, e, radius_m):
+    import pydeck as pdk
+    with perf.span("map.exposure.prepare"):
+        kind, df = spatial.exposed_layer_frame(e)
+        layers = [risk_circles_layer(filters, radius_m)]
+        if len(df):
+            if kind == "grid":
+                layers.append(pdk.Layer("GridCellLayer", data=df, get_position='[lon, lat]', get_fill_color=[234, 88, 12, 180],
+                                         cell_size=mapping.DEFAULT_CELL_M, extruded=False, pickable=True))
+                tooltip = {"text": "Ménages exposés: {count}"}
+            else:
+                layers.append(pdk.Layer("ScatterplotLayer", data=df, get_position='[lon, lat]', get_fill_color=[234, 88, 12, 200],
+                                        get_radius=20, pickable=True))
+                tooltip = {"text": "Zone: {zone}\nPoints à risque dans le rayon: {risk_points}\nPoint d'eau le plus proche: {nearest_m} m"}
+        else:
+            tooltip = None
+    with perf.span("map.exposure.pydeck"):
+        view_state = pdk.ViewState(latitude=float(e["lat"].mean()), longitude=float(e["lon"].mean()), zoom=11, pitch=0)
+        st.pydeck_chart(pdk.Deck(layers=layers, initial_view_state=view_state, tooltip=tooltip), use_container_width=True)
+
+def exposure_radius():
+    return st.session_state.get("exposure_radius", spatial.DEFAULT_RADIUS_M)
+
+# ------------------ Actualisation automatique ------------------
+REFRESH_INTERVALS = {"Désactivée": None, "30 s": 30, "1 min": 60, "5 min": 300}
+WATCHED_TABLES = ("households", "water_samples", "targets")
+
+def watch_changes():
+    # Relancé seul toutes les N secondes: ne lit que les jetons de version
+    # (quelques lectures d'index); un rerun complet n'a lieu que si des
+    # données ont changé, et il ne relit alors que les lignes nouvelles.
+    tokens = tuple(db.data_version(conn, t) for t in WATCHED_TABLES)
+    if st.session_state.get("data_tokens", tokens) != tokens:
+        st.session_state["data_tokens"] = tokens
+        st.rerun()
+    st.session_state["data_tokens"] = tokens
+    st.caption(f"Dernière vérification: {datetime.now():%H:%M:%S}")
+
+def insights(w, k, tz):
     recs = []
-    if len(h):
-        k = compute_kpis(h, db.get_target(conn))
+    if k["surveyed"]:
         if k["pct_water"] < 50:
             recs.append(("CRITIQUE", "Accès à l’eau améliorée < 50% : prioriser interventions WASH sur zones à score élevé."))
         elif k["pct_water"] < 70:
@@ -289,7 +392,7 @@ def insights(h, w):
         if k["pct_3needs"] > 35:
             recs.append(("ATTENTION", "Beaucoup de ménages expriment ≥3 besoins : planifier un paquet d’investissements multi-secteurs par zone."))
 
-        tz = top_zones(h).head(5)
+        tz = tz.head(5)
         if len(tz):
             recs.append(("OK", f"Top zones prioritaires (score composite): {', '.join(tz['zone'].tolist())}."))
 
@@ -306,73 +409,53 @@ def insights(h, w):
     for lvl, txt in recs[:6]:
         st.markdown(f'<div class="rec"><div class="rec-title">{tag(lvl)} {txt}</div><div class="small-muted">Recommandation automatique (règles simples) – à valider par les parties prenantes.</div></div>', unsafe_allow_html=True)
 
-def report_pdf_bytes(meta, kpis, tz_df):
-    # PDF minimal (sans images) pour rester léger sur Streamlit Cloud
-    from io import BytesIO
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-
-    buff = BytesIO()
-    c = canvas.Canvas(buff, pagesize=A4)
-    width, height = A4
-
-    y = height - 50
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(40, y, "Ganvié Durable 2030 – Note de synthèse (extrait)")
-    y -= 18
-    c.setFont("Helvetica", 10)
-    c.drawString(40, y, f"Période: {meta['start']} → {meta['end']} | Zones: {', '.join(meta['zones']) if meta['zones'] else '—'}")
-    y -= 26
-
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, "Indicateurs clés")
-    y -= 16
-    c.setFont("Helvetica", 10)
-    lines = [
-        f"• Accès à une source d’eau améliorée: {kpis['pct_water']:.1f}%",
-        f"• Ménages avec dispositif d’assainissement: {kpis['pct_san']:.1f}%",
-        f"• Scolarisation (proxy): {kpis['pct_school']:.1f}%",
-        f"• Ménages déclarant ≥3 besoins: {kpis['pct_3needs']:.1f}%",
-        f"• Ménages enquêtés (filtres): {kpis['surveyed']} / cible: {kpis['target']}",
-    ]
-    for ln in lines:
-        c.drawString(50, y, ln); y -= 14
-
-    y -= 8
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(40, y, "Top zones prioritaires (score composite)")
-    y -= 16
-    c.setFont("Helvetica", 9)
-
-    if tz_df is None or tz_df.empty:
-        c.drawString(50, y, "—"); y -= 14
-    else:
-        for _, r in tz_df.head(10).iterrows():
-            c.drawString(50, y, f"- {r['zone']} | vuln. élevée: {r['vuln_elevee_pct']:.0f}% | sans assain.: {r['sans_san_pct']:.0f}% | besoins moy.: {r['besoins_moy']:.2f}")
-            y -= 12
-            if y < 80:
-                c.showPage()
-                y = height - 60
-
-    c.setFont("Helvetica-Oblique", 8)
-    c.drawString(40, 40, "Document généré automatiquement depuis le dashboard (démo). À compléter avec cartes/graphes sur version finale.")
-    c.save()
-    buff.seek(0)
-    return buff.getvalue()
-
-# ------------------ UI ------------------
-
-# ------------------ UI ------------------
-banner()
-
-h, w, meta = filtered_data()
-target_total = db.get_target(conn)
-k = compute_kpis(h, target_total)
+@st.fragment(run_every=1.0)
+def report_progress(key):
+    # Interrogé seulement pendant le rendu; une seule relance à la fin
+    status = reports.JOBS.status(key)
+    if status["state"] != "running":
+        st.rerun()
+    st.progress(status["progress"], text=f"Rendu de la note en cours… {status['label']}")
+
+def report_job_panel(filters, meta):
+    key = st.session_state.get("report_key")
+    if key is None:
+        return
+    status = reports.JOBS.status(key)
+    if status["state"] == "unknown":
+        # note demandée mais purgée du cache entre-temps: nouveau rendu
+        key = st.session_state["report_key"] = reports.JOBS.submit(conn, filters, meta)
+        status = reports.JOBS.status(key)
+    if status["state"] == "running":
+        report_progress(key)
+    elif status["state"] == "error":
+        st.error(f"Échec du rendu du PDF : {status['error']}")
+    elif status["state"] == "done":
+        try:
+            with open(status["path"], "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            st.session_state.pop("report_key", None)
+            st.info("La note vient d’être purgée du cache : cliquez à nouveau sur « Générer le PDF ».")
+            return
+        st.download_button(
+            label="Télécharger la note PDF",
+            data=data,
+            file_name="ganvie_durable_note_synthese.pdf",
+            mime="application/pdf"
+        )
 
-tabs = st.tabs(["🏠 Vue d'ensemble", "👥 Diagnostic ménages", "💧 Eau & Environnement", "🗺️ Cartes & Zones", "💡 Insights & Priorités", "📄 Rapport"])
+# ------------------ Sections ------------------
+# Seule la section choisie est calculée et affichée. Chaque section est un
+# fragment: un widget de la section ne relance que cette section.
 
 # 1) Accueil
-with tabs[0]:
+@st.fragment
+@perf.timed("section.accueil")
+def section_overview(filters, meta):
+    import plotly.express as px
+    r = rollup_data(filters)
+    k = kpis_data(filters)
     c1, c2, c3, c4, c5 = st.columns(5)
     kpi(c1, "Accès eau améliorée", f"{k['pct_water']:.1f}%", "Moyenne sur ménages filtrés", "💧")
     kpi(c2, "Assainissement", f"{k['pct_san']:.1f}%", "Moyenne sur ménages filtrés", "🚽")
@@ -381,74 +464,97 @@ with tabs[0]:
     kpi(c5, "Ménages enquêtés", f"{k['surveyed']}/{k['target']}", "Cible paramétrable", "📋")
 
     st.markdown("### 📈 Évolution de la collecte (ménages)")
-    if len(h):
-        hh_daily = h.set_index("collected_at").resample("D")["household_id"].count().reset_index()
+    if k["surveyed"]:
+        daily = r.groupby("day")["households"].sum()
+        daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq="D"), fill_value=0)
+        hh_daily = daily.rename_axis("collected_at").reset_index(name="household_id")
         hh_daily["cumul"] = hh_daily["household_id"].cumsum()
-        fig = px.line(hh_daily, x="collected_at", y="cumul", markers=True, labels={"collected_at":"Date", "cumul":"Ménages (cumul)"})
-        st.plotly_chart(fig, use_container_width=True)
+        with perf.span("plotly.collecte"):
+            fig = px.line(hh_daily, x="collected_at", y="cumul", markers=True, labels={"collected_at":"Date", "cumul":"Ménages (cumul)"})
+            st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Aucune donnée ménage sur la période / filtres.")
 
     st.markdown("### 🎯 Répartition des besoins (ménages)")
-    if len(h):
-        need_sum = {k: int(h[v].fillna(0).sum()) for k, v in NEED_COLS.items()}
+    if k["surveyed"]:
+        totals = analysis.need_totals(r)
+        need_sum = {k: totals[v] for k, v in NEED_COLS.items()}
         df_need = pd.DataFrame({"Besoin": list(need_sum.keys()), "Nombre": list(need_sum.values())}).sort_values("Nombre", ascending=False)
-        fig2 = px.bar(df_need, x="Besoin", y="Nombre", labels={"Nombre":"Nombre de ménages"})
-        st.plotly_chart(fig2, use_container_width=True)
+        with perf.span("plotly.besoins"):
+            fig2 = px.bar(df_need, x="Besoin", y="Nombre", labels={"Nombre":"Nombre de ménages"})
+            st.plotly_chart(fig2, use_container_width=True)
     else:
         st.info("Aucune donnée ménage pour calculer la répartition des besoins.")
 
-
-
 # 2) Diagnostic ménages
-with tabs[1]:
+@st.fragment
+@perf.timed("section.menages")
+def section_households(filters, meta):
+    import plotly.express as px
+    tz_all = zones_data(filters)
     st.markdown("### Comparaisons par zone")
-    if len(h):
-        tmp = h.copy()
-        tmp["need_count"] = needs_count(tmp)
-        g = tmp.groupby("zone").agg(
-            pct_eau=("water_improved", "mean"),
-            pct_san=("sanitation", "mean"),
-            vuln_elevee=("vulnerability", lambda s: (s=="Élevé").mean()),
-            besoins_moy=("need_count", "mean"),
-            menages=("household_id","count")
-        ).reset_index()
-        g["pct_eau"] *= 100; g["pct_san"] *= 100; g["vuln_elevee"] *= 100
-        fig = px.bar(g.sort_values("pct_eau"), x="zone", y="pct_eau", labels={"pct_eau":"% accès eau améliorée", "zone":"Zone"})
-        st.plotly_chart(fig, use_container_width=True)
+    if len(tz_all):
+        h = households_data(filters)
+        g = tz_all
+        with perf.span("plotly.zones_eau"):
+            fig = px.bar(g.sort_values("pct_eau"), x="zone", y="pct_eau", labels={"pct_eau":"% accès eau améliorée", "zone":"Zone"})
+            st.plotly_chart(fig, use_container_width=True)
 
         c1, c2 = st.columns(2)
         with c1:
-            figb = px.bar(g.sort_values("vuln_elevee"), x="zone", y="vuln_elevee", labels={"vuln_elevee":"% vulnérabilité élevée", "zone":"Zone"})
-            st.plotly_chart(figb, use_container_width=True)
+            with perf.span("plotly.zones_vulnerabilite"):
+                figb = px.bar(g.sort_values("vuln_elevee_pct"), x="zone", y="vuln_elevee_pct", labels={"vuln_elevee_pct":"% vulnérabilité élevée", "zone":"Zone"})
+                st.plotly_chart(figb, use_container_width=True)
         with c2:
-            figc = px.bar(g.sort_values("besoins_moy"), x="zone", y="besoins_moy", labels={"besoins_moy":"Besoins moyens (0–6)", "zone":"Zone"})
-            st.plotly_chart(figc, use_container_width=True)
+            with perf.span("plotly.zones_besoins"):
+                figc = px.bar(g.sort_values("besoins_moy"), x="zone", y="besoins_moy", labels={"besoins_moy":"Besoins moyens (0–6)", "zone":"Zone"})
+                st.plotly_chart(figc, use_container_width=True)
 
         st.markdown("### Lien activité ↔ besoins (scatter)")
-        figd = px.scatter(tmp, x="hh_size", y="need_count", color="main_activity", hover_data=["zone","vulnerability"], labels={"hh_size":"Taille ménage", "need_count":"Nombre de besoins"})
-        st.plotly_chart(figd, use_container_width=True)
+        with perf.span("plotly.activite_besoins"):
+            tmp = h.assign(need_count=analysis.needs_count(h))
+            figd = px.scatter(tmp, x="hh_size", y="need_count", color="main_activity", hover_data=["zone","vulnerability"], labels={"hh_size":"Taille ménage", "need_count":"Nombre de besoins"})
+            st.plotly_chart(figd, use_container_width=True)
+
+        st.markdown("### 🧩 Combinaisons de besoins par zone")
+        with perf.span("plotly.combinaisons"):
+            combos = combinations_data(filters)
+            top = combos.groupby("combinaison")["menages"].sum().nlargest(COMBINATIONS_SHOWN).index
+            grid = combos[combos["combinaison"].isin(top)].pivot(index="zone", columns="combinaison", values="pct_zone")
+            grid = grid.reindex(columns=top).fillna(0).round(1)
+            fige = px.imshow(grid, text_auto=True, aspect="auto", color_continuous_scale="Oranges",
+                             labels={"x": "Combinaison de besoins", "y": "Zone", "color": "% des ménages de la zone"})
+            st.plotly_chart(fige, use_container_width=True)
+        st.caption(f"Les {COMBINATIONS_SHOWN} combinaisons les plus fréquentes (sur {combos['needs_mask'].nunique()} observées parmi {db.NEED_COMBINATIONS}).")
 
         st.markdown("### Top zones prioritaires (liste)")
-        tz = top_zones(h).head(5)[["zone","menages","vuln_elevee_pct","sans_san_pct","besoins_moy","score"]]
+        tz = tz_all.head(5)[["zone","menages","vuln_elevee_pct","sans_san_pct","besoins_moy","score"]]
         st.dataframe(tz, use_container_width=True)
     else:
         st.info("Aucune donnée ménage sur la période / filtres.")
 
 # 3) Eau & Environnement
-with tabs[2]:
+@st.fragment
+@perf.timed("section.eau")
+def section_water(filters, meta):
+    import plotly.express as px
     st.markdown("### Carte des points de prélèvement (codes couleur conforme / à surveiller / à risque)")
-    water_map(w)
+    water_map(filters)
+    profile = risk_rules.get_profile()
+    st.caption(f"Niveaux de risque: profil « {profile['label']} » (risk_profiles.toml).")
 
     st.markdown("### Évolution saisonnière (exemples)")
+    w = water_data(filters)
     if len(w):
         c1, c2 = st.columns(2)
         with c1:
-            fig = px.box(w, x="season", y="turbidity", points="all", labels={"season":"Saison", "turbidity":"Turbidité"})
-            st.plotly_chart(fig, use_container_width=True)
+            with perf.span("plotly.turbidite"):
+                fig = px.box(w, x="season", y="turbidity", points="all", labels={"season":"Saison", "turbidity":"Turbidité"})
+                st.plotly_chart(fig, use_container_width=True)
         with c2:
-            fig2 = px.box(w, x="season", y="e_coli", points="all", labels={"season":"Saison", "e_coli":"E. coli (CFU/100ml)"})
-            st.plotly_chart(fig2, use_container_width=True)
+            with perf.span("plotly.e_coli"):
+                fig2 = px.box(w, x="season", y="e_coli", points="all", labels={"season":"Saison", "e_coli":"E. coli (CFU/100ml)"})
+                st.plotly_chart(fig2, use_container_width=True)
         
         with st.expander("ℹ️ Comment lire ces graphiques (Boîtes à moustaches) ?", expanded=True):
             st.markdown("""
@@ -460,67 +566,196 @@ with tabs[2]:
             
             *Cela permet de voir si la qualité de l'eau est stable ou très variable selon la saison.*
             """)
-
-        st.markdown("### Fiches automatiques (derniers prélèvements)")
-        latest = w.sort_values("collected_at").groupby(["zone"]).tail(1).sort_values("risk_level")
-        st.dataframe(latest[["zone","collected_at","season","ph","turbidity","conductivity","e_coli","risk_level"]], use_container_width=True)
     else:
         st.info("Aucune donnée d’eau sur la période / filtres.")
 
+    st.markdown("### Fiches automatiques (derniers prélèvements)")
+    latest = latest_water_data(filters)
+    if len(latest):
+        latest = latest.sort_values("risk_level", ascending=False)
+        st.dataframe(latest[["zone","collected_at","season","ph","turbidity","conductivity","e_coli","risk_level","anomalies"]], use_container_width=True)
+        st.caption("Dernier prélèvement connu de chaque zone, toutes périodes confondues; anomalies = mesures en alerte.")
+
+    st.markdown("### 🚨 Alertes qualité de l’eau")
+    a = alerts_data(filters)
+    if len(a):
+        st.dataframe(a[["collected_at","zone","season","measure","value","expected","z"]], use_container_width=True)
+        st.caption(f"Mesures à plus de {baselines.Z_THRESHOLD:g} écarts-types du référentiel zone × saison, calculé au fil des "
+                   f"prélèvements précédents (au moins {baselines.MIN_SAMPLES}); les {ALERTS_SHOWN} plus récentes.")
+    else:
+        st.success("Aucune alerte sur la période / filtres.")
+
+    st.markdown("### Exposition des ménages aux points à risque")
+    radius_m = exposure_radius()
+    e = exposure_data(filters, radius_m)
+    if len(e):
+        x = spatial.exposure_kpis(e)
+        c1, c2, c3 = st.columns(3)
+        kpi(c1, "Ménages exposés", f"{x['exposed']}/{x['households']}", f"À moins de {radius_m} m d'un point à risque", "☣️")
+        kpi(c2, "Part exposée", f"{x['pct_exposed']:.1f}%", "Ménages géolocalisés filtrés", "📍")
+        median = "—" if pd.isna(x["median_nearest_m"]) else f"{x['median_nearest_m']:.0f} m"
+        kpi(c3, "Point d'eau le plus proche", median, f"Distance médiane (jusqu'à {spatial.NEAREST_MAX_M} m)", "📏")
+        exposure_map(filters, e, radius_m)
+    else:
+        st.info("Aucun ménage géolocalisé sur la période / filtres.")
+
 # 4) Cartes & Zones
-with tabs[3]:
+@st.fragment
+@perf.timed("section.cartes")
+def section_maps(filters, meta):
     st.markdown("### Carte des ménages (couleur = intensité des besoins)")
-    households_map(h)
+    radius_m = exposure_radius()
+    circles = st.toggle(f"Cercles d'exposition ({radius_m} m) autour des points à risque", value=False, key="households_map_risk")
+    households_map(filters, risk_circles_layer(filters, radius_m) if circles else None)
 
     st.markdown("### Synthèse par zone")
-    if len(h):
-        tz = top_zones(h)[["zone","menages","vuln_elevee_pct","sans_san_pct","besoins_moy","score"]]
+    tz_all = zones_data(filters)
+    if len(tz_all):
+        tz = tz_all[["zone","menages","vuln_elevee_pct","sans_san_pct","besoins_moy","score"]]
+        ez = spatial.exposure_by_zone(exposure_data(filters, radius_m))[["zone", "exposes_pct", "distance_mediane_m"]]
+        tz = tz.merge(ez.rename(columns={"exposes_pct": f"exposes_{radius_m}m_pct"}), on="zone", how="left")
         st.dataframe(tz, use_container_width=True)
     else:
         st.info("Aucune donnée ménage sur la période / filtres.")
 
 # 5) Insights
-with tabs[4]:
+@st.fragment
+@perf.timed("section.insights")
+def section_insights(filters, meta):
+    import plotly.express as px
+    k = kpis_data(filters)
+    tz_all = zones_data(filters)
     st.markdown("### Tendances & recommandations automatiques (règles)")
-    insights(h, w)
+    insights(water_data(filters), k, tz_all)
 
-    st.markdown("### Scénario simple (démo) : améliorer l’accès à l’eau dans 1–3 zones")
-    if len(h):
-        tz = top_zones(h).head(6)
+    st.markdown("### Scénario d’intervention dans 1–3 zones (simulation Monte Carlo)")
+    if k["surveyed"]:
+        tz = tz_all.head(6)
         zones = tz["zone"].tolist()
         pick = st.multiselect("Zones ciblées (simulation)", zones, default=zones[:2])
-        delta = st.slider("Gain d’accès eau améliorée (points de %)", min_value=0, max_value=40, value=15, step=5)
-        cur = compute_kpis(h, target_total)["pct_water"]
-        sim = min(100.0, cur + (delta * (len(pick)/max(1,len(zones)))))
-        st.write(f"Accès eau actuel: **{cur:.1f}%** → simulé: **{sim:.1f}%** (approx.)")
-        st.caption("Simulation indicative (démo) : la version finale doit utiliser un modèle d’impact par zone/ménage.")
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            water = st.slider("Gain d’accès eau améliorée (points de %)", min_value=0, max_value=40, value=15, step=5)
+        with c2:
+            san = st.slider("Gain d’accès assainissement (points de %)", min_value=0, max_value=40, value=0, step=5)
+        with c3:
+            other = st.selectbox("Autre levier", ["housing", "education", "health", "economic"], format_func=simulation.LEVER_LABELS.get)
+            other_gain = st.slider("Ménages sortis de ce besoin (points de %)", min_value=0, max_value=40, value=0, step=5)
+        gains = {"water": water, "sanitation": san, other: other_gain}
+        scenario = {z: gains for z in pick}
+
+        res = simulation_data(filters, scenario).set_index("metric")
+        cols = st.columns(len(SIM_METRICS))
+        for col, (m, (label, icon)) in zip(cols, SIM_METRICS.items()):
+            r = res.loc[m]
+            kpi(col, label, f"{r['actuel']:.1f}% → {r['simule']:.1f}%", f"IC {simulation.CI:.0%} : {r['ic_bas']:.1f} – {r['ic_haut']:.1f}%", icon)
+
+        # Même scénario, gain eau de 0 à 40 points (mêmes aléas d'un point à l'autre)
+        sw = sweep_data(filters, [{z: dict(gains, water=g) for z in pick} for g in SWEEP_GAINS])
+        sw = sw[sw["metric"] == "pct_water"]
+        sw = sw.assign(gain=sw["scenario"].map(dict(enumerate(SWEEP_GAINS))))
+        with perf.span("plotly.simulation"):
+            fig = px.line(sw, x="gain", y="simule", markers=True,
+                          error_y=sw["ic_haut"] - sw["simule"], error_y_minus=sw["simule"] - sw["ic_bas"],
+                          labels={"gain": "Gain visé eau améliorée (points de %)", "simule": "Accès eau simulé (%)"})
+            st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Chaque tirage ({simulation.DRAWS}) convertit des ménages éligibles des zones ciblées, avec un taux de "
+                   "réalisation incertain (80 % en moyenne) par zone et par levier ; l’intervalle couvre "
+                   f"{simulation.CI:.0%} des tirages. Les indicateurs portent sur tous les ménages filtrés.")
     else:
         st.info("Aucune donnée ménage pour la simulation.")
 
 # 6) Rapport
-with tabs[5]:
+@st.fragment
+@perf.timed("section.rapport")
+def section_report(filters, meta):
     st.markdown("### Générer un rapport (PDF) – 1 clic")
-    st.caption("Dans l’annexe, le dashboard prévoit un export PDF/PPT. Ici: PDF minimal (KPIs + top zones).")
-    tz = top_zones(h)
+    st.caption("Dans l’annexe, le dashboard prévoit un export PDF/PPT. Ici: KPIs, top zones, graphes et carte. Rendu en tâche de fond, mis en cache pour les mêmes filtres.")
     if st.button("📄 Générer le PDF"):
-        pdf_bytes = report_pdf_bytes(meta, k, tz)
-        st.download_button(
-            label="Télécharger la note PDF",
-            data=pdf_bytes,
-            file_name="ganvie_durable_note_synthese.pdf",
-            mime="application/pdf"
-        )
+        st.session_state["report_key"] = reports.JOBS.submit(conn, filters, meta)
+    if st.session_state.get("report_key") != reports.report_key(conn, meta):
+        # filtres ou données modifiés depuis la dernière note
+        st.session_state.pop("report_key", None)
+    report_job_panel(filters, meta)
 
     st.markdown("### Exports données")
+    st.caption("Les exports sont produits à la demande, en flux depuis la base (filtres courants).")
+    fmt = st.radio("Format", exports.available_formats(), format_func=lambda f: exports.FORMATS[f]["label"], horizontal=True)
+    if not exports.parquet_available():
+        st.caption("Parquet indisponible (installez `pyarrow`).")
     c1, c2 = st.columns(2)
-    with c1:
-        st.download_button("⬇️ Export ménages (CSV)", data=h.to_csv(index=False).encode("utf-8"), file_name="households_filtered.csv", mime="text/csv")
-    with c2:
-        st.download_button("⬇️ Export eau (CSV)", data=w.to_csv(index=False).encode("utf-8"), file_name="water_samples_filtered.csv", mime="text/csv")
+    for col, table, label, name in [
+        (c1, "households", "ménages", "households_filtered"),
+        (c2, "water_samples", "eau", "water_samples_filtered"),
+    ]:
+        with col:
+            # Export préparé gardé dans .cache/exports (chemin seul en session),
+            # valable pour ces filtres, ce format et cette version des données
+            state_key = f"export_{table}"
+            res = st.session_state.get(state_key)
+            if res and res["key"] != exports.export_key(conn, table, filters, fmt):
+                st.session_state.pop(state_key)
+                res = None
+            if st.button(f"⚙️ Préparer l’export {label}", key=f"prepare_{table}"):
+                with st.spinner("Export en cours…"):
+                    res = st.session_state[state_key] = exports.export_to_cache(conn, table, filters, fmt)
+            if res:
+                info = exports.FORMATS[fmt]
+                try:
+                    with open(res["path"], "rb") as f:
+                        clicked = st.download_button(f"⬇️ Export {label} ({info['label']})", data=f, file_name=f"{name}.{info['ext']}", mime=info["mime"], key=f"download_{table}")
+                except FileNotFoundError:
+                    st.session_state.pop(state_key, None)
+                    continue
+                st.caption(f"{res['rows']} lignes • {exports.human_size(res['bytes'])} • {res['seconds']:.2f} s")
+                if clicked:
+                    # Téléchargé: plus rien en session, le fichier est laissé à la purge du cache
+                    st.session_state.pop(state_key, None)
+
+SECTIONS = {
+    "🏠 Vue d'ensemble": section_overview,
+    "👥 Diagnostic ménages": section_households,
+    "💧 Eau & Environnement": section_water,
+    "🗺️ Cartes & Zones": section_maps,
+    "💡 Insights & Priorités": section_insights,
+    "📄 Rapport": section_report,
+}
+
+# ------------------ UI ------------------
+banner()
+
+meta, filters = sidebar_filters()
+st.sidebar.select_slider("Rayon d'exposition (m)", spatial.RADII_M, value=spatial.DEFAULT_RADIUS_M, key="exposure_radius",
+                         help="Un ménage est exposé s'il se trouve à moins de ce rayon d'un prélèvement « A_risque » de la période (toutes zones).")
+section = st.segmented_control("Section", list(SECTIONS), default=next(iter(SECTIONS)), key="section", label_visibility="collapsed")
+SECTIONS[section or next(iter(SECTIONS))](filters, meta)
+
+refresh = st.sidebar.selectbox("Actualisation automatique", list(REFRESH_INTERVALS), key="auto_refresh",
+                               help="Vérifie périodiquement l'arrivée de nouveaux formulaires; seules les nouvelles lignes sont chargées.")
+if REFRESH_INTERVALS[refresh]:
+    with st.sidebar:
+        st.fragment(watch_changes, run_every=REFRESH_INTERVALS[refresh])()
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("Démo / initialisation")
 if st.sidebar.button("🌱 Générer des données fictives"):
     import seed_data
     seed_data.seed()
-    st.sidebar.success("Données fictives ajoutées. Rechargez la page.")
\ No newline at end of file
+    st.sidebar.success("Données fictives ajoutées. Rechargez la page.")
+
+# ------------------ Performance ------------------
+perf.startup("first_render", time.perf_counter() - STARTED)
+perf.end_rerun()
+with st.sidebar.expander("⏱️ Performance"):
+    started = perf.startup_times()
+    if "first_render" in started:
+        st.caption(f"Démarrage du processus: imports {started['import'] * 1000:.0f} ms, premier rendu {started['first_render'] * 1000:.0f} ms.")
+    timings = perf.RECORDER.summary()
+    if len(timings):
+        st.dataframe(
+            timings.rename(columns={"stage": "Étape", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)", "last_ms": "Dernier (ms)"}).round(1),
+            hide_index=True, use_container_width=True,
+        )
+    st.caption(f"{perf.WINDOW} dernières mesures par étape (tous utilisateurs). Historique: {', '.join(perf.SINKS) or 'désactivé'} (GANVIE_PERF_SINK).")
+    if st.button("Réinitialiser les mesures"):
+        perf.RECORDER.clear()
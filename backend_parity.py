@@ -0,0 +1,197 @@
+"""
+Vérification de parité entre les backends de stockage (SQLite / DuckDB).
+
+Charge les mêmes données générées (graine fixe) dans une base temporaire de
+chaque backend, puis compare les résultats des fonctions de l'interface
+database.BACKEND_API: lectures brutes et filtrées, lecture par blocs, agrégat
+zone × jour, KPIs, alertes qualité de l'eau, métadonnées de colonnes et écritures.
+L'année de départ est ensuite archivée (rollover_partition): les mêmes lectures
+doivent rendre exactement les mêmes résultats qu'avant archivage, dans chaque
+backend et d'un backend à l'autre. Code de sortie 1 en cas d'écart.
+
+    python backend_parity.py
+    python backend_parity.py --households 200000 --samples 5000 --backends sqlite duckdb
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import database as db
+import risk_rules
+import seed_data
+
+EXTENSIONS = {"sqlite": "db", "duckdb": "duckdb"}
+START = datetime(2025, 1, 1)
+DAYS = 120
+
+# ------------------ Comparaison ------------------
+
+def _normalize(df, sort_by=None):
+    """Types comparables entre backends (texte / horodatage / nombres, NULL = None)."""
+    df = df.copy()
+    for c in df.columns:
+        col = df[c]
+        if c == "collected_at" and not pd.api.types.is_datetime64_any_dtype(col):
+            df[c] = pd.to_datetime(col, format="ISO8601")
+        elif pd.api.types.is_datetime64_any_dtype(col):
+            df[c] = col.astype("datetime64[ns]")
+        elif pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col):
+            df[c] = col.astype("float64")
+        else:
+            df[c] = col.astype(object).where(col.notna(), None)
+    if sort_by:
+        df = df.sort_values(sort_by, kind="stable")
+    return df.reset_index(drop=True)
+
+def same(a, b, sort_by=None) -> str:
+    """Chaîne vide si identiques, sinon description de l'écart."""
+    if isinstance(a, pd.DataFrame):
+        if list(a.columns) != list(b.columns):
+            return f"colonnes {list(a.columns)} != {list(b.columns)}"
+        try:
+            pd.testing.assert_frame_equal(_normalize(a, sort_by), _normalize(b, sort_by), check_dtype=False, rtol=1e-9)
+        except AssertionError as e:
+            return str(e).splitlines()[0] + " " + " ".join(str(e).splitlines()[1:4])
+        return ""
+    if isinstance(a, dict):
+        for k in a.keys() | b.keys():
+            x, y = a.get(k), b.get(k)
+            numeric = isinstance(x, (int, float, np.number)) and isinstance(y, (int, float, np.number))
+            if not (np.isclose(x, y, rtol=1e-9) if numeric else x == y):
+                return f"{k}: {x!r} != {y!r}"
+        return ""
+    return "" if a == b else f"{a!r} != {b!r}"
+
+# ------------------ Cas ------------------
+
+def filter_sets(conn) -> dict:
+    zones = db.distinct_zones(conn)
+    dmin, dmax = db.date_bounds(conn)
+    return {
+        "sans filtre": {},
+        "sidebar complète": {"zones": zones, "start": dmin, "end": dmax, "vuln": ["Faible", "Moyen", "Élevé"], "needs": list(db.NEED_COLUMNS)},
+        "zones + période": {"zones": zones[:2], "start": dmin + timedelta(days=30), "end": dmin + timedelta(days=60)},
+        "vulnérabilité + besoins": {"vuln": ["Élevé"], "needs": ["needs_water", "needs_health"]},
+        "sélection vide": {"zones": []},
+    }
+
+def read_cases(conn, filters_by_name):
+    """(nom, valeur, clé de tri) pour chaque lecture comparée."""
+    cases = [
+        ("households_df", db.households_df(conn), ["household_id"]),
+        ("water_df", db.water_df(conn), ["sample_id"]),
+        ("get_target", db.get_target(conn), None),
+        ("distinct_zones", db.distinct_zones(conn), None),
+        ("date_bounds", db.date_bounds(conn), None),
+        ("table_columns", db.table_columns(conn, "households"), None),
+        ("column_types", db.column_types(conn, "water_samples"), None),
+        ("insertable_columns", db.insertable_columns(conn, "households"), None),
+        ("required_columns", db.required_columns(conn, "water_samples"), None),
+    ]
+    for name, f in filters_by_name.items():
+        r = db.query_rollup(conn, f)
+        cases += [
+            (f"query_households [{name}]", db.query_households(conn, f), ["household_id"]),
+            (f"query_households colonnes [{name}]", db.query_households(conn, f, columns=["zone", "collected_at"] + db.NEED_COLUMNS), ["zone", "collected_at"] + db.NEED_COLUMNS),
+            (f"query_water [{name}]", db.query_water(conn, f), ["sample_id"]),
+            (f"iter_households [{name}]", _concat(db.iter_households(conn, f, chunksize=7000)), ["household_id"]),
+            (f"iter_water [{name}]", _concat(db.iter_water(conn, f, chunksize=700)), ["sample_id"]),
+            (f"query_rollup [{name}]", r, db.ROLLUP_KEY),
+            (f"compute_kpis [{name}]", analysis.compute_kpis(r, 1000), None),
+            (f"zone_aggregate [{name}]", analysis.zone_aggregate(r), ["zone"]),
+            (f"need_combinations [{name}]", analysis.need_combinations(r), ["zone", "needs_mask"]),
+            (f"query_alerts [{name}]", db.query_alerts(conn, f), ["sample_id", "measure"]),
+            (f"latest_water [{name}]", db.latest_water(conn, f), ["zone"]),
+        ]
+    return cases
+
+def _concat(chunks):
+    chunks = list(chunks)
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+def write_cases(conn):
+    """Mêmes écritures sur chaque backend, puis relectures comparées."""
+    v0 = db.data_version(conn, "water_samples")[0]
+    rewrites0, last_id = db.delta_version(conn, "households")
+    sample0 = db.delta_version(conn, "water_samples")[1]
+    db.insert_household(conn, dict(collected_at="2025-03-01T10:30:00", zone="Vekky", vulnerability="Élevé", needs_water=1, needs_health=1, water_improved=0))
+    db.insert_water_sample(conn, dict(collected_at="2025-03-01T11:00:00", zone="Vekky", ph=5.2, turbidity=3.0, e_coli=0, risk_level="Conforme"))
+    db.insert_water_samples_many(conn, [dict(collected_at="2025-03-02T08:00:00", zone="Sô-Zounko", ph="7.1", turbidity="4", e_coli=None)])
+    db.upsert_target(conn, 4321)
+    other = next(n for n in risk_rules.load_profiles()["profiles"] if n != risk_rules.load_profiles()["active"])
+    return [
+        ("version après écriture", db.data_version(conn, "water_samples")[0] - v0, None),
+        ("get_target après upsert", db.get_target(conn), None),
+        ("réécritures après ajouts", db.delta_version(conn, "households")[0] - rewrites0, None),
+        ("query_households delta (ids)", db.query_households(conn, {"ids": (last_id, None)}), ["household_id"]),
+        ("query_households après insertion", db.query_households(conn, {"zones": ["Vekky"], "start": datetime(2025, 3, 1).date(), "end": datetime(2025, 3, 1).date()}), ["household_id"]),
+        ("query_water après insertion", db.query_water(conn, {"start": datetime(2025, 3, 1).date(), "end": datetime(2025, 3, 2).date()}), ["sample_id"]),
+        ("query_rollup après insertion", db.query_rollup(conn, {"zones": ["Vekky"]}), db.ROLLUP_KEY),
+        ("latest_water après insertion", db.latest_water(conn, {"zones": ["Vekky", "Sô-Zounko"]}), ["zone"]),
+        ("query_alerts après insertion", db.query_alerts(conn, {"ids": (sample0, None)}), ["sample_id", "measure"]),
+        ("rebuild_baselines", db.rebuild_baselines(conn), None),
+        (f"reclassify_water (aperçu {other})", db.reclassify_water(conn, risk_rules.get_profile(other), dry_run=True), ["before", "after"]),
+    ]
+
+def archive_cases(conn, filters_by_name, year: int):
+    """Lectures avant et après archivage de `year` (mêmes cas que read_cases)."""
+    hot = read_cases(conn, filters_by_name)
+    moved = db.rollover_partition(conn, year)
+    archived = read_cases(conn, filters_by_name)
+    archived.append(("rollover_partition", {t: moved[t] for t in db.PARTITIONED}, None))
+    return hot, [(f"{name} (archives {year})", value, key) for name, value, key in archived]
+
+def _compare(ref, other, label: str) -> int:
+    failures = 0
+    for (name, a, sort_by), (_, b, _) in zip(ref, other):
+        diff = same(a, b, sort_by)
+        failures += bool(diff)
+        print(f"{'❌' if diff else '✅'} {name:<48} {label}" + (f": {diff}" if diff else ""))
+    return failures
+
+# ------------------ Exécution ------------------
+
+def run(backends, households: int, samples: int, seed: int) -> int:
+    results, hot = {}, {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for backend in backends:
+            path = os.path.join(tmpdir, f"parity.{EXTENSIONS[backend]}")
+            conn = db.get_connection(path)
+            seed_data.seed_fast(households, samples, DAYS, seed=seed, start=START, conn=conn)
+            filters_by_name = filter_sets(conn)
+            results[backend] = read_cases(conn, filters_by_name) + write_cases(conn)
+            hot[backend], archived = archive_cases(conn, filters_by_name, START.year)
+            results[backend] += archived
+            conn.close()
+
+    ref_name, ref = backends[0], results[backends[0]]
+    failures, checks = 0, 0
+    for other in backends[1:]:
+        failures += _compare(ref, results[other], f"{ref_name} / {other}")
+        checks += len(ref)
+    # Chaque backend: mêmes résultats sur données chaudes et archivées
+    for backend in backends:
+        failures += _compare(hot[backend], results[backend][-len(hot[backend]) - 1:-1], f"{backend} chaud / archivé")
+        checks += len(hot[backend])
+    print(f"{checks - failures} vérifications OK, {failures} écart(s)")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parité des résultats entre backends de stockage")
+    parser.add_argument("--backends", nargs="+", choices=sorted(EXTENSIONS), default=["sqlite", "duckdb"])
+    parser.add_argument("--households", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=2030)
+    args = parser.parse_args(argv)
+    if len(args.backends) < 2:
+        parser.error("au moins deux backends à comparer")
+    sys.exit(1 if run(args.backends, args.households, args.samples, args.seed) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Référentiels glissants de qualité de l'eau par zone × saison, et alertes.
+
+Pour chaque zone × saison × mesure, l'état tient le nombre de prélèvements,
+la moyenne et la somme des carrés des écarts (Welford). Chaque nouveau
+prélèvement est comparé à l'état *avant* lui (z-score), puis l'état est mis à
+jour: coût constant par prélèvement, sans relire l'historique. Un lot est
+traité en une passe vectorisée, équivalente à l'ajout des prélèvements un par
+un dans l'ordre des sample_id.
+
+Les mesures asymétriques (turbidité, conductivité, bactéries) sont suivies
+en log1p. Le stockage (tables water_baselines / water_alerts / water_latest)
+est fait par le backend, dans la transaction d'insertion.
+"""
+import numpy as np
+import pandas as pd
+
+import risk_rules
+
+MEASURES = risk_rules.MEASURES
+LOG_MEASURES = {"turbidity", "conductivity", "e_coli", "coliforms"}
+TWO_SIDED = {"ph", "conductivity"}   # autres mesures: seule une hausse alerte
+MIN_SAMPLES = 8                      # référentiel trop jeune en dessous: pas d'alerte
+Z_THRESHOLD = 3.0
+STD_FLOOR = 0.1                      # évite les z infinis sur un historique constant
+
+STATE_COLUMNS = ["zone", "season", "measure", "n", "mean", "m2"]
+ALERT_COLUMNS = ["sample_id", "zone", "season", "collected_ts", "measure", "value", "expected", "z"]
+LATEST_COLUMNS = ["zone", "sample_id", "collected_ts", "anomalies"]
+SAMPLE_COLUMNS = ["sample_id", "zone", "season", "collected_ts"] + MEASURES
+
+def _transform(measure: str, values):
+    return np.log1p(np.clip(values, 0, None)) if measure in LOG_MEASURES else values
+
+def _inverse(measure: str, values):
+    return np.expm1(values) if measure in LOG_MEASURES else values
+
+def score(state, samples):
+    """Compare `samples` (SAMPLE_COLUMNS, ordre d'arrivée) aux référentiels `state` (STATE_COLUMNS).
+
+    Retourne (état des groupes touchés, alertes, dernier prélèvement par zone
+    du lot avec son nombre d'alertes).
+    """
+    samples = samples.sort_values("sample_id", kind="stable")
+    sample_id = samples["sample_id"].to_numpy(dtype="int64")
+    ts = pd.to_numeric(samples["collected_ts"], errors="coerce").to_numpy(dtype="float64")
+    zone_codes, zones = pd.factorize(samples["zone"].astype(object), sort=False)
+    season_codes, seasons = pd.factorize(samples["season"].astype(object).where(samples["season"].notna(), ""), sort=False)
+    values = np.column_stack([pd.to_numeric(samples[m], errors="coerce").to_numpy(dtype="float64") for m in MEASURES])
+    x = np.column_stack([_transform(m, values[:, j]) for j, m in enumerate(MEASURES)])
+
+    # Format long (prélèvement, mesure), trié par groupe zone × saison × mesure puis ordre d'arrivée
+    keep = np.isfinite(values).ravel()
+    row = np.repeat(np.arange(len(samples)), len(MEASURES))[keep]
+    measure = np.tile(np.arange(len(MEASURES)), len(samples))[keep]
+    key = (zone_codes[row] * len(seasons) + season_codes[row]) * len(MEASURES) + measure
+    order = np.lexsort((row, key))
+    row, measure, key = row[order], measure[order], key[order]
+    value, x = values[row, measure], x[row, measure]
+    first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    group = np.cumsum(np.r_[True, key[1:] != key[:-1]]) - 1
+
+    # État d'avant le lot de chaque groupe
+    known = {k: v for k, *v in zip(zip(state["zone"], state["season"], state["measure"]),
+                                   state["n"], state["mean"], state["m2"])}
+    names = [(zones[zone_codes[row[i]]], seasons[season_codes[row[i]]], MEASURES[measure[i]]) for i in first]
+    before = np.array([known.get(k, (0, 0.0, 0.0)) for k in names], dtype="float64").reshape(-1, 3)
+    n0, mean0, m20 = before[group, 0], before[group, 1], before[group, 2]
+
+    # Préfixes exclusifs par groupe, centrés sur la moyenne de l'état (stabilité numérique)
+    d = x - mean0
+    c = (np.arange(len(d)) - first[group]).astype("float64")
+    s = _exclusive_cumsum(d, first, group)
+    q = _exclusive_cumsum(d * d, first, group)
+    n, mean, m2 = _merge(n0, mean0, m20, c, s, q)
+
+    # Score de chaque mesure contre le référentiel d'avant
+    std = np.sqrt(np.where(n > 1, m2 / np.maximum(n - 1, 1), 0.0))
+    z = (x - mean) / np.maximum(std, STD_FLOOR)
+    two_sided = np.isin(measure, [MEASURES.index(m) for m in TWO_SIDED])
+    flagged = (n >= MIN_SAMPLES) & np.where(two_sided, np.abs(z) >= Z_THRESHOLD, z >= Z_THRESHOLD)
+    hit = np.flatnonzero(flagged)
+    hit = hit[np.lexsort((measure[hit], sample_id[row[hit]]))]
+    alerts = pd.DataFrame({
+        "sample_id": sample_id[row[hit]],
+        "zone": zones[zone_codes[row[hit]]].astype(object),
+        "season": seasons[season_codes[row[hit]]].astype(object),
+        "collected_ts": ts[row[hit]],
+        "measure": np.array(MEASURES, dtype=object)[measure[hit]],
+        "value": value[hit],
+        "expected": [_inverse(MEASURES[j], v) for j, v in zip(measure[hit], mean[hit])],
+        "z": z[hit],
+    }, columns=ALERT_COLUMNS)
+
+    # État final de chaque groupe: préfixe complet
+    last = np.r_[first[1:], len(d)] - 1
+    n_f, mean_f, m2_f = _merge(n0[last], mean0[last], m20[last], c[last] + 1, s[last] + d[last], q[last] + d[last] ** 2)
+    new_state = pd.DataFrame(names, columns=["zone", "season", "measure"]).assign(
+        n=n_f.astype("int64"), mean=mean_f, m2=m2_f)
+
+    # Dernier prélèvement par zone du lot (le plus récent, puis le plus grand id)
+    dated = np.flatnonzero(np.isfinite(ts))
+    dated = dated[np.lexsort((sample_id[dated], ts[dated], zone_codes[dated]))]
+    tail = dated[np.r_[zone_codes[dated][1:] != zone_codes[dated][:-1], True]] if len(dated) else dated
+    anomalies = np.bincount(row[hit], minlength=len(samples))
+    latest = pd.DataFrame({
+        "zone": zones[zone_codes[tail]].astype(object),
+        "sample_id": sample_id[tail],
+        "collected_ts": ts[tail].astype("int64"),
+        "anomalies": anomalies[tail].astype("int64"),
+    }, columns=LATEST_COLUMNS)
+    return new_state[STATE_COLUMNS], alerts, latest
+
+def _exclusive_cumsum(v, first, group):
+    """Somme des valeurs précédentes du même groupe (groupes contigus débutant en `first`)."""
+    total = np.cumsum(v) - v
+    return total - total[first][group]
+
+def _merge(n0, mean0, m20, c, s, q):
+    """Fusion (Chan) d'un état (n0, mean0, m20) et de c valeurs d'écarts à mean0 de somme s, somme des carrés q."""
+    n = n0 + c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = mean0 + np.where(n > 0, s / n, 0.0)
+        m2 = m20 + np.where(c > 0, q - s * s / c + s * s * n0 / (c * n), 0.0)
+    return n, mean, np.maximum(m2, 0.0)
+
+def empty_state():
+    return pd.DataFrame({"zone": pd.Series(dtype=object), "season": pd.Series(dtype=object),
+                         "measure": pd.Series(dtype=object), "n": pd.Series(dtype="int64"),
+                         "mean": pd.Series(dtype="float64"), "m2": pd.Series(dtype="float64")})
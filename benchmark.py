@@ -0,0 +1,230 @@
+"""
+Banc de mesure du pipeline de données du dashboard (sans navigateur).
+
+Génère (une fois) des bases synthétiques à plusieurs échelles, chronomètre
+chaque étape séparément et écrit les résultats en JSON. Le mode comparaison
+signale les étapes nettement plus lentes qu'une base de référence.
+
+    python benchmark.py --scales 10000 100000 1000000 --out bench_results.json
+    python benchmark.py --scales 10000 100000 --compare bench_baseline.json
+    python benchmark.py --scales 100000 --backend duckdb --out bench_duckdb.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import analysis
+import database as db
+import exports
+import mapping
+import reports
+import seed_data
+import simulation
+import spatial
+
+BENCH_DIR = os.path.join(".cache", "bench")
+DEFAULT_SCALES = [10000, 100000, 1000000]
+SAMPLES_PER_HOUSEHOLD = 0.02
+DAYS = 365
+SEED = 2030
+
+# ------------------ Bases synthétiques ------------------
+
+def bench_db(n_households: int, rebuild: bool = False, backend: str = "sqlite") -> str:
+    """Chemin d'une base synthétique de `n_households` ménages (générée si absente)."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    path = os.path.join(BENCH_DIR, f"ganvie_{n_households}.{'duckdb' if backend == 'duckdb' else 'db'}")
+    if os.path.exists(path) and not rebuild:
+        return path
+    for suffix in ("", "-wal", "-shm", ".wal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = db.get_connection(path)
+    t0 = time.perf_counter()
+    n_samples = max(10, int(n_households * SAMPLES_PER_HOUSEHOLD))
+    seed_data.seed_fast(n_households, n_samples, DAYS, seed=SEED, start=datetime(2025, 1, 1), conn=conn)
+    conn.close()
+    print(f"  base {n_households}: générée en {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return path
+
+# ------------------ Étapes ------------------
+
+def bench_filters(conn) -> dict:
+    # Filtres typiques: toutes les zones sauf une, ~6 mois, deux niveaux, trois besoins
+    zones = db.distinct_zones(conn)
+    dmin, dmax = db.date_bounds(conn)
+    return {
+        "zones": zones[:-1],
+        "start": dmax - timedelta(days=180),
+        "end": dmax,
+        "vuln": ["Moyen", "Élevé"],
+        "needs": ["needs_water", "needs_sanitation", "needs_health"],
+    }
+
+def _pandas_filter(h, filters):
+    # Filtrage en pandas, comme l'ancien filtered_data() (besoins: ET bit à bit sur needs_mask)
+    h = h[h["zone"].isin(filters["zones"])]
+    h = h[(h["collected_at"].dt.date >= filters["start"]) & (h["collected_at"].dt.date <= filters["end"])]
+    h = h[h["vulnerability"].isin(filters["vuln"])]
+    return h[analysis.has_any_need(h, filters["needs"])]
+
+def stages(conn, filters, tmpdir):
+    """Liste ordonnée (nom, fonction sans argument). Les étapes partagent un état."""
+    state = {}
+
+    def load_households():
+        state["h_raw"] = db.households_df(conn)
+
+    def load_water():
+        state["w_raw"] = db.water_df(conn)
+
+    def parse_datetimes():
+        h = state["h_raw"].copy()
+        h["collected_at"] = pd.to_datetime(h["collected_at"], format="ISO8601")
+        state["h_parsed"] = h
+
+    def filter_pandas():
+        _pandas_filter(state["h_parsed"], filters)
+
+    def query_filtered():
+        state["h"] = db.query_households(conn, filters, columns=db.table_columns(conn, "households") + ["needs_mask"])
+
+    def query_rollup():
+        state["r"] = db.query_rollup(conn, filters)
+
+    def compute_kpis():
+        state["k"] = analysis.compute_kpis(state["r"], 1000)
+
+    def top_zones():
+        state["tz"] = analysis.zone_aggregate(state["r"])
+
+    def needs_count():
+        analysis.needs_count(state["h"])
+
+    def map_prep():
+        h = state["h"].dropna(subset=["lat", "lon"])
+        if len(h) > mapping.POINT_THRESHOLD:
+            state["cells"] = mapping.bin_households(h, mapping.DEFAULT_CELL_M)
+        else:
+            state["cells"] = mapping.household_points(h)
+
+    def exposure():
+        spatial.exposure(state["h"], spatial.build_indexes(state["w_raw"]), spatial.DEFAULT_RADIUS_M)
+
+    def simulation_mc():
+        # Scénario de l'onglet Insights: trois leviers dans deux zones
+        scenario = {z: {"water": 15, "sanitation": 10, "health": 10} for z in filters["zones"][:2]}
+        simulation.simulate(simulation.household_arrays(state["h"]), scenario)
+
+    def csv_export():
+        exports.export_to_path(conn, "households", filters, "csv", os.path.join(tmpdir, "export.csv"))
+
+    def report_pdf():
+        meta = {"zones": filters["zones"], "start": filters["start"], "end": filters["end"]}
+        reports.report_pdf_bytes(meta, state["k"], state["tz"], state["cells"], None)
+
+    return [
+        ("load_households", load_households),
+        ("load_water", load_water),
+        ("parse_datetimes", parse_datetimes),
+        ("filter_pandas", filter_pandas),
+        ("query_filtered", query_filtered),
+        ("query_rollup", query_rollup),
+        ("compute_kpis", compute_kpis),
+        ("top_zones", top_zones),
+        ("needs_count", needs_count),
+        ("map_prep", map_prep),
+        ("exposure", exposure),
+        ("simulation", simulation_mc),
+        ("csv_export", csv_export),
+        ("report_pdf", report_pdf),
+    ]
+
+def run_scale(n_households: int, repeat: int, rebuild: bool = False, backend: str = "sqlite") -> dict:
+    path = bench_db(n_households, rebuild, backend)
+    conn = db.get_connection(path)
+    filters = bench_filters(conn)
+    out = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, fn in stages(conn, filters, tmpdir):
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - t0)
+            out[name] = dict(median_s=statistics.median(times), min_s=min(times), runs=repeat)
+            print(f"  {n_households:>8} {name:<16} {out[name]['median_s'] * 1000:10.1f} ms", file=sys.stderr)
+    conn.close()
+    return out
+
+# ------------------ Comparaison ------------------
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_s: float) -> list:
+    """Étapes dont la médiane dépasse baseline × threshold (et d'au moins min_delta_s)."""
+    regressions = []
+    for scale, stages_ in current["results"].items():
+        for name, res in stages_.items():
+            ref = baseline.get("results", {}).get(scale, {}).get(name)
+            if ref is None:
+                continue
+            cur, old = res["median_s"], ref["median_s"]
+            if cur > old * threshold and cur - old > min_delta_s:
+                regressions.append(dict(scale=scale, stage=name, baseline_s=old, current_s=cur, ratio=cur / old if old else float("inf")))
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc de mesure du pipeline du dashboard")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--rebuild", action="store_true", help="Régénère les bases synthétiques")
+    parser.add_argument("--backend", choices=["sqlite", "duckdb"], default="sqlite", help="Backend de stockage mesuré")
+    parser.add_argument("--compare", help="JSON de référence (résultats d'un run précédent)")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Ratio au-delà duquel une étape est en régression")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Écart absolu minimal pour signaler une régression")
+    args = parser.parse_args(argv)
+
+    results = dict(
+        meta=dict(
+            created_at=datetime.now().isoformat(timespec="seconds"),
+            commit=_git_commit(),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            pandas=pd.__version__,
+            sqlite=db.sqlite3.sqlite_version,
+            repeat=args.repeat,
+            backend=args.backend,
+        ),
+        results={str(n): run_scale(n, args.repeat, args.rebuild, args.backend) for n in args.scales},
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Résultats écrits dans {args.out}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms / 1000)
+        for r in regressions:
+            print(f"❌ Régression {r['scale']} / {r['stage']}: {r['baseline_s'] * 1000:.1f} ms → {r['current_s'] * 1000:.1f} ms (×{r['ratio']:.2f})")
+        if regressions:
+            sys.exit(1)
+        print("✅ Aucune régression par rapport à la référence")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Cache mémoire des chargements du dashboard, invalidé par version de données.
+
+Chaque entrée est indexée par (base, fonction, arguments) et mémorise les jetons
+`db.data_version` des tables dont elle dépend. Une insertion dans une table
+n'invalide donc que les entrées qui la lisent. Le cache est partagé par toutes
+les sessions du processus Streamlit et borné (nombre d'entrées + mémoire
+estimée), avec éviction LRU.
+
+Les frames de lignes (memoize_append) gardent en plus l'id max lu: après de
+simples ajouts, seules les lignes nouvelles sont lues et ajoutées au frame.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import wraps
+
+import pandas as pd
+
+import database as db
+
+MAX_ENTRIES = 128
+MAX_BYTES = 512 * 1024 * 1024
+
+def _freeze(obj):
+    """Rend hashable un argument (listes, dicts, sets...) pour la clé de cache."""
+    if isinstance(obj, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(v) for v in obj)
+    if isinstance(obj, (set, frozenset)):
+        return frozenset(_freeze(v) for v in obj)
+    if obj is None or isinstance(obj, (str, int, float, bool, date, datetime)):
+        return obj
+    raise TypeError(f"Argument non cachable: {type(obj).__name__}")
+
+def sizeof(value) -> int:
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, bytes):
+        return len(value)
+    return sys.getsizeof(value)
+
+class VersionedLRU:
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (versions, value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.appends = 0
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] != versions:
+                self.misses += 1
+                return None, False
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1], True
+
+    def peek(self, key):
+        """(versions, valeur) de l'entrée, même périmée, ou None (sans compter de hit/miss)."""
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else entry[:2]
+
+    def put(self, key, versions, value):
+        nbytes = sizeof(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._data[key] = (versions, value, nbytes)
+            self._bytes += nbytes
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(entries=len(self._data), bytes=self._bytes, hits=self.hits, misses=self.misses, appends=self.appends)
+
+CACHE = VersionedLRU()
+
+def memoize(*tables):
+    """Décorateur pour `fn(conn, *args)`: résultat réutilisé tant que les tables
+    `tables` n'ont pas changé. Les valeurs retournées sont partagées: ne pas
+    les modifier en place.
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapper(conn, *args, **kwargs):
+            versions = tuple(db.data_version(conn, t) for t in tables)
+            key = (db.database_identity(conn), name, _freeze(args), _freeze(kwargs))
+            value, hit = CACHE.get(key, versions)
+            if hit:
+                return value
+            value = fn(conn, *args, **kwargs)
+            CACHE.put(key, versions, value)
+            return value
+
+        return wrapper
+    return decorator
+
+def memoize_append(table, *tables):
+    """Comme memoize, pour `fn(conn, filters, *args)` qui retourne des lignes de
+    `table` (un DataFrame, une ligne par ligne lue).
+
+    `fn` reçoit filters["ids"] = (après, jusqu'à): la tranche d'identifiants à
+    lire. Tant que `table` n'a reçu que des ajouts (db.delta_version) et que
+    `tables` n'ont pas changé, seule la tranche nouvelle est lue et ajoutée au
+    résultat en cache; sinon tout est relu, jusqu'à l'id max courant.
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapper(conn, filters, *args, **kwargs):
+            rewrites, last_id = db.delta_version(conn, table)
+            others = tuple(db.data_version(conn, t) for t in tables)
+            versions = (rewrites, last_id, others)
+            key = (db.database_identity(conn), name, _freeze(filters), _freeze(args), _freeze(kwargs))
+            value, hit = CACHE.get(key, versions)
+            if hit:
+                return value
+            entry = CACHE.peek(key)
+            if entry is not None and entry[0][0] == rewrites and entry[0][2] == others and (entry[0][1] or 0) < (last_id or 0):
+                delta = fn(conn, dict(filters, ids=(entry[0][1], last_id)), *args, **kwargs)
+                value = db.append_frames(entry[1], delta)
+                CACHE.appends += 1
+            else:
+                value = fn(conn, dict(filters, ids=(None, last_id or 0)), *args, **kwargs)
+            CACHE.put(key, versions, value)
+            return value
+
+        return wrapper
+    return decorator
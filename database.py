@@ -1,15 +1,159 @@
+import os
 import sqlite3
-from datetime import datetime
+import calendar
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
 import pandas as pd
 
-DB_PATH = "ganvie_durable.db"
+import baselines
+import perf
+import risk_rules
 
-def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+# Backend de stockage: "sqlite" (défaut) ou "duckdb" (en colonnes, voir duckdb_backend.py)
+BACKEND = os.environ.get("GANVIE_BACKEND", "sqlite")
+DB_PATH = os.environ.get("GANVIE_DB_PATH") or ("ganvie_durable.duckdb" if BACKEND == "duckdb" else "ganvie_durable.db")
 
-def init_db(conn):
-    cur = conn.cursor()
+# Ordre fixe: le besoin i correspond au bit i de needs_mask
+NEED_COLUMNS = [
+    "needs_water",
+    "needs_sanitation",
+    "needs_housing",
+    "needs_education",
+    "needs_health",
+    "needs_economic",
+]
+NEED_COMBINATIONS = 1 << len(NEED_COLUMNS)  # valeurs possibles de needs_mask (64)
+
+# Types compacts des DataFrames chargés en mémoire (voir compact_frame).
+# Catégories à ordre fixe; None = ordre alphabétique des valeurs présentes.
+# Une valeur hors liste est ajoutée en fin de catégories, jamais perdue.
+CATEGORIES = {
+    "zone": None,
+    "main_activity": ["Pêche", "Commerce", "Artisanat", "Tourisme", "Sans emploi", "Autre"],
+    "vulnerability": ["Faible", "Moyen", "Élevé"],
+    "season": ["Sèche", "Pluies1", "Pluies2"],
+    "risk_level": risk_rules.LEVELS,
+}
+ORDERED_CATEGORIES = {"vulnerability", "risk_level"}
+FLAG_COLUMNS = NEED_COLUMNS + ["water_improved", "sanitation", "children_schooling", "health_access"]
+FLOAT32_COLUMNS = ["lat", "lon", "ph", "turbidity", "conductivity", "e_coli", "coliforms"]
+PRIMARY_KEYS = {"households": "household_id", "water_samples": "sample_id"}
+# Colonnes dérivées, tenues à jour par la base: lisibles, mais absentes de
+# table_columns (ni fournies à l'insertion, ni exportées, ni copiées)
+DERIVED_COLUMNS = {"households": ["needs_mask"], "water_samples": []}
+
+# ------------------ Backends ------------------
+# Les fonctions marquées @backend_api forment l'interface commune aux
+# backends. Elles sont implémentées ici pour SQLite; appelées avec une
+# connexion DuckDB, elles délèguent à la fonction de même nom de
+# duckdb_backend. Le backend suit donc la connexion, elle-même ouverte selon
+# le chemin de la base (.duckdb ou non), et les appelants ne changent pas.
+
+BACKEND_API = []
+
+def is_duckdb_path(path) -> bool:
+    return str(path).endswith(".duckdb")
+
+def _duckdb_backend():
+    import duckdb_backend
+    return duckdb_backend
+
+def backend_api(fn):
+    name = fn.__name__
+    BACKEND_API.append(name)
+
+    @wraps(fn)
+    def wrapper(conn, *args, **kwargs):
+        if isinstance(conn, sqlite3.Connection):
+            return fn(conn, *args, **kwargs)
+        return getattr(_duckdb_backend(), name)(conn, *args, **kwargs)
+
+    return wrapper
 
+# ------------------ Connexions ------------------
+# Mode WAL: les lectures ne bloquent pas l'écriture (et inversement).
+# Chaque thread obtient sa propre connexion en lecture seule via reader(), et
+# chaque session Streamlit la sienne via open_reader(); les écritures du
+# processus passent par une connexion unique, sérialisée par un verrou, via
+# writer().
+
+BUSY_TIMEOUT_MS = 5000
+CONNECTION_PRAGMAS = {
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "synchronous": "NORMAL",    # suffisant en WAL (durable au checkpoint)
+    "cache_size": -32000,       # ~32 Mo de cache de pages par connexion
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+def _configure(conn):
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+def get_connection(path=None):
+    """Connexion lecture-écriture (scripts, migrations, writer du dashboard)."""
+    if is_duckdb_path(path or DB_PATH):
+        return _duckdb_backend().get_connection(path or DB_PATH)
+    # uri=True: les archives s'attachent en lecture seule (file:...?mode=ro)
+    conn = sqlite3.connect(path or DB_PATH, uri=True, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode = WAL")
+    return _configure(conn)
+
+_local = threading.local()
+_writer_conn = {}
+_writer_lock = threading.RLock()
+
+def reader(path=None):
+    """Connexion en lecture seule propre au thread courant (réutilisée entre appels)."""
+    if is_duckdb_path(path or DB_PATH):
+        return _duckdb_backend().reader(path or DB_PATH)
+    path = str(Path(path or DB_PATH).resolve())
+    conns = getattr(_local, "readers", None)
+    if conns is None:
+        conns = _local.readers = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = open_reader(path)
+    return conn
+
+def open_reader(path=None):
+    """Nouvelle connexion en lecture seule, utilisable depuis plusieurs threads
+    successifs (jamais simultanés): une par session Streamlit."""
+    if is_duckdb_path(path or DB_PATH):
+        return _duckdb_backend().open_reader(path or DB_PATH)
+    path = str(Path(path or DB_PATH).resolve())
+    conn = sqlite3.connect(f"{Path(path).as_uri()}?mode=ro", uri=True, check_same_thread=False,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
+    return _configure(conn)
+
+@contextmanager
+def writer(path=None):
+    """Connexion d'écriture unique du processus, tenue pendant le bloc `with`."""
+    if is_duckdb_path(path or DB_PATH):
+        with _duckdb_backend().writer(path or DB_PATH) as conn:
+            yield conn
+        return
+    path = str(Path(path or DB_PATH).resolve())
+    with _writer_lock:
+        conn = _writer_conn.get(path)
+        if conn is None:
+            conn = _writer_conn[path] = get_connection(path)
+        yield conn
+
+# ------------------ Migrations ------------------
+# La version du schéma est suivie par PRAGMA user_version. Chaque migration
+# s'exécute dans sa propre transaction, avec la mise à jour de user_version:
+# une base déjà à jour n'est pas modifiée, une base ancienne est mise à niveau
+# sur place sans perte de données.
+
+def _migration_1(cur):
+    # Schéma initial (IF NOT EXISTS: les bases créées avant le versionnage
+    # ont déjà ces tables avec user_version = 0)
     cur.execute("""
     CREATE TABLE IF NOT EXISTS households (
         household_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -59,37 +203,1115 @@ def init_db(conn):
         updated_at TEXT
     );
     """)
-    cur.execute("INSERT OR IGNORE INTO targets (id, households_target, updated_at) VALUES (1, 1000, ?)", (datetime.now().isoformat(),))
 
+def _add_column(cur, table: str, ddl: str):
+    name = ddl.split()[0]
+    if name not in [r[1] for r in cur.execute(f"PRAGMA table_xinfo({table})")]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+
+def _migration_2(cur):
+    # Horodatage entier (epoch, secondes UTC) dérivé de collected_at: colonne
+    # générée VIRTUAL, donc toujours cohérente avec le texte ISO, sans
+    # backfill ni trigger, et indexable pour les filtres de période.
+    ts = "collected_ts INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', collected_at) AS INTEGER)) VIRTUAL"
+    _add_column(cur, "households", ts)
+    _add_column(cur, "water_samples", ts)
+
+    # Index alignés sur les filtres de la sidebar
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_households_zone_ts ON households (zone, collected_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_households_ts ON households (collected_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_households_vulnerability ON households (vulnerability)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_water_zone_ts ON water_samples (zone, collected_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_water_ts ON water_samples (collected_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_water_risk_level ON water_samples (risk_level)")
+
+def _migration_3(cur):
+    # Compteurs d'écriture par table (jeton de changement pour les caches)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    for name in ("households", "water_samples", "targets"):
+        cur.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)", (name,))
+
+# ------------------ Agrégats zone × jour (rollup) ------------------
+# household_rollup résume les ménages par zone × jour × vulnérabilité ×
+# combinaison de besoins (needs_mask, 6 bits). La combinaison fait partie de
+# la clé pour que le filtre « au moins un besoin sélectionné » reste exact sur
+# l'agrégat; les comptes par besoin et le nombre de besoins s'en déduisent.
+# Des triggers le tiennent à jour à chaque écriture sur households.
+
+def _needs_mask_sql(alias: str = None) -> str:
+    prefix = f"{alias}." if alias else ""
+    return " | ".join(
+        f"(CASE WHEN COALESCE({prefix}{c}, 0) != 0 THEN {1 << i} ELSE 0 END)"
+        for i, c in enumerate(NEED_COLUMNS)
+    )
+
+def needs_bits(needs) -> int:
+    """Masque des colonnes needs_* de `needs` (bit i = NEED_COLUMNS[i])."""
+    return sum(1 << NEED_COLUMNS.index(c) for c in set(needs or []) if c in NEED_COLUMNS)
+
+def _rollup_key_sql(alias: str):
+    return [
+        f"{alias}.zone",
+        f"COALESCE(date({alias}.collected_at), '')",
+        f"COALESCE({alias}.vulnerability, '')",
+        f"({_needs_mask_sql(alias)})",
+    ]
+
+ROLLUP_KEY = ["zone", "day", "vulnerability", "needs_mask"]
+ROLLUP_SUMS = ["water_improved", "sanitation", "children_schooling"]
+
+def _rollup_triggers(cur):
+    def where(alias):
+        return " AND ".join(f"{k} = {e}" for k, e in zip(ROLLUP_KEY, _rollup_key_sql(alias)))
+
+    add = f"""
+        INSERT INTO household_rollup ({', '.join(ROLLUP_KEY + ['households'] + ROLLUP_SUMS)})
+        VALUES ({', '.join(_rollup_key_sql('NEW') + ['1'] + [f'COALESCE(NEW.{c}, 0)' for c in ROLLUP_SUMS])})
+        ON CONFLICT ({', '.join(ROLLUP_KEY)}) DO UPDATE SET
+            households = households + 1,
+            {', '.join(f'{c} = {c} + excluded.{c}' for c in ROLLUP_SUMS)};"""
+    remove = f"""
+        UPDATE household_rollup SET
+            households = households - 1,
+            {', '.join(f'{c} = {c} - COALESCE(OLD.{c}, 0)' for c in ROLLUP_SUMS)}
+        WHERE {where('OLD')};
+        DELETE FROM household_rollup WHERE households <= 0 AND {where('OLD')};"""
+    watched = ", ".join(["zone", "collected_at", "vulnerability"] + ROLLUP_SUMS + NEED_COLUMNS)
+
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_households_rollup_ins AFTER INSERT ON households BEGIN {add} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_households_rollup_del AFTER DELETE ON households BEGIN {remove} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_households_rollup_upd AFTER UPDATE OF {watched} ON households BEGIN {remove} {add} END")
+
+@backend_api
+def rebuild_rollup(conn) -> int:
+    """Recalcule household_rollup depuis households (archives comprises). Retourne le nombre de cellules."""
+    attach_partitions(conn)
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        _fill_rollup(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM household_rollup").fetchone()[0]
+
+def _fill_rollup(cur):
+    key = _rollup_key_sql("h")
+    cur.execute("DELETE FROM household_rollup")
+    # Ménages de la base et des archives (attachées avant la transaction)
+    source, _ = _union(cur.connection, "households", "SELECT * FROM {table}", [])
+    cur.execute(f"""
+        INSERT INTO household_rollup ({', '.join(ROLLUP_KEY + ['households'] + ROLLUP_SUMS)})
+        SELECT {', '.join(key)}, COUNT(*), {', '.join(f'SUM(COALESCE(h.{c}, 0))' for c in ROLLUP_SUMS)}
+        FROM ({source}) h
+        GROUP BY {', '.join(str(i + 1) for i in range(len(key)))}
+    """)
+
+def _unjournaled(conn) -> bool:
+    """Quitte le mode WAL (ni journal ni fsync); False si la base est ouverte ailleurs."""
+    conn.execute("PRAGMA busy_timeout = 0")
+    try:
+        if conn.execute("PRAGMA journal_mode = OFF").fetchone()[0] != "off":
+            return False
+    except sqlite3.OperationalError:
+        return False  # autre connexion ouverte: chargement journalisé
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = OFF")
+    return True
+
+@backend_api
+@contextmanager
+def deferred_rollup(conn, journal: bool = True):
+    """Suspend les triggers du rollup pendant un chargement massif, puis le recalcule.
+
+    Le recalcul complet en fin de bloc est bien moins coûteux qu'un upsert par
+    ligne; il couvre aussi les écritures faites entre-temps par d'autres connexions.
+    Si le processus s'arrête avant, l'absence des triggers marque le rollup comme
+    à recalculer: init_db les recrée et recalcule le rollup (_repair_rollup).
+
+    journal=False (données générées: seed_fast): ni journal ni fsync jusqu'à la
+    fin du bloc, qui revient au mode WAL. Une erreur ou un arrêt en cours de
+    chargement peut alors laisser la base incohérente, voire corrompue. Sans
+    effet si d'autres connexions empêchent de quitter le mode WAL.
+    """
+    for name in ("ins", "del", "upd"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_households_rollup_{name}")
+    conn.commit()
+    journal = journal or not _unjournaled(conn)
+    try:
+        yield conn
+    finally:
+        attach_partitions(conn)
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            _rollup_triggers(cur)
+            _fill_rollup(cur)
+            # Lignes inchangées (seul le rollup est recalculé): pas de réécriture
+            bump_version(conn, "households", append=True)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if not journal:
+                conn.execute(f"PRAGMA synchronous = {CONNECTION_PRAGMAS['synchronous']}")
+                conn.execute("PRAGMA journal_mode = WAL")
+
+def _repair_rollup(conn) -> bool:
+    """Recrée les triggers du rollup s'il en manque (chargement massif interrompu)
+    et recalcule household_rollup. Retourne True si une réparation a eu lieu."""
+    present = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_households_rollup_%'"
+    ).fetchone()[0]
+    if present == 3:
+        return False
+    attach_partitions(conn)
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        _rollup_triggers(cur)
+        _fill_rollup(cur)
+        bump_version(conn, "households", append=True)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def _migration_4(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS household_rollup (
+        zone TEXT NOT NULL,
+        day TEXT NOT NULL,           -- YYYY-MM-DD
+        vulnerability TEXT NOT NULL, -- '' si non renseignée
+        needs_mask INTEGER NOT NULL, -- bit i = NEED_COLUMNS[i]
+        households INTEGER NOT NULL,
+        water_improved INTEGER NOT NULL,
+        sanitation INTEGER NOT NULL,
+        children_schooling INTEGER NOT NULL,
+        PRIMARY KEY (zone, day, vulnerability, needs_mask)
+    ) WITHOUT ROWID;
+    """)
+    _rollup_triggers(cur)
+    _fill_rollup(cur)
+
+def _migration_5(cur):
+    # Écritures autres que des ajouts en fin de table (mise à jour, suppression,
+    # insertion d'identifiants explicites): tant que ce compteur ne bouge pas,
+    # un cache peut se compléter avec les seules lignes d'id supérieur (delta_version)
+    _add_column(cur, "data_versions", "rewrites INTEGER NOT NULL DEFAULT 0")
+
+def _needs_mask_triggers(cur):
+    # Les helpers d'insertion calculent needs_mask eux-mêmes (WHEN faux, pas
+    # d'écriture en plus); les triggers corrigent toute autre écriture.
+    expr = _needs_mask_sql("NEW")
+    fix = f"UPDATE households SET needs_mask = {expr} WHERE household_id = NEW.household_id;"
+    watched = ", ".join(NEED_COLUMNS + ["needs_mask"])
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_households_needs_mask_ins AFTER INSERT ON households "
+                f"WHEN NEW.needs_mask IS NOT ({expr}) BEGIN {fix} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_households_needs_mask_upd AFTER UPDATE OF {watched} ON households "
+                f"WHEN NEW.needs_mask IS NOT ({expr}) BEGIN {fix} END")
+
+def _migration_6(cur):
+    # Combinaison des besoins sur 6 bits (bit i = NEED_COLUMNS[i]), stockée:
+    # le filtre « au moins un besoin » devient un ET bit à bit et le nombre de
+    # besoins un popcount. Une colonne générée VIRTUAL (comme collected_ts)
+    # recalculerait les 6 CASE à chaque lecture: plus lente que l'ancien filtre.
+    _add_column(cur, "households", "needs_mask INTEGER NOT NULL DEFAULT 0")
+    cur.execute(f"UPDATE households SET needs_mask = {_needs_mask_sql()}")
+    _needs_mask_triggers(cur)
+
+# ------------------ Référentiels qualité de l'eau ------------------
+# État Welford par zone × saison × mesure, alertes et dernier prélèvement par
+# zone, tenus à jour dans la transaction d'insertion (voir baselines.py).
+
+def _score_water(conn, after_id=None) -> int:
+    """Score les prélèvements d'id > after_id (tous si None) et met à jour les
+    tables de référentiels, dans la transaction en cours. Retourne le nombre d'alertes.
+    """
+    where, params = (" WHERE sample_id > ?", [after_id]) if after_id is not None else ("", [])
+    sql, params = _union(conn, "water_samples", f"SELECT {', '.join(baselines.SAMPLE_COLUMNS)} FROM {{table}}{where}",
+                         params, {"ids": (after_id, None)})
+    samples = pd.read_sql_query(sql, conn, params=params)
+    if samples.empty:
+        return 0
+    state = pd.read_sql_query(f"SELECT {', '.join(baselines.STATE_COLUMNS)} FROM water_baselines", conn)
+    state, alerts, latest = baselines.score(state, samples)
+    alerts["season"] = alerts["season"].where(alerts["season"] != "", None)
+
+    conn.executemany(
+        "INSERT INTO water_baselines (zone, season, measure, n, mean, m2) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (zone, season, measure) DO UPDATE SET n = excluded.n, mean = excluded.mean, m2 = excluded.m2",
+        _frame_rows(state)[1],
+    )
+    if len(alerts):
+        cols = ", ".join(baselines.ALERT_COLUMNS)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO water_alerts ({cols}) VALUES ({', '.join(['?']*len(baselines.ALERT_COLUMNS))})",
+            _frame_rows(alerts)[1],
+        )
+    conn.executemany(
+        "INSERT INTO water_latest (zone, sample_id, collected_ts, anomalies) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (zone) DO UPDATE SET sample_id = excluded.sample_id, collected_ts = excluded.collected_ts, "
+        "anomalies = excluded.anomalies WHERE excluded.collected_ts > water_latest.collected_ts "
+        "OR (excluded.collected_ts = water_latest.collected_ts AND excluded.sample_id > water_latest.sample_id)",
+        _frame_rows(latest)[1],
+    )
+    return len(alerts)
+
+def _fill_baselines(cur):
+    for table in ("water_baselines", "water_alerts", "water_latest"):
+        cur.execute(f"DELETE FROM {table}")
+    return _score_water(cur.connection)
+
+@backend_api
+def rebuild_baselines(conn) -> int:
+    """Recalcule référentiels, alertes et derniers prélèvements depuis tout
+    l'historique (après suppression, correction de mesures ou insertion
+    d'identifiants explicites sous l'id max). Retourne le nombre d'alertes.
+    """
+    attach_partitions(conn)
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        alerts = _fill_baselines(cur)
+        # Lignes inchangées: les caches (clés data_version) relisent les alertes
+        bump_version(conn, "water_samples", append=True)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return alerts
+
+def _migration_7(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS water_baselines (
+        zone TEXT NOT NULL,
+        season TEXT NOT NULL,        -- '' si non renseignée
+        measure TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        mean REAL NOT NULL,          -- échelle log1p pour baselines.LOG_MEASURES
+        m2 REAL NOT NULL,            -- somme des carrés des écarts (Welford)
+        PRIMARY KEY (zone, season, measure)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS water_alerts (
+        sample_id INTEGER NOT NULL,
+        zone TEXT NOT NULL,
+        season TEXT,
+        collected_ts INTEGER,
+        measure TEXT NOT NULL,
+        value REAL NOT NULL,
+        expected REAL NOT NULL,      -- moyenne du référentiel, en unité de la mesure
+        z REAL NOT NULL,
+        PRIMARY KEY (sample_id, measure)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_water_alerts_zone_ts ON water_alerts (zone, collected_ts)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS water_latest (
+        zone TEXT PRIMARY KEY,
+        sample_id INTEGER NOT NULL,
+        collected_ts INTEGER,
+        anomalies INTEGER NOT NULL
+    );
+    """)
+    _fill_baselines(cur)
+
+# ------------------ Partitions (archives par année) ------------------
+# Les années closes peuvent être déplacées hors de la base (rollover_partition):
+# ménages et prélèvements de l'année vont dans un fichier d'archive SQLite
+# (archives/<base>.<année>.g<génération>.db), décrit par le catalogue
+# `partitions` (bornes collected_ts et identifiants, nombre de lignes). Chaque
+# lecture interroge la base et, par UNION ALL, les seules archives qui
+# recoupent sa période (filtres start / end) ou sa tranche d'ids, attachées en
+# lecture seule à la connexion. household_rollup et les référentiels qualité
+# de l'eau restent dans la base et couvrent tout l'historique: les résultats
+# sont les mêmes que les lignes soient chaudes ou archivées.
+
+ARCHIVE_DIR = "archives"
+PARTITIONED = ("households", "water_samples")
+
+def partitions_where(table: str, filters: dict):
+    """Clause WHERE du catalogue: archives de `table` qui recoupent les filtres
+    (période start / end, tranche `ids`). Commune aux deux backends."""
+    clauses, params = ["table_name = ?"], [table]
+    if filters.get("start") is not None:
+        clauses.append("ts_max >= ?")
+        params.append(_epoch(filters["start"]))
+    if filters.get("end") is not None:
+        clauses.append("ts_min < ?")
+        params.append(_epoch(filters["end"] + timedelta(days=1)))
+    after, upto = filters.get("ids") or (None, None)
+    if after is not None:
+        clauses.append("id_max > ?")
+        params.append(int(after))
+    if upto is not None:
+        clauses.append("id_min <= ?")
+        params.append(int(upto))
+    return " WHERE " + " AND ".join(clauses), params
+
+def year_bounds(year: int):
+    """[début, fin[ de l'année en epoch (secondes UTC), comme collected_ts."""
+    return _epoch(datetime(year, 1, 1)), _epoch(datetime(year + 1, 1, 1))
+
+def _alias(name: str, generation: int) -> str:
+    return f"part_{name}_g{generation}"
+
+def _main_path(conn) -> Path:
+    return Path(next(r[2] for r in conn.execute("PRAGMA database_list") if r[1] == "main"))
+
+def _attach(conn, aliases: dict):
+    """Attache en lecture seule les archives {alias: chemin} manquantes; détache
+    celles qui ne sont plus au catalogue (remplacées par une génération plus récente)."""
+    attached = {r[1] for r in conn.execute("PRAGMA database_list") if r[1].startswith("part_")}
+    if not set(aliases) - attached:
+        return
+    current = {_alias(*r) for r in conn.execute("SELECT DISTINCT name, generation FROM partitions")}
+    for alias in sorted(attached - current):
+        try:
+            conn.execute(f"DETACH DATABASE {alias}")
+            attached.discard(alias)
+        except sqlite3.OperationalError:
+            pass  # lecture en cours sur l'archive: détachée plus tard
+    for alias, path in aliases.items():
+        if alias in attached:
+            continue
+        uri = f"{path.resolve().as_uri()}?mode=ro"
+        try:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+        except sqlite3.OperationalError:
+            # Limite d'archives attachées (SQLITE_LIMIT_ATTACHED): libère celles
+            # dont la lecture n'a pas besoin, puis réessaie une fois
+            for other in sorted(attached - set(aliases)):
+                try:
+                    conn.execute(f"DETACH DATABASE {other}")
+                except sqlite3.OperationalError:
+                    pass
+            attached &= set(aliases)
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+        attached.add(alias)
+
+def _sources(conn, table: str, filters: dict = None) -> list:
+    """`table` puis les archives de `table` qui recoupent `filters` (alias.table), attachées au besoin."""
+    where, params = partitions_where(table, filters or {})
+    try:
+        rows = conn.execute(f"SELECT name, generation, path FROM partitions{where} ORDER BY name", params).fetchall()
+    except sqlite3.OperationalError:
+        return [table]   # base pas encore migrée (catalogue absent)
+    if not rows:
+        return [table]
+    base = _main_path(conn).parent
+    aliases = {_alias(name, generation): base / path for name, generation, path in rows}
+    _attach(conn, aliases)
+    return [table] + [f"{alias}.{table}" for alias in aliases]
+
+def _union(conn, table: str, sql: str, params: list, filters: dict = None):
+    """`sql` ({table} = la table) sur la base puis sur chaque archive retenue par
+    `filters`, réunis par UNION ALL (paramètres répétés par source)."""
+    sources = _sources(conn, table, filters)
+    return " UNION ALL ".join(sql.replace("{table}", s) for s in sources), list(params) * len(sources)
+
+def attach_partitions(conn):
+    """Attache toutes les archives: à appeler hors transaction, avant une
+    écriture qui relit tout l'historique (ATTACH est refusé dans une transaction)."""
+    for table in PARTITIONED:
+        _sources(conn, table)
+
+def _max_id_sql(table: str) -> str:
+    # Identifiant max, archives comprises (AUTOINCREMENT: jamais réattribué)
+    return (f"SELECT MAX(id) FROM (SELECT MAX({PRIMARY_KEYS[table]}) AS id FROM {table} "
+            f"UNION ALL SELECT MAX(id_max) FROM partitions WHERE table_name = '{table}')")
+
+def _stored_columns(conn, table: str, schema: str = "main") -> list:
+    # Colonnes stockées (les colonnes générées sont recalculées par l'archive)
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_xinfo({table})") if r[6] == 0]
+
+def _create_archive(conn, path: Path):
+    """Fichier d'archive vide: mêmes tables et index que la base (sans triggers)."""
+    ddl = [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name IN (?, ?) AND type IN ('table', 'index') "
+        "AND sql IS NOT NULL ORDER BY type DESC, name", PARTITIONED)]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()   # reste d'un rollover interrompu (absent du catalogue)
+    arch = sqlite3.connect(str(path))
+    try:
+        for sql in ddl:
+            arch.execute(sql)
+        arch.commit()
+    finally:
+        arch.close()
+
+def _copy_to_archive(conn, path: Path, old: Path, lo: int, hi: int) -> dict:
+    """Copie dans `path` l'archive précédente `old` (ou None) et les lignes de la
+    base dans [lo, hi[, triées par identifiant (fichier compact). Retourne les
+    statistiques du catalogue par table."""
+    main = _main_path(conn)
+    arch = sqlite3.connect(str(path), uri=True)
+    try:
+        arch.execute("ATTACH DATABASE ? AS hot", (f"{main.as_uri()}?mode=ro",))
+        if old is not None:
+            arch.execute("ATTACH DATABASE ? AS old", (f"{old.resolve().as_uri()}?mode=ro",))
+        stats = {}
+        with arch:
+            for table in PARTITIONED:
+                pk = PRIMARY_KEYS[table]
+                cols = ", ".join(_stored_columns(arch, table))
+                previous = f"SELECT {cols} FROM old.{table} UNION ALL " if old is not None else ""
+                arch.execute(f"INSERT INTO main.{table} ({cols}) {previous}SELECT {cols} FROM hot.{table} "
+                             f"WHERE collected_ts >= ? AND collected_ts < ? ORDER BY {pk}", (lo, hi))
+                stats[table] = arch.execute(
+                    f"SELECT COUNT(*), MIN(collected_ts), MAX(collected_ts), MIN({pk}), MAX({pk}) FROM main.{table}"
+                ).fetchone()
+        arch.execute("ANALYZE main")
+        return stats
+    finally:
+        arch.close()
+
+@backend_api
+def rollover_partition(conn, year: int, vacuum: bool = False) -> dict:
+    """Archive l'année close `year`: ses ménages et prélèvements quittent la base
+    pour un nouveau fichier d'archive (fusionné avec l'archive existante de
+    l'année, écrit trié et compact), puis le catalogue est mis à jour.
+
+    Les lignes sont copiées sous le verrou d'écriture de la base, puis
+    supprimées et le catalogue basculé dans une seule transaction: une
+    interruption laisse au pire un fichier orphelin, jamais de ligne perdue ni
+    en double. Retourne {table: lignes déplacées} et le chemin de l'archive.
+    `vacuum`: rend ensuite à l'OS les pages libérées de la base.
+    """
+    if year >= datetime.now().year:
+        raise ValueError(f"L'année {year} n'est pas close: seules les années passées sont archivées.")
+    lo, hi = year_bounds(year)
+    main = _main_path(conn)
+    previous = conn.execute("SELECT generation, path FROM partitions WHERE name = ? LIMIT 1", (str(year),)).fetchone()
+    generation = previous[0] + 1 if previous else 1
+    path = Path(ARCHIVE_DIR) / f"{main.stem}.{year}.g{generation}.db"
+    old = main.parent / previous[1] if previous else None
+    _create_archive(conn, main.parent / path)
+
+    cur = conn.cursor()
+    # Verrou d'écriture pris avant la copie: aucune ligne de l'année ne peut
+    # arriver entre la copie et la suppression
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        hot = {t: cur.execute(f"SELECT COUNT(*) FROM {t} WHERE collected_ts >= ? AND collected_ts < ?", (lo, hi)).fetchone()[0]
+               for t in PARTITIONED}
+        before = dict(conn.execute("SELECT table_name, row_count FROM partitions WHERE name = ?", (str(year),)).fetchall())
+        stats = _copy_to_archive(conn, main.parent / path, old, lo, hi)
+        for table in PARTITIONED:
+            if stats[table][0] != before.get(table, 0) + hot[table]:
+                raise RuntimeError(f"Archive {path}: {stats[table][0]} lignes {table} copiées, "
+                                   f"{before.get(table, 0) + hot[table]} attendues")
+
+        # household_rollup couvre aussi les lignes archivées: le trigger de
+        # suppression est suspendu le temps du déplacement
+        cur.execute("DROP TRIGGER IF EXISTS trg_households_rollup_del")
+        for table in PARTITIONED:
+            cur.execute(f"DELETE FROM {table} WHERE collected_ts >= ? AND collected_ts < ?", (lo, hi))
+        _rollup_triggers(cur)
+        cur.execute("DELETE FROM partitions WHERE name = ?", (str(year),))
+        now = datetime.now().isoformat(timespec="seconds")
+        for table in PARTITIONED:
+            rows, ts_min, ts_max, id_min, id_max = stats[table]
+            if rows:
+                cur.execute(
+                    "INSERT INTO partitions (name, table_name, generation, path, row_count, ts_min, ts_max, id_min, id_max, archived_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (str(year), table, generation, path.as_posix(), rows, ts_min, ts_max, id_min, id_max, now),
+                )
+            # Lignes déplacées: les caches repartent d'une lecture complète
+            bump_version(conn, table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        (main.parent / path).unlink(missing_ok=True)
+        raise
+
+    if old is not None and old != main.parent / path:
+        try:
+            old.unlink()
+        except OSError:
+            pass  # encore ouverte ailleurs (Windows): fichier orphelin sans effet
+    if vacuum:
+        conn.execute("VACUUM")
+    return dict(hot, path=str(main.parent / path))
+
+@backend_api
+def list_partitions(conn):
+    """Catalogue des archives: une ligne par année et par table."""
+    df = pd.read_sql_query(
+        "SELECT name, table_name, generation, path, row_count, ts_min, ts_max, id_min, id_max, archived_at "
+        "FROM partitions ORDER BY name, table_name", conn)
+    for c in ("ts_min", "ts_max"):
+        df[c] = pd.to_datetime(df[c], unit="s")
+    return df
+
+def _migration_8(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS partitions (
+        name TEXT NOT NULL,          -- année archivée (ex. '2024')
+        table_name TEXT NOT NULL,    -- households | water_samples
+        generation INTEGER NOT NULL, -- incrémentée à chaque nouveau rollover de l'année
+        path TEXT NOT NULL,          -- fichier d'archive, relatif au dossier de la base
+        row_count INTEGER NOT NULL,
+        ts_min INTEGER NOT NULL,     -- bornes collected_ts des lignes archivées
+        ts_max INTEGER NOT NULL,
+        id_min INTEGER NOT NULL,
+        id_max INTEGER NOT NULL,
+        archived_at TEXT NOT NULL,
+        PRIMARY KEY (name, table_name)
+    );
+    """)
+
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5, _migration_6,
+              _migration_7, _migration_8]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+@backend_api
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn) -> int:
+    """Applique les migrations manquantes et retourne la version finale."""
+    version = schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Base en version {version}, plus récente que ce code (version {SCHEMA_VERSION}).")
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            MIGRATIONS[target - 1](cur)
+            cur.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+@backend_api
+def init_db(conn):
+    migrate(conn)
+    _repair_rollup(conn)
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO targets (id, households_target, updated_at) VALUES (1, 1000, ?)", (datetime.now().isoformat(),))
     conn.commit()
 
 # ------------------ Data access helpers ------------------
 
+@backend_api
+def bump_version(conn, table: str, append: bool = False):
+    """Incrémente le compteur d'écriture de `table` (dans la transaction en cours).
+
+    `append`: l'écriture n'a fait qu'ajouter des lignes d'identifiant nouveau
+    (auto-incrément); sinon le compteur `rewrites` est aussi incrémenté.
+    """
+    conn.execute(
+        "UPDATE data_versions SET version = version + 1, rewrites = rewrites + ? WHERE name = ?",
+        (0 if append else 1, table),
+    )
+
+@backend_api
+def database_identity(conn):
+    """(backend, chemin résolu) de la base ouverte par `conn`: distingue dans un
+    cache les résultats de bases différentes. Une base en mémoire est propre
+    à sa connexion."""
+    path = next(r[2] for r in conn.execute("PRAGMA database_list") if r[1] == "main")
+    return ("sqlite", str(Path(path).resolve()) if path else id(conn))
+
+@backend_api
+def data_version(conn, table: str):
+    """Jeton de changement bon marché pour `table`: (compteur d'écriture, max rowid).
+
+    Le compteur est incrémenté par les helpers d'écriture de ce module; le
+    max rowid couvre en plus les insertions faites hors de ces helpers.
+    """
+    row = conn.execute(
+        f"SELECT (SELECT version FROM data_versions WHERE name = ?), (SELECT MAX(rowid) FROM {table})",
+        (table,),
+    ).fetchone()
+    return tuple(row)
+
+@backend_api
+def delta_version(conn, table: str):
+    """(compteur `rewrites`, id max) de `table`: tant que le compteur est
+    inchangé, les lignes déjà lues le sont toujours et les nouvelles sont
+    celles d'id supérieur (filtre `ids` de households_where / water_where).
+    """
+    row = conn.execute(
+        f"SELECT (SELECT rewrites FROM data_versions WHERE name = ?), ({_max_id_sql(table)})",
+        (table,),
+    ).fetchone()
+    return tuple(row)
+
+@backend_api
 def upsert_target(conn, households_target: int):
     cur = conn.cursor()
     cur.execute("UPDATE targets SET households_target=?, updated_at=? WHERE id=1", (households_target, datetime.now().isoformat()))
+    bump_version(conn, "targets")
     conn.commit()
 
+@backend_api
 def get_target(conn) -> int:
     df = pd.read_sql_query("SELECT households_target FROM targets WHERE id=1", conn)
     return int(df.iloc[0]["households_target"]) if len(df) else 1000
 
+@backend_api
 def households_df(conn):
-    return pd.read_sql_query("SELECT * FROM households", conn)
+    sql, params = _union(conn, "households", "SELECT * FROM {table}", [])
+    return compact_frame(pd.read_sql_query(sql, conn, params=params))
 
+@backend_api
 def water_df(conn):
-    return pd.read_sql_query("SELECT * FROM water_samples", conn)
+    sql, params = _union(conn, "water_samples", "SELECT * FROM {table}", [])
+    return compact_frame(pd.read_sql_query(sql, conn, params=params))
+
+# ------------------ Filtres (requêtes paramétrées) ------------------
+
+def _table_info(conn, table: str):
+    derived = DERIVED_COLUMNS.get(table, [])
+    return [r for r in conn.execute(f"PRAGMA table_info({table})") if r[1] not in derived]
+
+@backend_api
+def table_columns(conn, table: str) -> list:
+    return [r[1] for r in _table_info(conn, table)]
+
+def _select_list(conn, table: str, columns) -> str:
+    if columns is None:
+        # Colonnes stockées seulement: les exports et copies gardent le schéma d'origine
+        columns = table_columns(conn, table)
+    known = set(table_columns(conn, table)) | set(DERIVED_COLUMNS.get(table, []))
+    unknown = [c for c in columns if c not in known]
+    if unknown:
+        raise ValueError(f"Colonnes inconnues pour {table}: {', '.join(unknown)}")
+    # collected_at est lu via l'epoch entier (pas de parsing ISO côté pandas)
+    return ", ".join("collected_ts" if c == "collected_at" else c for c in columns)
+
+def _epoch(d) -> int:
+    return calendar.timegm(d.timetuple())
+
+def _typed_timestamps(df):
+    """Remplace collected_at (texte ISO) par un datetime construit depuis collected_ts."""
+    if "collected_ts" in df.columns:
+        with perf.span("db.to_datetime"):
+            if "collected_at" in df.columns:
+                df["collected_at"] = pd.to_datetime(df.pop("collected_ts"), unit="s")
+            else:
+                df = df.rename(columns={"collected_ts": "collected_at"})
+                df["collected_at"] = pd.to_datetime(df["collected_at"], unit="s")
+    return df
+
+def _categorical(col, order, ordered):
+    present = col.dropna().unique()
+    if order is None:
+        categories = sorted(present)
+    else:
+        known = set(order)
+        categories = list(order) + sorted(v for v in present if v not in known)
+    return pd.Categorical(col, categories=categories, ordered=ordered)
+
+def compact_frame(df):
+    """Types compacts pour les frames gardés en mémoire (cache partagé entre sessions).
+
+    Champs énumérés -> category (ordre fixe), indicateurs 0/1 -> Int8 nullable,
+    coordonnées et mesures -> float32, hh_size -> Int16, needs_mask -> uint8.
+    Les exports et copies (iter_*) gardent les types de la base.
+    """
+    for c in df.columns:
+        if c in CATEGORIES:
+            df[c] = _categorical(df[c], CATEGORIES[c], c in ORDERED_CATEGORIES)
+        elif c in FLAG_COLUMNS:
+            df[c] = df[c].astype("Int8")
+        elif c in FLOAT32_COLUMNS:
+            df[c] = df[c].astype("float32")
+        elif c == "hh_size":
+            df[c] = df[c].astype("Int16")
+        elif c == "needs_mask":
+            df[c] = df[c].astype("uint8")
+    return df
+
+def append_frames(df, more):
+    """Concatène deux frames de compact_frame (cache complété par un delta).
+
+    Les catégories des deux côtés sont unies (une zone nouvelle reste une
+    catégorie, pas un objet), dans l'ordre qu'aurait donné compact_frame.
+    """
+    if len(more) == 0:
+        return df
+    if len(df) == 0:
+        return more
+    df, more = df.copy(deep=False), more.copy(deep=False)
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype) and df[c].dtype != more[c].dtype:
+            known = list(df[c].cat.categories)
+            seen = set(known)
+            categories = known + [v for v in more[c].cat.categories if v not in seen]
+            if c in CATEGORIES and CATEGORIES[c] is None:
+                categories = sorted(categories)
+            df[c] = df[c].cat.set_categories(categories)
+            more[c] = more[c].cat.set_categories(categories)
+    return pd.concat([df, more], ignore_index=True)
+
+def _ids_clause(table: str, filters: dict, clauses: list, params: list):
+    # Tranche d'identifiants ]après, jusqu'à] (rafraîchissement par delta)
+    after, upto = filters.get("ids") or (None, None)
+    if after is not None:
+        clauses.append(f"{PRIMARY_KEYS[table]} > ?")
+        params.append(int(after))
+    if upto is not None:
+        clauses.append(f"{PRIMARY_KEYS[table]} <= ?")
+        params.append(int(upto))
 
+def _in_clause(column: str, values, clauses: list, params: list):
+    values = list(values)
+    if not values:
+        # Sélection vide = aucun résultat (même comportement que isin([]))
+        clauses.append("0")
+        return
+    clauses.append(f"{column} IN ({', '.join(['?']*len(values))})")
+    params.extend(values)
+
+def _date_clause(filters: dict, clauses: list, params: list):
+    # Filtre sur collected_ts (indexé). La borne haute est exclusive
+    # (lendemain de `end`) pour inclure toute la journée.
+    if filters.get("start") is not None:
+        clauses.append("collected_ts >= ?")
+        params.append(_epoch(filters["start"]))
+    if filters.get("end") is not None:
+        clauses.append("collected_ts < ?")
+        params.append(_epoch(filters["end"] + timedelta(days=1)))
+
+def households_where(filters: dict):
+    """Clause WHERE (+ paramètres) pour le dict de filtres de la sidebar.
+
+    Clés reconnues: zones, start, end, vuln, needs (colonnes `needs_*`),
+    ids (tranche ]après, jusqu'à] de household_id). Une clé absente (ou None)
+    n'applique pas de filtre.
+    """
+    clauses, params = [], []
+    _ids_clause("households", filters, clauses, params)
+    if filters.get("zones") is not None:
+        _in_clause("zone", filters["zones"], clauses, params)
+    _date_clause(filters, clauses, params)
+    if filters.get("vuln") is not None:
+        _in_clause("vulnerability", filters["vuln"], clauses, params)
+    bits = needs_bits(filters.get("needs"))
+    if bits:
+        # au moins un des besoins sélectionnés
+        clauses.append("(needs_mask & ?) != 0")
+        params.append(bits)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def water_where(filters: dict):
+    clauses, params = [], []
+    _ids_clause("water_samples", filters, clauses, params)
+    if filters.get("zones") is not None:
+        _in_clause("zone", filters["zones"], clauses, params)
+    _date_clause(filters, clauses, params)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+@backend_api
+def query_households(conn, filters: dict, columns=None):
+    where, params = households_where(filters)
+    sql, params = _union(conn, "households", f"SELECT {_select_list(conn, 'households', columns)} FROM {{table}}{where}", params, filters)
+    return compact_frame(_typed_timestamps(pd.read_sql_query(sql, conn, params=params)))
+
+@backend_api
+def query_water(conn, filters: dict, columns=None):
+    where, params = water_where(filters)
+    sql, params = _union(conn, "water_samples", f"SELECT {_select_list(conn, 'water_samples', columns)} FROM {{table}}{where}", params, filters)
+    return compact_frame(_typed_timestamps(pd.read_sql_query(sql, conn, params=params)))
+
+@backend_api
+def iter_households(conn, filters: dict, columns=None, chunksize: int = 50000):
+    """Comme query_households, mais par blocs de `chunksize` lignes (exports volumineux)."""
+    where, params = households_where(filters)
+    sql, params = _union(conn, "households", f"SELECT {_select_list(conn, 'households', columns)} FROM {{table}}{where}", params, filters)
+    for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunksize):
+        yield _typed_timestamps(chunk)
+
+@backend_api
+def iter_water(conn, filters: dict, columns=None, chunksize: int = 50000):
+    where, params = water_where(filters)
+    sql, params = _union(conn, "water_samples", f"SELECT {_select_list(conn, 'water_samples', columns)} FROM {{table}}{where}", params, filters)
+    for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunksize):
+        yield _typed_timestamps(chunk)
+
+@backend_api
+def column_types(conn, table: str) -> dict:
+    """Types déclarés des colonnes visibles de `table` (INTEGER, REAL, TEXT...)."""
+    return {r[1]: (r[2] or "").upper() for r in _table_info(conn, table)}
+
+def rollup_where(filters: dict):
+    clauses, params = [], []
+    if filters.get("zones") is not None:
+        _in_clause("zone", filters["zones"], clauses, params)
+    if filters.get("start") is not None:
+        clauses.append("day >= ?")
+        params.append(filters["start"].isoformat())
+    if filters.get("end") is not None:
+        clauses.append("day <= ?")
+        params.append(filters["end"].isoformat())
+    if filters.get("vuln") is not None:
+        _in_clause("vulnerability", filters["vuln"], clauses, params)
+    bits = needs_bits(filters.get("needs"))
+    if bits:
+        clauses.append("(needs_mask & ?) != 0")
+        params.append(bits)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+@backend_api
+def query_rollup(conn, filters: dict):
+    """Cellules de household_rollup retenues par les filtres (mêmes clés que query_households).
+
+    Colonnes: zone, day (datetime), vulnerability, needs_mask, need_count,
+    households et les sommes water_improved / sanitation / children_schooling.
+    """
+    where, params = rollup_where(filters)
+    popcount = " + ".join(f"((needs_mask >> {i}) & 1)" for i in range(len(NEED_COLUMNS)))
+    df = pd.read_sql_query(
+        f"SELECT zone, day, vulnerability, needs_mask, {popcount} AS need_count, households, "
+        f"{', '.join(ROLLUP_SUMS)} FROM household_rollup{where}",
+        conn, params=params,
+    )
+    df["day"] = pd.to_datetime(df["day"], format="%Y-%m-%d", errors="coerce")
+    return df
+
+@backend_api
+def query_alerts(conn, filters: dict, limit: int = None):
+    """Alertes des prélèvements retenus par les filtres (zones, période), les plus récentes d'abord.
+
+    Colonnes: baselines.ALERT_COLUMNS, collected_ts remplacé par collected_at (datetime).
+    """
+    where, params = water_where(filters)
+    sql = (f"SELECT {', '.join(baselines.ALERT_COLUMNS)} FROM water_alerts{where} "
+           "ORDER BY collected_ts DESC, sample_id DESC, measure")
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [int(limit)]
+    return compact_frame(_typed_timestamps(pd.read_sql_query(sql, conn, params=params)))
+
+LATEST_WATER_COLUMNS = ["sample_id", "zone", "collected_ts", "season"] + baselines.MEASURES + ["risk_level"]
+
+@backend_api
+def latest_water(conn, filters: dict):
+    """Dernier prélèvement de chaque zone retenue (toutes périodes confondues),
+    tenu à jour à l'insertion, avec son nombre de mesures en alerte (anomalies).
+    """
+    clauses, params = [], []
+    if filters.get("zones") is not None:
+        _in_clause("l.zone", filters["zones"], clauses, params)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    # Archives routées par identifiant: seules celles qui contiennent un dernier prélèvement
+    first = conn.execute(f"SELECT MIN(l.sample_id) FROM water_latest l{where}", params).fetchone()[0]
+    sql, params = _union(
+        conn, "water_samples",
+        f"SELECT {', '.join('w.' + c for c in LATEST_WATER_COLUMNS)}, l.anomalies "
+        f"FROM water_latest l JOIN {{table}} w ON w.sample_id = l.sample_id{where}",
+        params, {"ids": (first - 1 if first is not None else None, None)},
+    )
+    df = pd.read_sql_query(f"SELECT * FROM ({sql}) ORDER BY zone", conn, params=params)
+    return compact_frame(_typed_timestamps(df))
+
+@backend_api
+def distinct_zones(conn) -> list:
+    sources = _sources(conn, "households") + _sources(conn, "water_samples")
+    rows = conn.execute(
+        " UNION ".join(f"SELECT zone FROM {s} WHERE zone IS NOT NULL" for s in sources) + " ORDER BY zone"
+    ).fetchall()
+    return [r[0] for r in rows]
+
+@backend_api
+def date_bounds(conn):
+    """(min, max) des dates de collecte: ménages d'abord, sinon prélèvements d'eau."""
+    for table in ("households", "water_samples"):
+        # Archives: bornes lues dans le catalogue, sans ouvrir les fichiers
+        dmin, dmax = conn.execute(
+            f"SELECT MIN(lo), MAX(hi) FROM (SELECT MIN(collected_ts) AS lo, MAX(collected_ts) AS hi FROM {table} "
+            "UNION ALL SELECT MIN(ts_min), MAX(ts_max) FROM partitions WHERE table_name = ?)", (table,)
+        ).fetchone()
+        if dmin is not None:
+            return pd.to_datetime(dmin, unit="s").date(), pd.to_datetime(dmax, unit="s").date()
+    return None, None
+
+@backend_api
 def insert_household(conn, row: dict):
     cols = ", ".join(row.keys())
     placeholders = ", ".join(["?"]*len(row))
     cur = conn.cursor()
     cur.execute(f"INSERT INTO households ({cols}) VALUES ({placeholders})", list(row.values()))
+    bump_version(conn, "households", append="household_id" not in row)
     conn.commit()
 
+@backend_api
 def insert_water_sample(conn, row: dict):
+    # risk_level est toujours recalculé avec le profil actif (risk_rules)
+    row = dict(row, risk_level=risk_rules.classify(pd.DataFrame([row]))[0])
     cols = ", ".join(row.keys())
     placeholders = ", ".join(["?"]*len(row))
+    last = _last_id(conn, "water_samples")
     cur = conn.cursor()
     cur.execute(f"INSERT INTO water_samples ({cols}) VALUES ({placeholders})", list(row.values()))
-    conn.commit()
\ No newline at end of file
+    _score_water(conn, last)
+    bump_version(conn, "water_samples", append="sample_id" not in row)
+    conn.commit()
+
+# ------------------ Ingestion en masse ------------------
+
+@backend_api
+def insertable_columns(conn, table: str) -> list:
+    """Colonnes acceptées en écriture (hors clé primaire et colonnes générées)."""
+    return [r[1] for r in _table_info(conn, table) if not r[5]]
+
+@backend_api
+def required_columns(conn, table: str) -> list:
+    """Colonnes NOT NULL sans valeur par défaut."""
+    return [r[1] for r in _table_info(conn, table) if r[3] and r[4] is None and not r[5]]
+
+def _frame_rows(df):
+    # Scalaires Python via tolist() (sqlite3 refuse les entiers NumPy);
+    # NaN est stocké NULL par SQLite, les autres manquants passent à None.
+    columns = []
+    for c in df.columns:
+        col = df[c]
+        if col.dtype.kind not in "iufb":
+            col = col.astype(object).where(col.notna(), None)
+        columns.append(col.tolist())
+    return list(df.columns), zip(*columns)
+
+def _dict_rows(rows):
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    cols = list(first.keys())
+
+    def tuples():
+        yield tuple(first[c] for c in cols)
+        for r in rows:
+            yield tuple(r.get(c) for c in cols)
+
+    return cols, tuples()
+
+def _last_id(conn, table: str):
+    # Transaction ouverte avant de lire l'id max: les lignes du lot sont
+    # exactement celles d'id supérieur, même avec d'autres écrivains
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    return conn.execute(_max_id_sql(table)).fetchone()[0]
+
+def _insert_many(conn, table: str, rows) -> int:
+    cols, params = _frame_rows(rows) if isinstance(rows, pd.DataFrame) else _dict_rows(rows)
+    if not cols:
+        return 0
+    # Clé primaire acceptée (copie entre bases); colonnes générées refusées
+    unknown = set(cols) - set(table_columns(conn, table)) - set(DERIVED_COLUMNS[table])
+    if unknown:
+        raise ValueError(f"Colonnes inconnues pour {table}: {', '.join(sorted(unknown))}")
+    sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['?']*len(cols))})"
+
+    # Une seule transaction (un seul fsync) pour tout le lot
+    with conn:
+        scored = table == "water_samples"
+        last = _last_id(conn, table) if scored else None
+        cur = conn.executemany(sql, params)
+        if scored:
+            _score_water(conn, last)
+        # Identifiants explicites: possiblement sous l'id max, pas un simple ajout
+        bump_version(conn, table, append=PRIMARY_KEYS[table] not in cols)
+    return cur.rowcount
+
+def _needs_mask_of(row: dict) -> int:
+    mask = 0
+    for i, c in enumerate(NEED_COLUMNS):
+        try:
+            if row.get(c) is not None and float(row[c]) != 0:
+                mask |= 1 << i
+        except (TypeError, ValueError):
+            pass  # valeur non numérique: le trigger tranche
+    return mask
+
+def _with_needs_mask(rows):
+    # needs_mask calculé avant l'insertion: les triggers n'ont rien à corriger
+    if isinstance(rows, pd.DataFrame):
+        mask = np.zeros(len(rows), dtype=np.int64)
+        for i, c in enumerate(NEED_COLUMNS):
+            if c in rows.columns:
+                mask |= (pd.to_numeric(rows[c], errors="coerce").fillna(0).to_numpy() != 0).astype(np.int64) << i
+        return rows.assign(needs_mask=mask)
+    return (dict(r, needs_mask=_needs_mask_of(r)) for r in rows)
+
+@backend_api
+def insert_households_many(conn, rows) -> int:
+    """Insère un itérable de dicts (mêmes clés que insert_household) ou un DataFrame, en une transaction."""
+    return _insert_many(conn, "households", _with_needs_mask(rows))
+
+@backend_api
+def insert_water_samples_many(conn, rows, classify: bool = True) -> int:
+    """Insère un itérable de dicts (mêmes clés que insert_water_sample) ou un DataFrame, en une transaction.
+
+    Le lot est classé en une passe vectorisée (profil actif de risk_rules):
+    le risk_level fourni par l'appelant est ignoré. `classify=False` le garde
+    tel quel (copie de base, import de données déjà classées).
+    """
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    if df.empty:
+        return 0
+    if classify:
+        df = df.assign(risk_level=risk_rules.classify(df))
+    return _insert_many(conn, "water_samples", df)
+
+# ------------------ Niveau de risque (eau) ------------------
+
+@backend_api
+def reclassify_water(conn, profile: dict = None, dry_run: bool = False):
+    """Reclasse tout l'historique water_samples avec `profile` (défaut: profil actif).
+
+    Une requête UPDATE ... CASE côté SQLite, sans aller-retour Python par
+    ligne. Retourne les transitions (before, after, samples); avec dry_run,
+    rien n'est écrit. Les archives sont reclassées d'abord, chacune par sa
+    propre connexion: une interruption se rattrape en relançant la commande.
+    """
+    case, params = risk_rules.case_sql(profile)
+    source, source_params = _union(conn, "water_samples", f"SELECT risk_level AS before, {case} AS after FROM {{table}}", params)
+    transitions = f"""
+        SELECT before, after, COUNT(*) AS samples
+        FROM ({source})
+        WHERE before IS NOT after
+        GROUP BY before, after
+        ORDER BY samples DESC
+    """
+    if dry_run:
+        return pd.read_sql_query(transitions, conn, params=source_params)
+    update = f"UPDATE water_samples SET risk_level = {case} WHERE risk_level IS NOT ({case})"
+    changes = pd.read_sql_query(transitions, conn, params=source_params)
+    if changes.empty:
+        return changes
+    base = _main_path(conn).parent
+    for (path,) in conn.execute("SELECT DISTINCT path FROM partitions WHERE table_name = 'water_samples'").fetchall():
+        arch = sqlite3.connect(str(base / path))
+        try:
+            with arch:
+                arch.execute(update, params + params)
+        finally:
+            arch.close()
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        cur.execute(update, params + params)
+        bump_version(conn, "water_samples")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return changes
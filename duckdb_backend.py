@@ -0,0 +1,621 @@
+"""
+Backend DuckDB: même interface que database.py (database.BACKEND_API), sur un
+fichier local .duckdb stocké en colonnes.
+
+Les clauses WHERE et le classement du risque sont partagés avec le backend
+SQLite; les résultats passent par Arrow vers pandas. Pas de table de rollup ni
+de triggers: l'agrégat zone × jour × vulnérabilité × besoins est calculé à la
+volée par DuckDB, ce qui reste rapide sur un scan de quelques colonnes. Les
+référentiels qualité de l'eau (baselines.py) sont, comme côté SQLite, tenus à
+jour dans la transaction d'insertion. Les années archivées (rollover_partition)
+sont des fichiers Parquet, relus par read_parquet selon le même catalogue
+`partitions` que côté SQLite.
+
+Activé par GANVIE_BACKEND=duckdb (ou tout chemin de base en .duckdb).
+Nécessite les paquets duckdb et pyarrow. DuckDB n'ouvre un fichier en
+écriture que depuis un seul processus à la fois.
+"""
+import threading
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import baselines
+import database as db
+import risk_rules
+
+# 2: colonne générée households.needs_mask
+# 3: référentiels qualité de l'eau (water_baselines, water_alerts, water_latest)
+# 4: catalogue des archives Parquet (partitions)
+SCHEMA_VERSION = 4
+
+# Identifiants attribués à l'insertion (sous le verrou d'écriture): pas de
+# contrainte PRIMARY KEY, dont l'index ralentirait les chargements massifs.
+PRIMARY_KEYS = {"households": "household_id", "water_samples": "sample_id"}
+GENERATED = {"collected_ts", "needs_mask"}
+TS_COLUMN = "collected_ts BIGINT GENERATED ALWAYS AS (CAST(floor(epoch(collected_at)) AS BIGINT)) VIRTUAL"
+NEEDS_MASK_COLUMN = f"needs_mask BIGINT GENERATED ALWAYS AS (CAST({db._needs_mask_sql()} AS BIGINT)) VIRTUAL"
+
+# Types DuckDB -> types déclarés côté SQLite (column_types est commun aux deux backends)
+AFFINITY = {"BIGINT": "INTEGER", "INTEGER": "INTEGER", "DOUBLE": "REAL", "VARCHAR": "TEXT", "TIMESTAMP": "TEXT"}
+
+# ------------------ Connexions ------------------
+# Une instance DuckDB par fichier et par processus; chaque thread lit via son
+# propre curseur, les écritures passent par un curseur unique sous verrou.
+
+_databases = {}
+_databases_lock = threading.Lock()
+_local = threading.local()
+_writer_conn = {}
+_writer_lock = threading.RLock()
+
+def _database(path: str):
+    import duckdb
+
+    with _databases_lock:
+        conn = _databases.get(path)
+        if conn is None:
+            conn = _databases[path] = duckdb.connect(path)
+        return conn
+
+def get_connection(path):
+    """Curseur lecture-écriture (scripts, migrations, writer du dashboard)."""
+    return _database(str(Path(path).resolve())).cursor()
+
+def reader(path):
+    """Curseur propre au thread courant (réutilisé entre appels)."""
+    path = str(Path(path).resolve())
+    conns = getattr(_local, "readers", None)
+    if conns is None:
+        conns = _local.readers = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = open_reader(path)
+    return conn
+
+def open_reader(path):
+    """Nouveau curseur, pour un seul thread à la fois."""
+    return _database(str(Path(path).resolve())).cursor()
+
+@contextmanager
+def writer(path):
+    path = str(Path(path).resolve())
+    with _writer_lock:
+        conn = _writer_conn.get(path)
+        if conn is None:
+            conn = _writer_conn[path] = get_connection(path)
+        yield conn
+
+@contextmanager
+def _transaction(conn):
+    conn.begin()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# ------------------ Lecture (Arrow -> pandas) ------------------
+
+def _read(conn, sql: str, params=()):
+    res = conn.execute(sql, list(params))
+    fetch = getattr(res, "to_arrow_table", None) or res.fetch_arrow_table
+    return fetch().to_pandas()
+
+def _read_chunks(conn, sql: str, params=(), chunksize: int = 50000):
+    res = conn.execute(sql, list(params))
+    batches = (getattr(res, "to_arrow_reader", None) or res.fetch_record_batch)(chunksize)
+    empty = True
+    for batch in batches:
+        empty = False
+        yield batch.to_pandas()
+    if empty:
+        # comme pandas.read_sql_query: un bloc vide portant les colonnes
+        yield batches.schema.empty_table().to_pandas()
+
+# ------------------ Schéma ------------------
+
+def schema_version(conn) -> int:
+    exists = conn.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'schema_info'").fetchone()[0]
+    if not exists:
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_info").fetchone()
+    return row[0] or 0
+
+def _create_households(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS households (
+            household_id BIGINT NOT NULL,
+            collected_at TIMESTAMP NOT NULL,
+            zone VARCHAR NOT NULL,
+            lat DOUBLE,
+            lon DOUBLE,
+            hh_size BIGINT,
+            main_activity VARCHAR,
+            vulnerability VARCHAR,
+            water_improved BIGINT,
+            sanitation BIGINT,
+            children_schooling BIGINT,
+            health_access BIGINT,
+            needs_water BIGINT,
+            needs_sanitation BIGINT,
+            needs_housing BIGINT,
+            needs_education BIGINT,
+            needs_health BIGINT,
+            needs_economic BIGINT,
+            notes VARCHAR,
+            {TS_COLUMN},
+            {NEEDS_MASK_COLUMN}
+        )""")
+
+def _upgrade_households(conn):
+    # DuckDB n'ajoute pas de colonne générée à une table existante: la table
+    # est recréée avec needs_mask et les lignes recopiées (identifiants conservés)
+    columns = ", ".join(table_columns(conn, "households"))
+    conn.execute("ALTER TABLE households RENAME TO households_v1")
+    _create_households(conn)
+    conn.execute(f"INSERT INTO households ({columns}) SELECT {columns} FROM households_v1")
+    conn.execute("DROP TABLE households_v1")
+
+def _create_baselines(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS water_baselines (
+        zone VARCHAR NOT NULL,
+        season VARCHAR NOT NULL,
+        measure VARCHAR NOT NULL,
+        n BIGINT NOT NULL,
+        mean DOUBLE NOT NULL,
+        m2 DOUBLE NOT NULL,
+        PRIMARY KEY (zone, season, measure)
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS water_alerts (
+        sample_id BIGINT NOT NULL,
+        zone VARCHAR NOT NULL,
+        season VARCHAR,
+        collected_ts BIGINT,
+        measure VARCHAR NOT NULL,
+        value DOUBLE NOT NULL,
+        expected DOUBLE NOT NULL,
+        z DOUBLE NOT NULL,
+        PRIMARY KEY (sample_id, measure)
+    )""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS water_latest (
+        zone VARCHAR PRIMARY KEY,
+        sample_id BIGINT NOT NULL,
+        collected_ts BIGINT,
+        anomalies BIGINT NOT NULL
+    )""")
+
+def _create_partitions(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS partitions (
+        name VARCHAR NOT NULL,
+        table_name VARCHAR NOT NULL,
+        generation BIGINT NOT NULL,
+        path VARCHAR NOT NULL,       -- fichier Parquet, relatif au dossier de la base
+        row_count BIGINT NOT NULL,
+        ts_min BIGINT NOT NULL,
+        ts_max BIGINT NOT NULL,
+        id_min BIGINT NOT NULL,
+        id_max BIGINT NOT NULL,
+        archived_at VARCHAR NOT NULL,
+        PRIMARY KEY (name, table_name)
+    )""")
+
+def init_db(conn):
+    version = schema_version(conn)
+    with _transaction(conn):
+        if 0 < version < 2:
+            _upgrade_households(conn)
+        _create_households(conn)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS water_samples (
+            sample_id BIGINT NOT NULL,
+            collected_at TIMESTAMP NOT NULL,
+            zone VARCHAR NOT NULL,
+            lat DOUBLE,
+            lon DOUBLE,
+            season VARCHAR,
+            ph DOUBLE,
+            turbidity DOUBLE,
+            conductivity DOUBLE,
+            e_coli BIGINT,
+            coliforms BIGINT,
+            risk_level VARCHAR,
+            comments VARCHAR,
+            {TS_COLUMN}
+        )""")
+        _create_baselines(conn)
+        if 0 < version < 3:
+            _fill_baselines(conn)
+        _create_partitions(conn)
+        conn.execute("CREATE TABLE IF NOT EXISTS targets (id INTEGER PRIMARY KEY, households_target BIGINT, updated_at VARCHAR)")
+        conn.execute("CREATE TABLE IF NOT EXISTS data_versions (name VARCHAR PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)")
+        conn.execute("ALTER TABLE data_versions ADD COLUMN IF NOT EXISTS rewrites BIGINT DEFAULT 0")
+        for name in ("households", "water_samples", "targets"):
+            conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES (?, 0)", [name])
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_info (version INTEGER)")
+        if schema_version(conn) < SCHEMA_VERSION:
+            conn.execute("INSERT INTO schema_info VALUES (?)", [SCHEMA_VERSION])
+        conn.execute("INSERT OR IGNORE INTO targets (id, households_target, updated_at) VALUES (1, 1000, ?)", [datetime.now().isoformat()])
+
+# ------------------ Data access helpers ------------------
+
+def bump_version(conn, table: str, append: bool = False):
+    conn.execute(
+        "UPDATE data_versions SET version = version + 1, rewrites = COALESCE(rewrites, 0) + ? WHERE name = ?",
+        [0 if append else 1, table],
+    )
+
+_IDENTITIES = weakref.WeakKeyDictionary()  # la requête coûte ~0,4 ms: une fois par connexion
+
+def database_identity(conn):
+    identity = _IDENTITIES.get(conn)
+    if identity is None:
+        row = conn.execute("SELECT path FROM duckdb_databases() WHERE database_name = current_database()").fetchone()
+        identity = _IDENTITIES[conn] = ("duckdb", str(Path(row[0]).resolve()) if row[0] else id(conn))
+    return identity
+
+def data_version(conn, table: str):
+    row = conn.execute(
+        f"SELECT (SELECT version FROM data_versions WHERE name = ?), (SELECT MAX(rowid) FROM {table})",
+        [table],
+    ).fetchone()
+    return tuple(row)
+
+def delta_version(conn, table: str):
+    row = conn.execute(
+        f"SELECT (SELECT COALESCE(rewrites, 0) FROM data_versions WHERE name = ?), ({db._max_id_sql(table)})",
+        [table],
+    ).fetchone()
+    return tuple(row)
+
+def upsert_target(conn, households_target: int):
+    with _transaction(conn):
+        conn.execute("UPDATE targets SET households_target = ?, updated_at = ? WHERE id = 1", [households_target, datetime.now().isoformat()])
+        bump_version(conn, "targets")
+
+def get_target(conn) -> int:
+    row = conn.execute("SELECT households_target FROM targets WHERE id = 1").fetchone()
+    return int(row[0]) if row else 1000
+
+def households_df(conn):
+    return db.compact_frame(_read(conn, *_union(conn, "households", "SELECT * FROM {table}", [])))
+
+def water_df(conn):
+    return db.compact_frame(_read(conn, *_union(conn, "water_samples", "SELECT * FROM {table}", [])))
+
+# ------------------ Partitions (archives Parquet) ------------------
+# Même catalogue et même routage que database.py: une année close est copiée
+# dans un fichier Parquet par table (colonnes générées comprises, valeurs
+# figées), supprimée de la base, et relue par read_parquet quand une requête
+# recoupe sa période ou sa tranche d'ids.
+
+def _main_path(conn) -> Path:
+    row = conn.execute("SELECT path FROM duckdb_databases() WHERE database_name = current_database()").fetchone()
+    return Path(row[0]).resolve()
+
+def _literal(path) -> str:
+    return "'" + str(path).replace("'", "''") + "'"
+
+def _parquet(path) -> str:
+    return f"read_parquet({_literal(path)})"
+
+def _copy_to(conn, sql: str, path: Path, params: list):
+    conn.execute(f"COPY ({sql}) TO {_literal(path)} (FORMAT PARQUET)", params)
+
+def _sources(conn, table: str, filters: dict = None) -> list:
+    where, params = db.partitions_where(table, filters or {})
+    rows = conn.execute(f"SELECT path FROM partitions{where} ORDER BY name", params).fetchall()
+    if not rows:
+        return [table]
+    base = _main_path(conn).parent
+    return [table] + [_parquet(base / path) for (path,) in rows]
+
+def _union(conn, table: str, sql: str, params: list, filters: dict = None):
+    sources = _sources(conn, table, filters)
+    return " UNION ALL BY NAME ".join(sql.replace("{table}", s) for s in sources), list(params) * len(sources)
+
+def rollover_partition(conn, year: int, vacuum: bool = False) -> dict:
+    if year >= datetime.now().year:
+        raise ValueError(f"L'année {year} n'est pas close: seules les années passées sont archivées.")
+    lo, hi = db.year_bounds(year)
+    main = _main_path(conn)
+    previous = dict(conn.execute("SELECT table_name, path FROM partitions WHERE name = ?", [str(year)]).fetchall())
+    generation = (conn.execute("SELECT MAX(generation) FROM partitions WHERE name = ?", [str(year)]).fetchone()[0] or 0) + 1
+    paths = {t: Path(db.ARCHIVE_DIR) / f"{main.stem}.{year}.g{generation}.{t}.parquet" for t in db.PARTITIONED}
+    (main.parent / db.ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    hot = {}
+    try:
+        with _transaction(conn):
+            now = datetime.now().isoformat(timespec="seconds")
+            conn.execute("DELETE FROM partitions WHERE name = ?", [str(year)])
+            for table in db.PARTITIONED:
+                pk = PRIMARY_KEYS[table]
+                rows = f"SELECT * FROM {table} WHERE collected_ts >= ? AND collected_ts < ?"
+                if table in previous:
+                    rows = f"SELECT * FROM {_parquet(main.parent / previous[table])} UNION ALL BY NAME {rows}"
+                hot[table] = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE collected_ts >= ? AND collected_ts < ?", [lo, hi]).fetchone()[0]
+                expected = conn.execute(f"SELECT COUNT(*) FROM ({rows})", [lo, hi]).fetchone()[0]
+                if not expected:
+                    continue
+                # Fichier trié par identifiant (lectures par tranche d'ids, statistiques des row groups)
+                _copy_to(conn, f"{rows} ORDER BY {pk}", main.parent / paths[table], [lo, hi])
+                stats = conn.execute(
+                    f"SELECT COUNT(*), MIN(collected_ts), MAX(collected_ts), MIN({pk}), MAX({pk}) "
+                    f"FROM {_parquet(main.parent / paths[table])}"
+                ).fetchone()
+                if stats[0] != expected:
+                    raise RuntimeError(f"Archive {paths[table]}: {stats[0]} lignes copiées, {expected} attendues")
+                conn.execute(f"DELETE FROM {table} WHERE collected_ts >= ? AND collected_ts < ?", [lo, hi])
+                conn.execute("INSERT INTO partitions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [str(year), table, generation, paths[table].as_posix(), *stats, now])
+                bump_version(conn, table)
+    except Exception:
+        for path in paths.values():
+            (main.parent / path).unlink(missing_ok=True)
+        raise
+    # Catalogue validé: l'ancienne génération n'est plus lue
+    for path in previous.values():
+        (main.parent / path).unlink(missing_ok=True)
+    if vacuum:
+        conn.execute("CHECKPOINT")
+    return dict(hot, path=str(main.parent / db.ARCHIVE_DIR))
+
+def list_partitions(conn):
+    df = _read(conn, "SELECT name, table_name, generation, path, row_count, ts_min, ts_max, id_min, id_max, archived_at "
+                     "FROM partitions ORDER BY name, table_name")
+    for c in ("ts_min", "ts_max"):
+        df[c] = pd.to_datetime(df[c], unit="s")
+    return df
+
+# ------------------ Filtres ------------------
+
+def _table_info(conn, table: str):
+    return [r for r in conn.execute(f"PRAGMA table_info('{table}')").fetchall() if r[1] not in GENERATED]
+
+def table_columns(conn, table: str) -> list:
+    return [r[1] for r in _table_info(conn, table)]
+
+def column_types(conn, table: str) -> dict:
+    return {r[1]: AFFINITY.get(r[2].upper(), r[2].upper()) for r in _table_info(conn, table)}
+
+def insertable_columns(conn, table: str) -> list:
+    return [c for c in table_columns(conn, table) if c != PRIMARY_KEYS.get(table)]
+
+def required_columns(conn, table: str) -> list:
+    return [r[1] for r in _table_info(conn, table) if r[3] and r[1] != PRIMARY_KEYS.get(table)]
+
+def _select(conn, table: str, where: str, params: list, columns, filters: dict):
+    # Sans ORDER BY, DuckDB rend les lignes dans l'ordre d'insertion (base, puis archives)
+    return _union(conn, table, f"SELECT {db._select_list(conn, table, columns)} FROM {{table}}{where}", params, filters)
+
+def query_households(conn, filters: dict, columns=None):
+    where, params = db.households_where(filters)
+    return db.compact_frame(db._typed_timestamps(_read(conn, *_select(conn, "households", where, params, columns, filters))))
+
+def query_water(conn, filters: dict, columns=None):
+    where, params = db.water_where(filters)
+    return db.compact_frame(db._typed_timestamps(_read(conn, *_select(conn, "water_samples", where, params, columns, filters))))
+
+def iter_households(conn, filters: dict, columns=None, chunksize: int = 50000):
+    where, params = db.households_where(filters)
+    for chunk in _read_chunks(conn, *_select(conn, "households", where, params, columns, filters), chunksize):
+        yield db._typed_timestamps(chunk)
+
+def iter_water(conn, filters: dict, columns=None, chunksize: int = 50000):
+    where, params = db.water_where(filters)
+    for chunk in _read_chunks(conn, *_select(conn, "water_samples", where, params, columns, filters), chunksize):
+        yield db._typed_timestamps(chunk)
+
+def distinct_zones(conn) -> list:
+    sources = _sources(conn, "households") + _sources(conn, "water_samples")
+    rows = conn.execute(
+        " UNION ".join(f"SELECT zone FROM {s} WHERE zone IS NOT NULL" for s in sources) + " ORDER BY zone"
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def date_bounds(conn):
+    for table in ("households", "water_samples"):
+        dmin, dmax = conn.execute(
+            f"SELECT MIN(lo), MAX(hi) FROM (SELECT MIN(collected_ts) AS lo, MAX(collected_ts) AS hi FROM {table} "
+            "UNION ALL SELECT MIN(ts_min), MAX(ts_max) FROM partitions WHERE table_name = ?)", [table]
+        ).fetchone()
+        if dmin is not None:
+            return pd.to_datetime(dmin, unit="s").date(), pd.to_datetime(dmax, unit="s").date()
+    return None, None
+
+# ------------------ Agrégat zone × jour (calculé à la volée) ------------------
+
+def _rollup_sql(conn, filters: dict = None) -> str:
+    key = [
+        "h.zone",
+        "COALESCE(strftime(h.collected_at, '%Y-%m-%d'), '')",
+        "COALESCE(h.vulnerability, '')",
+        "h.needs_mask",
+    ]
+    sums = [f"CAST(SUM(COALESCE(h.{c}, 0)) AS BIGINT) AS {c}" for c in db.ROLLUP_SUMS]
+    # Archives limitées à la période des filtres
+    source, _ = _union(conn, "households", "SELECT * FROM {table}", [], {k: (filters or {}).get(k) for k in ("start", "end")})
+    return (
+        f"SELECT {', '.join(f'{e} AS {k}' for k, e in zip(db.ROLLUP_KEY, key))}, COUNT(*) AS households, {', '.join(sums)} "
+        f"FROM ({source}) h GROUP BY ALL"
+    )
+
+def query_rollup(conn, filters: dict):
+    where, params = db.rollup_where(filters)
+    popcount = " + ".join(f"((needs_mask >> {i}) & 1)" for i in range(len(db.NEED_COLUMNS)))
+    df = _read(
+        conn,
+        f"SELECT zone, day, vulnerability, needs_mask, CAST({popcount} AS BIGINT) AS need_count, households, "
+        f"{', '.join(db.ROLLUP_SUMS)} FROM ({_rollup_sql(conn, filters)}){where} ORDER BY zone, day, vulnerability, needs_mask",
+        params,
+    )
+    df["day"] = pd.to_datetime(df["day"], format="%Y-%m-%d", errors="coerce")
+    return df
+
+def rebuild_rollup(conn) -> int:
+    # Rien à reconstruire: retourne le nombre de cellules de l'agrégat
+    return conn.execute(f"SELECT COUNT(*) FROM ({_rollup_sql(conn)})").fetchone()[0]
+
+@contextmanager
+def deferred_rollup(conn, journal: bool = True):
+    yield conn
+
+# ------------------ Référentiels qualité de l'eau ------------------
+
+def _score_water(conn, after_id=None) -> int:
+    where, params = (" WHERE sample_id > ?", [after_id]) if after_id is not None else ("", [])
+    sql, params = _union(conn, "water_samples", f"SELECT {', '.join(baselines.SAMPLE_COLUMNS)} FROM {{table}}{where}",
+                         params, {"ids": (after_id, None)})
+    samples = _read(conn, f"SELECT * FROM ({sql}) ORDER BY sample_id", params)
+    if samples.empty:
+        return 0
+    state = _read(conn, f"SELECT {', '.join(baselines.STATE_COLUMNS)} FROM water_baselines")
+    state, alerts, latest = baselines.score(state, samples)
+    alerts["season"] = alerts["season"].where(alerts["season"] != "", None)
+
+    upserts = [
+        ("water_baselines", state, "ON CONFLICT DO UPDATE SET n = excluded.n, mean = excluded.mean, m2 = excluded.m2"),
+        ("water_latest", latest,
+         "ON CONFLICT DO UPDATE SET sample_id = excluded.sample_id, collected_ts = excluded.collected_ts, "
+         "anomalies = excluded.anomalies WHERE excluded.collected_ts > water_latest.collected_ts "
+         "OR (excluded.collected_ts = water_latest.collected_ts AND excluded.sample_id > water_latest.sample_id)"),
+    ]
+    if len(alerts):
+        upserts.append(("water_alerts", alerts, "ON CONFLICT DO UPDATE SET "
+                        + ", ".join(f"{c} = excluded.{c}" for c in baselines.ALERT_COLUMNS if c not in ("sample_id", "measure"))))
+    for table, df, conflict in upserts:
+        cols = ", ".join(df.columns)
+        conn.register("_batch", df)
+        try:
+            conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM _batch {conflict}")
+        finally:
+            conn.unregister("_batch")
+    return len(alerts)
+
+def _fill_baselines(conn) -> int:
+    for table in ("water_baselines", "water_alerts", "water_latest"):
+        conn.execute(f"DELETE FROM {table}")
+    return _score_water(conn)
+
+def rebuild_baselines(conn) -> int:
+    with _transaction(conn):
+        alerts = _fill_baselines(conn)
+        bump_version(conn, "water_samples", append=True)
+    return alerts
+
+def query_alerts(conn, filters: dict, limit: int = None):
+    where, params = db.water_where(filters)
+    sql = (f"SELECT {', '.join(baselines.ALERT_COLUMNS)} FROM water_alerts{where} "
+           "ORDER BY collected_ts DESC, sample_id DESC, measure")
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [int(limit)]
+    return db.compact_frame(db._typed_timestamps(_read(conn, sql, params)))
+
+def latest_water(conn, filters: dict):
+    clauses, params = [], []
+    if filters.get("zones") is not None:
+        db._in_clause("l.zone", filters["zones"], clauses, params)
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    # Seules les archives qui contiennent un des derniers prélèvements sont lues
+    first = conn.execute(f"SELECT MIN(l.sample_id) FROM water_latest l{where}", params).fetchone()[0]
+    sql, params = _union(
+        conn, "water_samples",
+        f"SELECT {', '.join('w.' + c for c in db.LATEST_WATER_COLUMNS)}, l.anomalies "
+        f"FROM water_latest l JOIN {{table}} w ON w.sample_id = l.sample_id{where}",
+        params, {"ids": (first - 1 if first is not None else None, None)},
+    )
+    df = _read(conn, f"SELECT * FROM ({sql}) ORDER BY zone", params)
+    return db.compact_frame(db._typed_timestamps(df))
+
+# ------------------ Écritures ------------------
+
+def _insert_frame(conn, table: str, df) -> int:
+    if df.empty:
+        return 0
+    pk = PRIMARY_KEYS[table]
+    unknown = set(df.columns) - set(table_columns(conn, table))
+    if unknown:
+        raise ValueError(f"Colonnes inconnues pour {table}: {', '.join(sorted(unknown))}")
+    append = pk not in df.columns
+    with _transaction(conn):
+        # Id max archives comprises: un identifiant archivé n'est jamais réattribué
+        last = conn.execute(f"SELECT COALESCE(({db._max_id_sql(table)}), 0)").fetchone()[0]
+        if append:
+            df = df.assign(**{pk: np.arange(last + 1, last + 1 + len(df), dtype=np.int64)})
+        cols = ", ".join(df.columns)
+        # Lot lu directement par DuckDB (scan pandas), conversions de type à l'insertion
+        conn.register("_batch", df)
+        try:
+            conn.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM _batch")
+        finally:
+            conn.unregister("_batch")
+        if table == "water_samples":
+            _score_water(conn, last)
+        bump_version(conn, table, append=append)
+    return len(df)
+
+def _frame(rows):
+    return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+
+def insert_household(conn, row: dict):
+    _insert_frame(conn, "households", pd.DataFrame([row]))
+
+def insert_water_sample(conn, row: dict):
+    insert_water_samples_many(conn, [row])
+
+def insert_households_many(conn, rows) -> int:
+    return _insert_frame(conn, "households", _frame(rows))
+
+def insert_water_samples_many(conn, rows, classify: bool = True) -> int:
+    df = _frame(rows)
+    if df.empty:
+        return 0
+    if classify:
+        df = df.assign(risk_level=risk_rules.classify(df))
+    return _insert_frame(conn, "water_samples", df)
+
+def reclassify_water(conn, profile: dict = None, dry_run: bool = False):
+    case, params = risk_rules.case_sql(profile)
+    source, source_params = _union(conn, "water_samples", f"SELECT risk_level AS before, {case} AS after FROM {{table}}", params)
+    transitions = f"""
+        SELECT before, after, COUNT(*) AS samples
+        FROM ({source})
+        WHERE before IS DISTINCT FROM after
+        GROUP BY before, after
+        ORDER BY samples DESC
+    """
+    if dry_run:
+        return _read(conn, transitions, source_params)
+    base = _main_path(conn).parent
+    replaced = {}
+    try:
+        with _transaction(conn):
+            changes = _read(conn, transitions, source_params)
+            if len(changes):
+                # Un fichier Parquet ne se modifie pas: chaque archive est réécrite (génération suivante)
+                archives = conn.execute("SELECT name, generation, path FROM partitions WHERE table_name = 'water_samples'").fetchall()
+                for name, generation, path in archives:
+                    new = Path(path).with_name(Path(path).name.replace(f".g{generation}.", f".g{generation + 1}."))
+                    _copy_to(conn, f"SELECT * REPLACE ({case} AS risk_level) FROM {_parquet(base / path)}", base / new, params)
+                    replaced[base / path] = base / new
+                    conn.execute("UPDATE partitions SET generation = ?, path = ? WHERE name = ? AND table_name = 'water_samples'",
+                                 [generation + 1, new.as_posix(), name])
+                conn.execute(f"UPDATE water_samples SET risk_level = {case} WHERE risk_level IS DISTINCT FROM ({case})", params + params)
+                bump_version(conn, "water_samples")
+    except Exception:
+        for new in replaced.values():
+            new.unlink(missing_ok=True)
+        raise
+    for old in replaced:
+        old.unlink(missing_ok=True)
+    return changes
@@ -0,0 +1,158 @@
+"""
+Exports des données filtrées, produits à la demande.
+
+Les lignes sont lues par blocs directement depuis la requête SQLite
+correspondant aux filtres courants (db.iter_households / db.iter_water) et
+écrites au fil de l'eau: la mémoire reste bornée par la taille d'un bloc.
+Formats: CSV, CSV compressé gzip, Parquet (nécessite pyarrow).
+
+Les exports préparés par le dashboard sont gardés dans .cache/exports, un
+fichier par table × filtres × format × version des données, purgé par âge
+et par taille totale comme le cache des notes PDF.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+import database as db
+
+CHUNK_SIZE = 50000
+CACHE_DIR = os.path.join(".cache", "exports")
+MAX_AGE_S = 24 * 3600
+MAX_CACHE_BYTES = 500 * 1024 * 1024
+
+FORMATS = {
+    "csv": dict(label="CSV", ext="csv", mime="text/csv"),
+    "csv.gz": dict(label="CSV compressé (gzip)", ext="csv.gz", mime="application/gzip"),
+    "parquet": dict(label="Parquet", ext="parquet", mime="application/vnd.apache.parquet"),
+}
+
+ITERATORS = {
+    "households": db.iter_households,
+    "water_samples": db.iter_water,
+}
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def available_formats() -> list:
+    return [f for f in FORMATS if f != "parquet" or parquet_available()]
+
+# ------------------ Écrivains ------------------
+
+def _write_csv(chunks, f, columns: list) -> int:
+    rows, header = 0, True
+    for chunk in chunks:
+        chunk.to_csv(f, index=False, header=header)
+        rows += len(chunk)
+        header = False
+    if header:
+        # Aucune ligne: l'en-tête seul, pour un CSV qui décrit encore ses colonnes
+        pd.DataFrame(columns=columns).to_csv(f, index=False)
+    return rows
+
+def _arrow_schema(conn, table: str):
+    import pyarrow as pa
+
+    # Schéma fixé par les types déclarés (et non déduit du premier bloc, où
+    # une colonne entièrement vide serait typée null)
+    mapping = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string()}
+    fields = []
+    for name, decl in db.column_types(conn, table).items():
+        typ = pa.timestamp("s") if name == "collected_at" else mapping.get(decl, pa.string())
+        fields.append(pa.field(name, typ))
+    return pa.schema(fields)
+
+def _write_parquet(conn, table: str, chunks, path: str) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(conn, table)
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            # un row group par bloc
+            writer.write_table(pa.Table.from_pandas(chunk[schema.names], schema=schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+def export_to_path(conn, table: str, filters: dict, fmt: str, path: str, chunksize: int = CHUNK_SIZE) -> dict:
+    """Écrit l'export filtré de `table` dans `path`. Retourne lignes, octets et durée."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu: {fmt}")
+    t0 = time.perf_counter()
+    chunks = ITERATORS[table](conn, filters, chunksize=chunksize)
+    if fmt == "parquet":
+        rows = _write_parquet(conn, table, chunks, path)
+    elif fmt == "csv.gz":
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+            rows = _write_csv(chunks, f, db.table_columns(conn, table))
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            rows = _write_csv(chunks, f, db.table_columns(conn, table))
+    return dict(rows=rows, bytes=os.path.getsize(path), seconds=time.perf_counter() - t0, path=path)
+
+# ------------------ Cache disque ------------------
+
+def export_key(conn, table: str, filters: dict, fmt: str) -> str:
+    """Hash de la table, des filtres, du format et de la version des données."""
+    payload = json.dumps({"table": table, "filters": filters, "fmt": fmt, "version": db.data_version(conn, table)},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+def purge_cache(max_age_s: float = MAX_AGE_S, max_bytes: int = MAX_CACHE_BYTES):
+    """Supprime les exports trop anciens, puis les plus anciens jusqu'à repasser sous max_bytes."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    now = time.time()
+    files = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+            if now - st.st_mtime > max_age_s:
+                os.remove(path)
+            else:
+                files.append((st.st_mtime, st.st_size, path))
+        except FileNotFoundError:
+            pass  # purgé par un autre processus
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def export_to_cache(conn, table: str, filters: dict, fmt: str) -> dict:
+    """Écrit l'export dans .cache/exports (après purge); retourne aussi sa clé."""
+    purge_cache()
+    key = export_key(conn, table, filters, fmt)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{table}_{key}.{FORMATS[fmt]['ext']}")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        res = export_to_path(conn, table, filters, fmt, tmp)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    # Remplacement atomique: une autre session peut servir le même fichier
+    os.replace(tmp, path)
+    return dict(res, path=path, key=key)
+
+def human_size(n: int) -> str:
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if n < 1024 or unit == "Go":
+            return f"{n:.0f} {unit}" if unit == "o" else f"{n:.1f} {unit}"
+        n /= 1024
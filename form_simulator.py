@@ -0,0 +1,209 @@
+"""
+Serveur de formulaires simulé: envoie des soumissions Kobo/ODK au service
+d'ingestion (ingest.py) pour le tester en charge, entièrement en local.
+
+Les soumissions reprennent les distributions du générateur de démo
+(seed_data), au format webhook Kobo (champs préfixés par leur groupe,
+métadonnées _id, _uuid, meta/instanceID...). Plusieurs enquêteurs
+concurrents postent sur des connexions persistantes; une réponse 503 est
+réessayée après Retry-After.
+
+    python ingest.py --db /tmp/charge.db &
+    python form_simulator.py --households 20000 --samples 2000 --concurrency 32
+    python form_simulator.py --rate 200 --invalid-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlparse
+
+import numpy as np
+
+import seed_data
+
+GROUPS = {
+    "households": {
+        "identification": ["collected_at", "zone", "lat", "lon"],
+        "menage": ["hh_size", "main_activity", "vulnerability", "notes"],
+        "acces": ["water_improved", "sanitation", "children_schooling", "health_access"],
+    },
+    "water_samples": {
+        "prelevement": ["collected_at", "zone", "lat", "lon", "season"],
+        "mesures": ["ph", "turbidity", "conductivity", "e_coli", "coliforms", "comments"],
+    },
+}
+
+# ------------------ Soumissions ------------------
+
+def kobo_submissions(kind: str, n: int, days: int = 30, seed=None, invalid_rate: float = 0.0):
+    """Liste de (table, soumission JSON) au format webhook Kobo."""
+    rng = np.random.default_rng(seed)
+    start = seed_data.default_start(days)
+    make = seed_data.generate_households if kind == "households" else seed_data.generate_water_samples
+    df = make(n, start, days, rng).drop(columns=["risk_level"], errors="ignore")
+    group_of = {c: g for g, cols in GROUPS[kind].items() for c in cols}
+    invalid = rng.random(n) < invalid_rate
+    out = []
+    for i, rec in enumerate(df.to_dict("records")):
+        sub = {"_id": i + 1, "_uuid": str(uuid.uuid4()), "formhub/uuid": "ganvie-demo",
+               "meta/instanceID": f"uuid:{uuid.uuid4()}", "_submission_time": datetime.now().isoformat(timespec="seconds")}
+        for col, value in rec.items():
+            if value is None:
+                continue
+            sub[f"{group_of[col]}/{col}" if col in group_of else f"besoins/{col}"] = value.item() if hasattr(value, "item") else value
+        if invalid[i]:
+            sub["identification/zone" if kind == "households" else "prelevement/zone"] = None
+        out.append((kind, sub))
+    return out
+
+# ------------------ Client HTTP minimal ------------------
+
+class Connection:
+    """Connexion HTTP/1.1 persistante (keep-alive)."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b"", headers=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        resp_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            resp_headers[name.strip().lower()] = value.strip()
+        payload = await self.reader.readexactly(int(resp_headers.get("content-length", 0)))
+        if resp_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, resp_headers, payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+# ------------------ Charge ------------------
+
+async def run_load(url: str, submissions, concurrency: int = 16, rate: float = None, token: str = None) -> dict:
+    target = urlparse(url)
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    pending = asyncio.Queue()
+    for item in submissions:
+        pending.put_nowait(item)
+    stats = {"status": {}, "retries": 0, "latency_s": []}
+    t_start = time.perf_counter()
+    sent = 0
+
+    async def enumerator():
+        nonlocal sent
+        conn = Connection(target.hostname, target.port or 80)
+        try:
+            while not pending.empty():
+                table, sub = pending.get_nowait()
+                if rate:
+                    # cadence globale: la i-ème soumission part à t0 + i / rate
+                    slot, sent = sent, sent + 1
+                    delay = t_start + slot / rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                body = json.dumps(sub).encode("utf-8")
+                while True:
+                    t0 = time.perf_counter()
+                    status, resp_headers, _ = await conn.request("POST", f"/submissions/{table}", body, headers)
+                    stats["latency_s"].append(time.perf_counter() - t0)
+                    if status != 503:
+                        break
+                    stats["retries"] += 1
+                    await asyncio.sleep(float(resp_headers.get("retry-after", 1)))
+                stats["status"][status] = stats["status"].get(status, 0) + 1
+        finally:
+            conn.close()
+
+    await asyncio.gather(*(enumerator() for _ in range(concurrency)))
+    stats["elapsed_s"] = time.perf_counter() - t_start
+    return stats
+
+async def fetch_metrics(url: str) -> dict:
+    """Métriques du service (lignes sans étiquette + quantiles), pour le rapport final."""
+    target = urlparse(url)
+    conn = Connection(target.hostname, target.port or 80)
+    try:
+        _, _, payload = await conn.request("GET", "/metrics")
+    finally:
+        conn.close()
+    values = {}
+    for line in payload.decode("utf-8").splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            values[name.replace("ganvie_ingest_", "")] = float(value)
+    return values
+
+async def wait_drained(url: str, timeout_s: float = 60.0) -> dict:
+    deadline = time.perf_counter() + timeout_s
+    while True:
+        metrics = await fetch_metrics(url)
+        # file vide ET dernier lot commité: toutes les soumissions acceptées sont écrites
+        written = sum(v for k, v in metrics.items() if k.startswith("rows_written_total"))
+        if written >= metrics.get('submissions_total{status="accepted"}', 0) or time.perf_counter() > deadline:
+            return metrics
+        await asyncio.sleep(0.2)
+
+def report(stats: dict, metrics: dict, total: int):
+    lat = sorted(stats["latency_s"]) or [0.0]
+    ms = lambda v: f"{v * 1000:.1f} ms"
+    print(f"Soumissions: {total} en {stats['elapsed_s']:.2f}s ({total / max(stats['elapsed_s'], 1e-9):,.0f}/s)")
+    print(f"Réponses: {dict(sorted(stats['status'].items()))} | 503 réessayées: {stats['retries']}")
+    print(f"Latence client: p50 {ms(statistics.median(lat))} | p95 {ms(lat[int(0.95 * (len(lat) - 1))])} | max {ms(lat[-1])}")
+    print(f"Service: {int(metrics.get('batches_total', 0))} lots, dernier lot {int(metrics.get('last_batch_size', 0))} lignes, "
+          f"file {int(metrics.get('queue_depth', 0))}/{int(metrics.get('queue_capacity', 0))}")
+    quantile = lambda name, q: ms(metrics.get(f'{name}{{quantile="{q}"}}', 0))
+    print(f"Écriture d'un lot: p50 {quantile('write_seconds', 0.5)} | p95 {quantile('write_seconds', 0.95)}")
+    print(f"Mise en file -> commit: p50 {quantile('commit_delay_seconds', 0.5)} | p95 {quantile('commit_delay_seconds', 0.95)}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Charge simulée Kobo/ODK pour le service d'ingestion")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--households", type=int, default=5000)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="Enquêteurs simultanés (connexions)")
+    parser.add_argument("--rate", type=float, help="Soumissions par seconde (défaut: au plus vite)")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="Part de soumissions invalides (zone manquante)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--token", help="Jeton du service (Authorization: Bearer)")
+    args = parser.parse_args(argv)
+
+    seeds = np.random.SeedSequence(args.seed).spawn(3)
+    subs = kobo_submissions("households", args.households, seed=seeds[0], invalid_rate=args.invalid_rate)
+    subs += kobo_submissions("water_samples", args.samples, seed=seeds[1], invalid_rate=args.invalid_rate)
+    # ménages et prélèvements entremêlés, comme sur le terrain
+    order = np.random.default_rng(seeds[2]).permutation(len(subs))
+    subs = [subs[i] for i in order]
+
+    async def run():
+        stats = await run_load(args.url, subs, args.concurrency, args.rate, args.token)
+        return stats, await wait_drained(args.url)
+
+    try:
+        stats, metrics = asyncio.run(run())
+    except ConnectionError as e:
+        print(f"❌ Service d'ingestion injoignable sur {args.url} ({e})", file=sys.stderr)
+        sys.exit(1)
+    report(stats, metrics, len(subs))
+
+if __name__ == "__main__":
+    main()
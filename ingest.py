@@ -0,0 +1,423 @@
+"""
+Service d'ingestion des formulaires Kobo/ODK (webhook JSON -> base).
+
+Chaque soumission est validée contre le schéma de la table (colonnes, types,
+valeurs attendues), mise en file d'attente puis écrite par lots: un seul
+écrivain vide la file dès que le lot atteint `batch_size` lignes ou que le
+plus ancien élément attend depuis `max_delay` secondes (group commit, une
+transaction par table et par lot).
+
+    python ingest.py --port 8765 --batch-size 500 --max-delay 0.2
+
+Routes:
+    POST /submissions/households      soumission (objet JSON) ou liste de soumissions
+    POST /submissions/water_samples
+    GET  /metrics                     métriques au format texte Prometheus
+    GET  /health
+
+Réponses: 202 (mise en file), 422 (soumission invalide), 413 (liste plus
+longue que la file), 503 + Retry-After quand la file est pleine (le client
+doit réessayer). Serveur HTTP/1.1
+minimal (asyncio, bibliothèque standard), prévu pour tourner en local ou
+derrière un reverse proxy.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import database as db
+
+TABLES = {
+    "households": db.insert_households_many,
+    "water_samples": db.insert_water_samples_many,
+}
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+MAX_DELAY_S = 0.2
+MAX_BODY_BYTES = 1024 * 1024
+DEAD_LETTER_PATH = os.path.join(".cache", "ingest", "failed.jsonl")
+
+# Métadonnées ajoutées par Kobo / ODK (ignorées). `end` sert d'horodatage de
+# collecte si le formulaire n'a pas de champ collected_at.
+META_FIELDS = {"start", "end", "today", "deviceid", "username", "simserial", "subscriberid", "phonenumber", "audit"}
+META_GROUPS = {"meta", "formhub"}
+
+FLAG_COLUMNS = set(db.NEED_COLUMNS) | {"water_improved", "sanitation", "children_schooling", "health_access"}
+CHOICES = {c: set(db.CATEGORIES[c]) for c in ("vulnerability", "season")}
+RANGES = {
+    "lat": (-90, 90),
+    "lon": (-180, 180),
+    "ph": (0, 14),
+    "hh_size": (1, 100),
+    "turbidity": (0, None),
+    "conductivity": (0, None),
+    "e_coli": (0, None),
+    "coliforms": (0, None),
+}
+
+# ------------------ Validation ------------------
+
+def load_schemas(conn) -> dict:
+    """Colonnes, colonnes obligatoires et types déclarés de chaque table ingérée."""
+    schemas = {}
+    for table in TABLES:
+        types = db.column_types(conn, table)
+        columns = db.insertable_columns(conn, table)
+        schemas[table] = dict(columns=columns, required=db.required_columns(conn, table), types={c: types[c] for c in columns})
+    return schemas
+
+def flatten_submission(record: dict) -> dict:
+    """Champs du formulaire -> colonnes: préfixes de groupe retirés, métadonnées ignorées."""
+    out = {}
+    for key, value in record.items():
+        if key.startswith("_") or key in META_FIELDS or key.split("/")[0] in META_GROUPS:
+            continue
+        out[key.rsplit("/", 1)[-1]] = value
+    if out.get("collected_at") in (None, "") and record.get("end"):
+        out["collected_at"] = record["end"]
+    return out
+
+def _timestamp(value) -> str:
+    # Horodatage avec fuseau -> UTC sans fuseau (comme collected_ts côté SQLite)
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat(timespec="seconds")
+
+def _coerce(value, decl: str):
+    if decl == "INTEGER":
+        if isinstance(value, bool):
+            return int(value)
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError("entier attendu")
+        return int(number)
+    if decl == "REAL":
+        if isinstance(value, bool):
+            raise ValueError("nombre attendu")
+        return float(value)
+    return str(value)
+
+def validate(schema: dict, record: dict):
+    """(ligne prête à insérer, liste d'erreurs). La ligne porte toutes les colonnes de la table."""
+    if not isinstance(record, dict):
+        return None, ["objet JSON attendu"]
+    values = flatten_submission(record)
+    errors = [f"{c}: champ inconnu" for c in values if c not in schema["types"]]
+    row = {}
+    for column, decl in schema["types"].items():
+        value = values.get(column)
+        if value is None or value == "":
+            if column in schema["required"]:
+                errors.append(f"{column}: obligatoire")
+            row[column] = None
+            continue
+        try:
+            value = _timestamp(value) if column == "collected_at" else _coerce(value, decl)
+        except (TypeError, ValueError):
+            errors.append(f"{column}: valeur invalide {value!r} ({decl})")
+            continue
+        if column in FLAG_COLUMNS and value not in (0, 1):
+            errors.append(f"{column}: 0 ou 1 attendu")
+        elif column in CHOICES and value not in CHOICES[column]:
+            errors.append(f"{column}: valeur hors liste {value!r}")
+        elif column in RANGES:
+            lo, hi = RANGES[column]
+            if (lo is not None and value < lo) or (hi is not None and value > hi):
+                errors.append(f"{column}: hors plage {value!r}")
+        row[column] = value
+    return (None, errors) if errors else (row, [])
+
+# ------------------ Métriques ------------------
+
+def _quantile(ordered, q: float):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Metrics:
+    """Compteurs du service; mis à jour depuis la boucle asyncio uniquement."""
+
+    def __init__(self, window: int = 2048):
+        self.submissions = {"accepted": 0, "invalid": 0, "backpressure": 0}
+        self.rows_written = {t: 0 for t in TABLES}
+        self.batches = 0
+        self.write_errors = 0
+        self.last_batch_size = 0
+        # fenêtres glissantes (quantiles) + totaux (sum / count Prometheus)
+        self.write_s = deque(maxlen=window)          # durée d'écriture d'un lot
+        self.commit_delay_s = deque(maxlen=window)   # mise en file -> commit, par soumission
+        self.totals = {"write_seconds": [0.0, 0], "commit_delay_seconds": [0.0, 0]}
+
+    def record_batch(self, sizes: dict, write_s: float, delays: list):
+        self.batches += 1
+        self.last_batch_size = sum(sizes.values())
+        for table, n in sizes.items():
+            self.rows_written[table] += n
+        self.write_s.append(write_s)
+        self.commit_delay_s.extend(delays)
+        self.totals["write_seconds"][0] += write_s
+        self.totals["write_seconds"][1] += 1
+        self.totals["commit_delay_seconds"][0] += sum(delays)
+        self.totals["commit_delay_seconds"][1] += len(delays)
+
+    def prometheus(self, queue) -> str:
+        lines = []
+
+        def metric(name, kind, help_, samples):
+            lines.append(f"# HELP ganvie_ingest_{name} {help_}")
+            lines.append(f"# TYPE ganvie_ingest_{name} {kind}")
+            lines.extend(f"ganvie_ingest_{name}{labels} {value}" for labels, value in samples)
+
+        metric("queue_depth", "gauge", "Soumissions en attente d'écriture", [("", queue.qsize())])
+        metric("queue_capacity", "gauge", "Taille maximale de la file", [("", queue.maxsize)])
+        metric("submissions_total", "counter", "Soumissions reçues par issue",
+               [(f'{{status="{k}"}}', v) for k, v in self.submissions.items()])
+        metric("rows_written_total", "counter", "Lignes écrites par table",
+               [(f'{{table="{k}"}}', v) for k, v in self.rows_written.items()])
+        metric("batches_total", "counter", "Lots écrits", [("", self.batches)])
+        metric("write_errors_total", "counter", "Lots en échec (voir le fichier de rejet)", [("", self.write_errors)])
+        metric("last_batch_size", "gauge", "Taille du dernier lot écrit", [("", self.last_batch_size)])
+        for name, window, help_ in (
+            ("write_seconds", self.write_s, "Durée d'écriture d'un lot"),
+            ("commit_delay_seconds", self.commit_delay_s, "Délai mise en file -> commit par soumission"),
+        ):
+            values = sorted(window)
+            total, count = self.totals[name]
+            metric(name, "summary", help_, [(f'{{quantile="{q}"}}', round(_quantile(values, q), 6)) for q in (0.5, 0.95, 0.99)])
+            lines.append(f"ganvie_ingest_{name}_sum {round(total, 6)}")
+            lines.append(f"ganvie_ingest_{name}_count {count}")
+        return "\n".join(lines) + "\n"
+
+# ------------------ Service ------------------
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 422: "Unprocessable Entity",
+               503: "Service Unavailable"}
+
+class IngestService:
+    def __init__(self, db_path=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, max_delay=MAX_DELAY_S, token=None):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.token = token
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.metrics = Metrics()
+        # Un seul thread d'écriture: les lots sont commités dans l'ordre d'arrivée
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+        with db.writer(db_path) as conn:
+            db.init_db(conn)
+            self.schemas = load_schemas(conn)
+
+    # --- HTTP ---
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "requête invalide"}, close=True)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "Content-Length invalide"}, close=True)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": f"corps > {MAX_BODY_BYTES} octets"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload, extra = self.route(method, target.split("?")[0], headers, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, extra, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, extra=None, close=False):
+        if isinstance(payload, str):
+            body, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Type: {ctype}", f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in (extra or {}).items()]
+        if close:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    def route(self, method, path, headers, body):
+        if path == "/health":
+            return 200, {"status": "ok", "queue_depth": self.queue.qsize()}, None
+        if path == "/metrics":
+            return 200, self.metrics.prometheus(self.queue), None
+        parts = path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "submissions" or parts[1] not in TABLES:
+            return 404, {"error": f"route inconnue: {path}"}, None
+        if method != "POST":
+            return 405, {"error": "POST attendu"}, {"Allow": "POST"}
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            return 401, {"error": "jeton manquant ou invalide"}, None
+        return self.submit(parts[1], body)
+
+    # --- File d'attente ---
+
+    def submit(self, table, body):
+        """Valide une soumission (ou une liste) et la met en file, tout ou rien."""
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            return 400, {"error": "JSON invalide"}, None
+        records = data if isinstance(data, list) else [data]
+        rows, errors = [], []
+        for i, record in enumerate(records):
+            row, errs = validate(self.schemas[table], record)
+            rows.append(row)
+            errors += [f"[{i}] {e}" for e in errs] if len(records) > 1 else errs
+        if errors or not rows:
+            self.metrics.submissions["invalid"] += len(records)
+            return 422, {"errors": errors or ["soumission vide"]}, None
+        if len(rows) > self.queue.maxsize:
+            # Jamais acceptable, même file vide: inutile de réessayer
+            self.metrics.submissions["invalid"] += len(rows)
+            return 413, {"error": f"plus de {self.queue.maxsize} soumissions par requête, découper la liste"}, None
+        if self.queue.maxsize - self.queue.qsize() < len(rows):
+            self.metrics.submissions["backpressure"] += len(rows)
+            return 503, {"error": "file pleine, réessayer", "queue_depth": self.queue.qsize()}, {"Retry-After": "1"}
+        now = time.perf_counter()
+        for row in rows:
+            self.queue.put_nowait((table, row, now))
+        self.metrics.submissions["accepted"] += len(rows)
+        return 202, {"accepted": len(rows), "queue_depth": self.queue.qsize()}, None
+
+    async def writer_loop(self):
+        """Vide la file par lots (taille ou délai), jusqu'au marqueur de fin (None)."""
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self.queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                sizes, write_s, failed = await loop.run_in_executor(self._executor, self.write_batch, batch)
+            except Exception as e:
+                self.metrics.write_errors += 1
+                _dead_letter(batch, e)
+                continue
+            # Seules les lignes des tables en échec sont copiées: les autres sont commitées
+            for table, error in failed.items():
+                self.metrics.write_errors += 1
+                _dead_letter([item for item in batch if item[0] == table], error)
+            written = [item for item in batch if item[0] not in failed]
+            if written:
+                done = time.perf_counter()
+                self.metrics.record_batch(sizes, write_s, [done - t_enq for _, _, t_enq in written])
+
+    def write_batch(self, batch):
+        """Écrit un lot (thread d'écriture): une transaction par table.
+
+        Retourne (lignes écrites par table, durée, {table en échec: exception}).
+        """
+        by_table = {}
+        for table, row, _ in batch:
+            by_table.setdefault(table, []).append(row)
+        sizes, failed = {}, {}
+        t0 = time.perf_counter()
+        with db.writer(self.db_path) as conn:
+            for table, rows in by_table.items():
+                try:
+                    TABLES[table](conn, rows)
+                    sizes[table] = len(rows)
+                except Exception as e:
+                    failed[table] = e
+        return sizes, time.perf_counter() - t0, failed
+
+def _dead_letter(batch, error):
+    # Lot non écrit: conservé pour rejeu (les soumissions ont déjà reçu 202)
+    os.makedirs(os.path.dirname(DEAD_LETTER_PATH), exist_ok=True)
+    with open(DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+        for table, row, _ in batch:
+            f.write(json.dumps({"table": table, "row": row, "error": str(error)}, ensure_ascii=False) + "\n")
+    print(f"❌ Lot non écrit ({error}), {len(batch)} lignes copiées dans {DEAD_LETTER_PATH}", file=sys.stderr)
+
+# ------------------ Lancement ------------------
+
+async def serve(host="127.0.0.1", port=8765, **options):
+    service = IngestService(**options)
+    server = await asyncio.start_server(service.handle, host, port)
+    writer_task = asyncio.create_task(service.writer_loop())
+    print(f"✅ Ingestion sur http://{host}:{port} (lots de {service.batch_size}, délai max {service.max_delay}s)", file=sys.stderr)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stopping.wait()
+    finally:
+        # Plus de nouvelles soumissions, puis écriture de tout ce qui est en file
+        server.close()
+        await server.wait_closed()
+        await service.queue.put(None)
+        await writer_task
+        service._executor.shutdown()
+        print(f"✅ Arrêt: {sum(service.metrics.rows_written.values())} lignes écrites", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Service d'ingestion des soumissions Kobo/ODK")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", help="Chemin de la base (défaut: database.DB_PATH)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY_S, help="Attente maximale avant écriture d'un lot incomplet (s)")
+    parser.add_argument("--token", default=os.environ.get("GANVIE_INGEST_TOKEN"), help="Jeton attendu dans 'Authorization: Bearer ...'")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, db_path=args.db, queue_size=args.queue_size,
+                      batch_size=args.batch_size, max_delay=args.max_delay, token=args.token))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Commandes d'exploitation de la base (hors dashboard).
+
+    python manage.py migrate
+    python manage.py import households Data/sample_households.csv
+    python manage.py import water_samples Data/sample_water_samples.csv --chunk-size 10000
+    python manage.py import water_samples prelevements_classes.csv --keep-risk-level
+    python manage.py rebuild-rollup
+    python manage.py rebuild-baselines
+    python manage.py export households menages_2025.parquet --format parquet --start 2025-01-01
+    python manage.py generate --households 1000000 --samples 20000 --seed 42
+    python manage.py generate --households 1000000 --seed 42 --out menages.parquet
+    python manage.py reclassify --dry-run --profile oms
+    python manage.py copy ganvie_durable.db ganvie_durable.duckdb
+    python manage.py perf --days 7
+    python manage.py rollover --year 2025 --vacuum
+    python manage.py partitions
+"""
+import argparse
+import csv
+import sys
+import time
+from datetime import date, datetime
+from functools import partial
+from itertools import islice
+
+import database as db
+
+INSERTERS = {
+    "households": db.insert_households_many,
+    "water_samples": db.insert_water_samples_many,
+}
+
+# ------------------ Import CSV ------------------
+
+def _check_header(conn, table: str, header: list):
+    allowed = set(db.insertable_columns(conn, table))
+    unknown = [c for c in header if c not in allowed]
+    missing = [c for c in db.required_columns(conn, table) if c not in header]
+    if unknown or missing:
+        msg = [f"CSV incompatible avec la table {table}."]
+        if unknown:
+            msg.append(f"Colonnes inconnues: {', '.join(unknown)}")
+        if missing:
+            msg.append(f"Colonnes obligatoires absentes: {', '.join(missing)}")
+        raise ValueError(msg[0] + " " + " ; ".join(msg[1:]))
+
+def _rows(reader):
+    # Cellule vide -> NULL ; SQLite applique ensuite l'affinité de type des colonnes
+    for rec in reader:
+        yield {k: (v if v != "" else None) for k, v in rec.items()}
+
+def import_csv(conn, table: str, path: str, chunk_size: int = 5000, log=print, classify: bool = True) -> int:
+    """Importe un CSV par blocs de `chunk_size` lignes (une transaction par bloc).
+
+    Le fichier est lu en flux: la mémoire reste bornée par la taille d'un bloc,
+    quelle que soit la taille de l'export. `classify=False`: le risk_level des
+    prélèvements est importé tel quel au lieu d'être recalculé.
+    """
+    insert = INSERTERS[table] if classify or table != "water_samples" else partial(db.insert_water_samples_many, classify=False)
+    total = 0
+    t0 = time.perf_counter()
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        _check_header(conn, table, reader.fieldnames or [])
+        rows = _rows(reader)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            total += insert(conn, chunk)
+            elapsed = time.perf_counter() - t0
+            log(f"  {total:>10} lignes | {total / max(elapsed, 1e-9):,.0f} lignes/s")
+    elapsed = time.perf_counter() - t0
+    log(f"✅ {total} lignes importées dans {table} en {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} lignes/s)")
+    return total
+
+# ------------------ Copie entre bases ------------------
+
+COPIES = [
+    ("households", db.iter_households, db.insert_households_many),
+    # Niveaux de risque copiés tels quels (base classée avec un autre profil)
+    ("water_samples", db.iter_water, partial(db.insert_water_samples_many, classify=False)),
+]
+
+def copy_database(src, dst, chunk_size: int = 50000, log=print) -> dict:
+    """Copie ménages, prélèvements et cible de `src` vers `dst` (vide), quel que soit leur backend.
+
+    Les identifiants sont conservés; les horodatages sont copiés à la seconde.
+    """
+    for table, _, _ in COPIES:
+        if db.data_version(dst, table)[1] is not None:
+            raise ValueError(f"La table {table} de la base cible n'est pas vide")
+    counts = {}
+    with db.deferred_rollup(dst):
+        for table, iterate, insert in COPIES:
+            t0 = time.perf_counter()
+            counts[table] = 0
+            for chunk in iterate(src, {}, chunksize=chunk_size):
+                chunk["collected_at"] = chunk["collected_at"].dt.strftime("%Y-%m-%dT%H:%M:%S")
+                counts[table] += insert(dst, chunk)
+            log(f"  {table}: {counts[table]} lignes en {time.perf_counter() - t0:.1f}s")
+    db.upsert_target(dst, db.get_target(src))
+    return counts
+
+# ------------------ CLI ------------------
+
+def cmd_migrate(args):
+    conn = db.get_connection()
+    print(f"Schéma en version {db.schema_version(conn)}")
+    db.init_db(conn)
+    print(f"✅ Schéma en version {db.schema_version(conn)}")
+    conn.close()
+
+def cmd_import(args):
+    conn = db.get_connection()
+    db.init_db(conn)
+    try:
+        import_csv(conn, args.table, args.path, chunk_size=args.chunk_size, classify=not args.keep_risk_level)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+def cmd_rebuild_rollup(args):
+    conn = db.get_connection()
+    db.init_db(conn)
+    t0 = time.perf_counter()
+    cells = db.rebuild_rollup(conn)
+    db.bump_version(conn, "households", append=True)
+    conn.commit()
+    print(f"✅ household_rollup recalculé: {cells} cellules en {time.perf_counter() - t0:.2f}s")
+    conn.close()
+
+def cmd_rebuild_baselines(args):
+    conn = db.get_connection()
+    db.init_db(conn)
+    t0 = time.perf_counter()
+    alerts = db.rebuild_baselines(conn)
+    print(f"✅ Référentiels qualité de l'eau recalculés: {alerts} alertes en {time.perf_counter() - t0:.2f}s")
+    conn.close()
+
+def cmd_export(args):
+    import exports
+
+    conn = db.get_connection()
+    db.init_db(conn)
+    filters = {
+        "zones": args.zone or None,
+        "start": date.fromisoformat(args.start) if args.start else None,
+        "end": date.fromisoformat(args.end) if args.end else None,
+    }
+    res = exports.export_to_path(conn, args.table, filters, args.format, args.path)
+    print(f"✅ {res['rows']} lignes -> {args.path} ({exports.human_size(res['bytes'])}, {res['seconds']:.2f}s)")
+    conn.close()
+
+def cmd_generate(args):
+    import seed_data
+
+    start = datetime.fromisoformat(args.start) if args.start else None
+    t0 = time.perf_counter()
+    if args.out:
+        rows = seed_data.generate_to_file(args.kind, args.households if args.kind == "households" else args.samples, args.out, args.days, args.seed, start)
+        print(f"✅ {rows} lignes ({args.kind}) -> {args.out} en {time.perf_counter() - t0:.1f}s")
+        return
+    seed_data.seed_fast(args.households, args.samples, args.days, seed=args.seed, start=start)
+    print(f"✅ {args.households} ménages et {args.samples} prélèvements générés en {time.perf_counter() - t0:.1f}s")
+
+def cmd_reclassify(args):
+    import risk_rules
+
+    conn = db.get_connection()
+    db.init_db(conn)
+    conf = risk_rules.load_profiles()
+    name = args.profile or conf["active"]
+    if name != conf["active"] and not args.dry_run:
+        # l'ingestion classe avec le profil actif: l'historique doit suivre le même
+        print(f"❌ Le profil {name} n'est pas actif: modifiez `active` dans {risk_rules.PROFILES_PATH} ou utilisez --dry-run", file=sys.stderr)
+        sys.exit(1)
+    profile = risk_rules.get_profile(name)
+    t0 = time.perf_counter()
+    changes = db.reclassify_water(conn, profile, dry_run=args.dry_run)
+    total = int(changes["samples"].sum()) if len(changes) else 0
+    for r in changes.itertuples():
+        print(f"  {r.before or '—':<13} → {r.after:<13} {r.samples:>8}")
+    verb = "changeraient" if args.dry_run else "ont changé"
+    print(f"✅ Profil {name} ({profile['label']}): {total} prélèvements {verb} de niveau en {time.perf_counter() - t0:.2f}s")
+    conn.close()
+
+def cmd_copy(args):
+    src, dst = db.get_connection(args.src), db.get_connection(args.dst)
+    db.init_db(dst)
+    try:
+        copy_database(src, dst)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        src.close()
+        dst.close()
+    print(f"✅ {args.src} copiée vers {args.dst}")
+
+def cmd_rollover(args):
+    conn = db.get_connection()
+    db.init_db(conn)
+    t0 = time.perf_counter()
+    try:
+        res = db.rollover_partition(conn, args.year, vacuum=args.vacuum)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+    moved = ", ".join(f"{res[t]} {t}" for t in db.PARTITIONED)
+    print(f"✅ Année {args.year} archivée ({moved} déplacés) -> {res['path']} en {time.perf_counter() - t0:.2f}s")
+
+def cmd_partitions(args):
+    conn = db.get_connection()
+    db.init_db(conn)
+    df = db.list_partitions(conn)
+    conn.close()
+    if df.empty:
+        print("Aucune année archivée")
+        return
+    print(df.to_string(index=False))
+
+def cmd_perf(args):
+    import perf
+
+    df = perf.history(args.days)
+    if args.stage:
+        df = df[df["stage"].isin(args.stage)]
+    if df.empty:
+        print(f"Aucune mesure dans {perf.TIMINGS_DB_PATH} (GANVIE_PERF_SINK=sqlite)")
+        return
+    print(df.round(1).to_string(index=False))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exploitation de la base Ganvié Durable")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="Applique les migrations du schéma")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("import", help="Importe un CSV (flux, par blocs)")
+    p.add_argument("table", choices=sorted(INSERTERS))
+    p.add_argument("path")
+    p.add_argument("--chunk-size", type=int, default=5000)
+    p.add_argument("--keep-risk-level", action="store_true", help="Prélèvements: garde le risk_level du CSV (données déjà classées)")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("rebuild-rollup", help="Recalcule l'agrégat zone × jour depuis households")
+    p.set_defaults(func=cmd_rebuild_rollup)
+
+    p = sub.add_parser("rebuild-baselines", help="Recalcule référentiels, alertes et derniers prélèvements (qualité de l'eau)")
+    p.set_defaults(func=cmd_rebuild_baselines)
+
+    p = sub.add_parser("export", help="Exporte une table (flux, par blocs) en CSV, CSV gzip ou Parquet")
+    p.add_argument("table", choices=sorted(INSERTERS))
+    p.add_argument("path")
+    p.add_argument("--format", choices=["csv", "csv.gz", "parquet"], default="csv")
+    p.add_argument("--zone", action="append", help="Zone à inclure (répétable)")
+    p.add_argument("--start", help="Date de début (AAAA-MM-JJ)")
+    p.add_argument("--end", help="Date de fin (AAAA-MM-JJ, incluse)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("generate", help="Génère des données fictives en masse (vectorisé, reproductible)")
+    p.add_argument("--households", type=int, default=1_000_000)
+    p.add_argument("--samples", type=int, default=20_000)
+    p.add_argument("--days", type=int, default=120)
+    p.add_argument("--seed", type=int, help="Graine (même graine + même --start = mêmes données)")
+    p.add_argument("--start", help="Date de début (AAAA-MM-JJ), défaut: aujourd'hui - days")
+    p.add_argument("--out", help="Écrit dans un fichier (.csv, .csv.gz, .parquet) au lieu de la base")
+    p.add_argument("--kind", choices=["households", "water_samples"], default="households", help="Table générée avec --out")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("reclassify", help="Reclasse le risque de tous les prélèvements (profil de seuils)")
+    p.add_argument("--profile", help="Profil de risk_profiles.toml (défaut: profil actif)")
+    p.add_argument("--dry-run", action="store_true", help="Affiche les changements sans les écrire")
+    p.set_defaults(func=cmd_reclassify)
+
+    p = sub.add_parser("copy", help="Copie une base vers une autre (ex. SQLite -> DuckDB, backend déduit de l'extension .duckdb)")
+    p.add_argument("src")
+    p.add_argument("dst")
+    p.set_defaults(func=cmd_copy)
+
+    p = sub.add_parser("rollover", help="Archive une année close (ménages et prélèvements) et compacte son archive")
+    p.add_argument("--year", type=int, required=True)
+    p.add_argument("--vacuum", action="store_true", help="Récupère ensuite l'espace libéré dans la base")
+    p.set_defaults(func=cmd_rollover)
+
+    p = sub.add_parser("partitions", help="Liste les années archivées (catalogue)")
+    p.set_defaults(func=cmd_partitions)
+
+    p = sub.add_parser("perf", help="Temps des reruns du dashboard par jour et par étape (p50 / p95)")
+    p.add_argument("--days", type=int, default=7)
+    p.add_argument("--stage", nargs="+", help="Étapes à afficher (ex. rerun data.households)")
+    p.set_defaults(func=cmd_perf)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Préparation des données cartographiques (côté serveur).
+
+Au-delà de POINT_THRESHOLD points, les ménages / prélèvements sont agrégés sur
+une grille carrée de `cell_m` mètres: une ligne par cellule (effectif, nombre
+moyen de besoins ou pire niveau de risque). Seules les colonnes utiles à la
+carte sont envoyées au navigateur. Les préparations sont mémoïsées par jeu de
+filtres et résolution.
+"""
+import numpy as np
+import pandas as pd
+
+import analysis
+import cache
+import database as db
+
+POINT_THRESHOLD = 5000        # au-delà: couche agrégée par défaut
+MAX_RAW_POINTS = 50000        # au-delà: pas de points bruts, même sur demande
+CELL_SIZES_M = [100, 250, 500, 1000]
+DEFAULT_CELL_M = 250
+METERS_PER_DEG_LAT = 111_320.0
+
+HOUSEHOLD_MAP_COLUMNS = ["lat", "lon", "zone", "vulnerability", "needs_mask"]
+WATER_MAP_COLUMNS = ["lat", "lon", "zone", "risk_level", "ph", "turbidity", "e_coli"]
+
+# ------------------ Grille ------------------
+
+def grid_cells(lat, lon, cell_m: float):
+    """Indexe chaque point dans une grille carrée de `cell_m` mètres.
+
+    Retourne (inverse, lat0, lon0) où `inverse[i]` est le numéro de cellule du
+    point i et (lat0, lon0) le coin sud-ouest de chaque cellule.
+    """
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    dlat = cell_m / METERS_PER_DEG_LAT
+    dlon = cell_m / (METERS_PER_DEG_LAT * np.cos(np.radians(np.nanmean(lat))))
+    iy = np.floor(lat / dlat).astype(np.int64)
+    ix = np.floor(lon / dlon).astype(np.int64)
+    keys, inverse = np.unique(np.stack([iy, ix], axis=1), axis=0, return_inverse=True)
+    return inverse.ravel(), keys[:, 0] * dlat, keys[:, 1] * dlon
+
+def bin_households(h, cell_m: float = DEFAULT_CELL_M):
+    """Cellules: lat, lon (coin sud-ouest), count, need_mean + couleur."""
+    inv, lat0, lon0 = grid_cells(h["lat"], h["lon"], cell_m)
+    count = np.bincount(inv)
+    need_mean = np.bincount(inv, weights=analysis.needs_count(h).to_numpy()) / count
+    cells = pd.DataFrame({"lat": lat0, "lon": lon0, "count": count, "need_mean": need_mean.round(2)})
+    return analysis.with_need_colors(cells, np.rint(need_mean))
+
+def bin_water(w, cell_m: float = DEFAULT_CELL_M):
+    """Cellules: lat, lon (coin sud-ouest), count, risk_level (pire niveau) + couleur."""
+    inv, lat0, lon0 = grid_cells(w["lat"], w["lon"], cell_m)
+    count = np.bincount(inv)
+    codes = pd.Categorical(w["risk_level"], categories=analysis.RISK_LEVELS).codes.astype(np.int64)
+    worst = np.full(len(count), -1, dtype=np.int64)
+    np.maximum.at(worst, inv, codes)
+    levels = np.array(analysis.RISK_LEVELS + [None], dtype=object)[worst]
+    cells = pd.DataFrame({"lat": lat0, "lon": lon0, "count": count, "risk_level": levels})
+    return analysis.with_risk_colors(cells)
+
+# ------------------ Préparations mémoïsées ------------------
+
+def household_points(h):
+    need_count = analysis.needs_count(h)
+    df = h[["lat", "lon", "zone", "vulnerability"]].assign(need_count=need_count)
+    return analysis.with_need_colors(df, need_count)
+
+def water_points(w):
+    return analysis.with_risk_colors(w[WATER_MAP_COLUMNS])
+
+def _use_grid(n: int, raw: bool) -> bool:
+    return n > MAX_RAW_POINTS or (n > POINT_THRESHOLD and not raw)
+
+@cache.memoize("households")
+def households_map_for(conn, filters, cell_m=DEFAULT_CELL_M, raw=False):
+    """("points" | "grid", frame, nombre de ménages géolocalisés)."""
+    h = db.query_households(conn, filters, columns=HOUSEHOLD_MAP_COLUMNS).dropna(subset=["lat", "lon"])
+    if _use_grid(len(h), raw):
+        return "grid", bin_households(h, cell_m), len(h)
+    return "points", household_points(h), len(h)
+
+@cache.memoize("water_samples")
+def water_map_for(conn, filters, cell_m=DEFAULT_CELL_M, raw=False):
+    """("points" | "grid", frame, nombre de prélèvements géolocalisés)."""
+    w = db.query_water(conn, filters, columns=WATER_MAP_COLUMNS).dropna(subset=["lat", "lon"])
+    if _use_grid(len(w), raw):
+        return "grid", bin_water(w, cell_m), len(w)
+    return "points", water_points(w), len(w)
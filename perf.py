@@ -0,0 +1,259 @@
+"""
+Chronométrage des étapes du dashboard (lecture base, parsing des dates,
+agrégats, figures, cartes) et des sections.
+
+    with perf.span("section.eau"):
+        ...
+
+    @perf.timed("analysis.zones")
+    def zones_for(conn, filters): ...
+
+Les durées récentes sont gardées en mémoire par étape (fenêtre glissante,
+partagée par les sessions du processus) pour le panneau « Performance » de la
+sidebar. À la fin de chaque rerun (`end_rerun`), les durées du rerun sont
+ajoutées aux sorties configurées par GANVIE_PERF_SINK (liste séparée par des
+virgules, vide = aucune):
+    sqlite      table perf_timings de .cache/perf/timings.db (historique)
+    prometheus  fichier texte .cache/perf/ganvie_perf.prom (textfile collector)
+
+Une section relancée seule (fragment Streamlit, sans rerun complet) est
+enregistrée de la même façon, avec sa durée totale sous « fragment ».
+
+Le premier rerun du processus enregistre aussi ses temps de démarrage
+(`startup`): imports du script, premier rendu complet.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+
+import pandas as pd
+
+WINDOW = 500
+PERF_DIR = os.path.join(".cache", "perf")
+TIMINGS_DB_PATH = os.path.join(PERF_DIR, "timings.db")
+PROMETHEUS_PATH = os.path.join(PERF_DIR, "ganvie_perf.prom")
+RETENTION_DAYS = 90
+SINKS = [s.strip() for s in os.environ.get("GANVIE_PERF_SINK", "sqlite").split(",") if s.strip()]
+
+def _quantile(ordered, q: float) -> float:
+    if not ordered:
+        return 0.0
+    # rang le plus proche (p50 de [a, b] = a)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+# ------------------ Mesures en mémoire ------------------
+
+class Recorder:
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self._recent = {}   # étape -> deque des dernières durées (s)
+        self._totals = {}   # étape -> [somme, nombre] depuis le démarrage
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._recent.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            total = self._totals.setdefault(stage, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+            self._totals.clear()
+
+    def summary(self) -> pd.DataFrame:
+        """Une ligne par étape: nombre de mesures récentes, p50 / p95 / dernière (ms)."""
+        with self._lock:
+            snapshot = {stage: list(values) for stage, values in self._recent.items()}
+        rows = []
+        for stage, values in snapshot.items():
+            ordered = sorted(values)
+            rows.append(dict(stage=stage, n=len(values), p50_ms=_quantile(ordered, 0.5) * 1000,
+                             p95_ms=_quantile(ordered, 0.95) * 1000, last_ms=values[-1] * 1000))
+        columns = ["stage", "n", "p50_ms", "p95_ms", "last_ms"]
+        return pd.DataFrame(rows, columns=columns).sort_values("p95_ms", ascending=False, ignore_index=True)
+
+    def prometheus(self) -> str:
+        with self._lock:
+            snapshot = {stage: (sorted(values), list(self._totals[stage])) for stage, values in self._recent.items()}
+        lines = [
+            "# HELP ganvie_stage_seconds Durée des étapes du dashboard (fenêtre récente)",
+            "# TYPE ganvie_stage_seconds summary",
+        ]
+        for stage, (ordered, (total, count)) in sorted(snapshot.items()):
+            for q in (0.5, 0.95):
+                lines.append(f'ganvie_stage_seconds{{stage="{stage}",quantile="{q}"}} {round(_quantile(ordered, q), 6)}')
+            lines.append(f'ganvie_stage_seconds_sum{{stage="{stage}"}} {round(total, 6)}')
+            lines.append(f'ganvie_stage_seconds_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+RECORDER = Recorder()
+
+# Durées du rerun en cours (un thread par session Streamlit)
+_local = threading.local()
+
+def record(stage: str, seconds: float):
+    RECORDER.add(stage, seconds)
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        pending.append((stage, seconds))
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - t0)
+
+def timed(stage: str):
+    """Décorateur: chronomètre chaque appel de la fonction sous le nom `stage`.
+
+    Appelée hors d'un rerun complet (fragment relancé seul), la fonction a
+    ses propres mesures, écrites dans les sorties à la fin de l'appel.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, "pending", None) is not None:
+                with span(stage):
+                    return fn(*args, **kwargs)
+            start_rerun()
+            try:
+                with span(stage):
+                    result = fn(*args, **kwargs)
+            except BaseException:
+                _local.pending = None   # fragment interrompu (st.rerun...): mesures abandonnées
+                raise
+            end_rerun("fragment")
+            return result
+        return wrapper
+    return decorator
+
+# ------------------ Reruns ------------------
+
+def start_rerun():
+    # Un rerun interrompu (st.stop, nouveau rerun) n'a pas appelé end_rerun: ses mesures sont abandonnées
+    _local.pending = []
+    _local.t0 = time.perf_counter()
+
+def end_rerun(stage: str = "rerun"):
+    """Enregistre la durée totale du rerun (ou du fragment) et écrit ses mesures dans les sorties configurées."""
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        return
+    record(stage, time.perf_counter() - _local.t0)
+    _local.pending = None
+    try:
+        if "sqlite" in SINKS:
+            _append_sqlite(pending)
+        if "prometheus" in SINKS:
+            write_prometheus()
+    except (OSError, sqlite3.Error):
+        # Les mesures ne doivent jamais faire échouer l'affichage
+        pass
+
+# ------------------ Démarrage ------------------
+# Durées du premier rerun du processus (imports des modules, premier rendu
+# complet): enregistrées une seule fois, sous « startup.<étape> ».
+
+_startup = {}
+_startup_lock = threading.Lock()
+
+def startup(stage: str, seconds: float):
+    with _startup_lock:
+        if stage in _startup:
+            return
+        _startup[stage] = seconds
+    record(f"startup.{stage}", seconds)
+
+def startup_times() -> dict:
+    """Étape -> durée (s) du démarrage du processus."""
+    with _startup_lock:
+        return dict(_startup)
+
+# ------------------ Sorties ------------------
+
+_sink_lock = threading.Lock()
+_sink_conn = None   # connexion du processus à l'historique, ouverte au premier rerun
+_pruned = False
+
+def _timings_connection(path=None):
+    path = path or TIMINGS_DB_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS perf_timings (
+        recorded_at TEXT NOT NULL,
+        rerun_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        seconds REAL NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_perf_timings_at ON perf_timings(recorded_at)")
+    return conn
+
+def _append_sqlite(timings):
+    global _pruned, _sink_conn
+    now = datetime.now()
+    rerun_id = f"{now.timestamp():.6f}-{threading.get_ident()}"
+    with _sink_lock:
+        if _sink_conn is None:
+            _sink_conn = _timings_connection()
+        try:
+            with _sink_conn:
+                _sink_conn.executemany(
+                    "INSERT INTO perf_timings(recorded_at, rerun_id, stage, seconds) VALUES (?,?,?,?)",
+                    [(now.isoformat(timespec="seconds"), rerun_id, stage, seconds) for stage, seconds in timings],
+                )
+                if not _pruned:
+                    _sink_conn.execute("DELETE FROM perf_timings WHERE recorded_at < ?",
+                                       ((now - timedelta(days=RETENTION_DAYS)).isoformat(timespec="seconds"),))
+                    _pruned = True
+        except sqlite3.Error:
+            # Fichier supprimé ou verrouillé: nouvelle connexion au prochain rerun
+            _sink_conn.close()
+            _sink_conn = None
+            raise
+
+def write_prometheus(path=None):
+    path = path or PROMETHEUS_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(RECORDER.prometheus())
+    # Remplacement atomique: le collecteur ne lit jamais un fichier à moitié écrit
+    os.replace(tmp, path)
+
+def history(days: int = 7, path=None) -> pd.DataFrame:
+    """p50 / p95 (ms) par jour et par étape, depuis la table perf_timings."""
+    path = path or TIMINGS_DB_PATH
+    columns = ["day", "stage", "n", "p50_ms", "p95_ms"]
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns)
+    since = (datetime.now() - timedelta(days=int(days))).isoformat(timespec="seconds")
+    conn = _timings_connection(path)
+    try:
+        df = pd.read_sql_query(
+            "SELECT substr(recorded_at, 1, 10) AS day, stage, seconds FROM perf_timings WHERE recorded_at >= ?",
+            conn, params=(since,),
+        )
+    finally:
+        conn.close()
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    g = df.groupby(["day", "stage"])["seconds"]
+    out = pd.DataFrame({
+        "n": g.size(),
+        "p50_ms": g.quantile(0.5) * 1000,
+        "p95_ms": g.quantile(0.95) * 1000,
+    }).reset_index()
+    return out[columns].sort_values(["day", "p95_ms"], ascending=[True, False], ignore_index=True)
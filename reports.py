@@ -0,0 +1,266 @@
+"""
+Note de synthèse PDF, rendue en tâche de fond et mise en cache sur disque.
+
+Une note est identifiée par un hash des filtres (meta) et des versions de
+données: une demande identique est servie depuis le cache disque, sans
+nouveau rendu. Les rendus tournent dans un thread de travail (un seul à la
+fois) pour ne pas bloquer la session Streamlit; le cache est purgé par âge
+et par taille totale.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import analysis
+import database as db
+import mapping
+
+CACHE_DIR = os.path.join(".cache", "reports")
+MAX_AGE_S = 7 * 24 * 3600
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+
+# ------------------ Rendu ------------------
+
+def _rgb(row):
+    from reportlab.lib import colors
+    return colors.Color(row["r"] / 255, row["g"] / 255, row["b"] / 255)
+
+def _kpi_chart(kpis):
+    from reportlab.graphics.charts.barcharts import HorizontalBarChart
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib import colors
+
+    labels = ["Eau améliorée", "Assainissement", "Scolarisation", "≥3 besoins"]
+    values = [kpis["pct_water"], kpis["pct_san"], kpis["pct_school"], kpis["pct_3needs"]]
+    d = Drawing(240, 130)
+    ch = HorizontalBarChart()
+    ch.x, ch.y, ch.width, ch.height = 80, 15, 150, 105
+    ch.data = [values]
+    ch.valueAxis.valueMin, ch.valueAxis.valueMax, ch.valueAxis.valueStep = 0, 100, 25
+    ch.categoryAxis.categoryNames = labels
+    ch.categoryAxis.labels.fontSize = 7
+    ch.valueAxis.labels.fontSize = 7
+    ch.bars[0].fillColor = colors.HexColor("#2c6ea1")
+    d.add(ch)
+    return d
+
+def _zone_chart(tz_df):
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib import colors
+
+    top = tz_df.head(8)
+    d = Drawing(260, 130)
+    ch = VerticalBarChart()
+    ch.x, ch.y, ch.width, ch.height = 25, 35, 225, 85
+    ch.data = [[float(v) for v in top["score"]]]
+    ch.valueAxis.valueMin = 0
+    ch.categoryAxis.categoryNames = [str(z) for z in top["zone"]]
+    ch.categoryAxis.labels.angle = 30
+    ch.categoryAxis.labels.boxAnchor = "ne"
+    ch.categoryAxis.labels.fontSize = 6
+    ch.valueAxis.labels.fontSize = 7
+    ch.bars[0].fillColor = colors.HexColor("#2c3e7d")
+    d.add(ch)
+    return d
+
+def _map_drawing(hh_cells, water_cells, width=500, height=330):
+    """Carte schématique: cellules ménages (carrés) + points d'eau (cercles)."""
+    from reportlab.graphics.shapes import Circle, Drawing, Rect, String
+    from reportlab.lib import colors
+
+    d = Drawing(width, height)
+    d.add(Rect(0, 0, width, height, fillColor=colors.HexColor("#f1f5f9"), strokeColor=colors.HexColor("#cbd5e1")))
+    frames = [f for f in (hh_cells, water_cells) if f is not None and len(f)]
+    if not frames:
+        d.add(String(width / 2, height / 2, "Aucune donnée géolocalisée", textAnchor="middle", fontSize=9))
+        return d
+    lat = [v for f in frames for v in f["lat"]]
+    lon = [v for f in frames for v in f["lon"]]
+    lat_min, lat_max, lon_min, lon_max = min(lat), max(lat), min(lon), max(lon)
+    # projection équirectangulaire locale (1° de longitude = cos(lat) × 1° de latitude)
+    kx = math.cos(math.radians((lat_min + lat_max) / 2))
+    scale = min((width - 20) / max((lon_max - lon_min) * kx, 1e-6), (height - 20) / max(lat_max - lat_min, 1e-6))
+
+    def xy(la, lo):
+        return 10 + (lo - lon_min) * kx * scale, 10 + (la - lat_min) * scale
+
+    if hh_cells is not None:
+        for _, row in hh_cells.iterrows():
+            x, y = xy(row["lat"], row["lon"])
+            d.add(Rect(x, y, 4, 4, fillColor=_rgb(row), strokeColor=None))
+    if water_cells is not None:
+        for _, row in water_cells.iterrows():
+            x, y = xy(row["lat"], row["lon"])
+            d.add(Circle(x, y, 3.5, fillColor=_rgb(row), strokeColor=colors.white, strokeWidth=0.5))
+    return d
+
+def report_pdf_bytes(meta, kpis, tz_df, hh_cells=None, water_cells=None, progress=None):
+    # Rendu complet (texte + graphes + carte); appelé hors du thread Streamlit
+    from io import BytesIO
+    from reportlab.graphics import renderPDF
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    progress = progress or (lambda frac, label: None)
+    buff = BytesIO()
+    c = canvas.Canvas(buff, pagesize=A4)
+    width, height = A4
+
+    y = height - 50
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(40, y, "Ganvié Durable 2030 – Note de synthèse (extrait)")
+    y -= 18
+    c.setFont("Helvetica", 10)
+    c.drawString(40, y, f"Période: {meta['start']} → {meta['end']} | Zones: {', '.join(meta['zones']) if meta['zones'] else '—'}")
+    y -= 26
+
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(40, y, "Indicateurs clés")
+    y -= 16
+    c.setFont("Helvetica", 10)
+    lines = [
+        f"• Accès à une source d’eau améliorée: {kpis['pct_water']:.1f}%",
+        f"• Ménages avec dispositif d’assainissement: {kpis['pct_san']:.1f}%",
+        f"• Scolarisation (proxy): {kpis['pct_school']:.1f}%",
+        f"• Ménages déclarant ≥3 besoins: {kpis['pct_3needs']:.1f}%",
+        f"• Ménages enquêtés (filtres): {kpis['surveyed']} / cible: {kpis['target']}",
+    ]
+    for ln in lines:
+        c.drawString(50, y, ln); y -= 14
+
+    y -= 8
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(40, y, "Top zones prioritaires (score composite)")
+    y -= 16
+    c.setFont("Helvetica", 9)
+
+    if tz_df is None or tz_df.empty:
+        c.drawString(50, y, "—"); y -= 14
+    else:
+        for _, r in tz_df.head(10).iterrows():
+            c.drawString(50, y, f"- {r['zone']} | vuln. élevée: {r['vuln_elevee_pct']:.0f}% | sans assain.: {r['sans_san_pct']:.0f}% | besoins moy.: {r['besoins_moy']:.2f}")
+            y -= 12
+            if y < 80:
+                c.showPage()
+                y = height - 60
+    progress(0.4, "Texte")
+
+    # Graphes KPIs / scores de zone
+    if y < 200:
+        c.showPage()
+        y = height - 60
+    y -= 140
+    renderPDF.draw(_kpi_chart(kpis), c, 40, y)
+    if tz_df is not None and not tz_df.empty:
+        renderPDF.draw(_zone_chart(tz_df), c, 300, y)
+    progress(0.6, "Graphes")
+
+    c.setFont("Helvetica-Oblique", 8)
+    c.drawString(40, 40, "Document généré automatiquement depuis le dashboard (démo).")
+
+    # Carte des zones
+    c.showPage()
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(40, height - 50, "Carte: intensité des besoins (carrés) et qualité de l’eau (cercles)")
+    renderPDF.draw(_map_drawing(hh_cells, water_cells), c, 40, height - 400)
+    progress(0.9, "Carte")
+
+    c.save()
+    buff.seek(0)
+    return buff.getvalue()
+
+# ------------------ Tâches de fond + cache disque ------------------
+
+def report_key(conn, meta) -> str:
+    versions = [db.data_version(conn, t) for t in ("households", "water_samples", "targets")]
+    payload = json.dumps({"meta": meta, "versions": versions}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+def _cache_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.pdf")
+
+def purge_cache(max_age_s: float = MAX_AGE_S, max_bytes: int = MAX_CACHE_BYTES):
+    """Supprime les PDF trop anciens, puis les plus anciens jusqu'à repasser sous max_bytes."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    now = time.time()
+    files = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        st = os.stat(path)
+        if now - st.st_mtime > max_age_s:
+            os.remove(path)
+        else:
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+def _render(key, filters, meta, progress):
+    conn = db.reader()
+    progress(0.05, "Lecture des données")
+    kpis = analysis.kpis_for(conn, filters)
+    tz = analysis.zones_for(conn, filters)
+    progress(0.2, "Préparation de la carte")
+    _, hh_cells, _ = mapping.households_map_for(conn, filters, 500)
+    _, water_cells, _ = mapping.water_map_for(conn, filters, 500)
+    pdf = report_pdf_bytes(meta, kpis, tz, hh_cells, water_cells, progress=progress)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = _cache_path(key) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(pdf)
+    os.replace(tmp, _cache_path(key))
+    purge_cache()
+    progress(1.0, "Terminé")
+    return _cache_path(key)
+
+class ReportJobs:
+    def __init__(self, max_workers: int = 1):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._jobs = {}      # key -> Future
+        self._progress = {}  # key -> (fraction, label)
+        self._lock = threading.Lock()
+
+    def submit(self, conn, filters, meta) -> str:
+        """Lance (ou réutilise) le rendu de la note; retourne sa clé."""
+        key = report_key(conn, meta)
+        with self._lock:
+            # Rendus terminés des autres notes: le cache disque fait foi
+            for done in [k for k, j in self._jobs.items() if j.done() and k != key]:
+                self._jobs.pop(done)
+                self._progress.pop(done, None)
+            job = self._jobs.get(key)
+            if os.path.exists(_cache_path(key)) or (job is not None and not job.done()):
+                return key
+
+            def progress(frac, label):
+                self._progress[key] = (frac, label)
+
+            progress(0.0, "En attente")
+            self._jobs[key] = self._pool.submit(_render, key, filters, meta, progress)
+        return key
+
+    def status(self, key: str) -> dict:
+        """{"state": done|running|error|unknown, "progress", "label", "path", "error"}."""
+        path = _cache_path(key)
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None and job.done() and job.exception() is not None:
+            return dict(state="error", error=str(job.exception()))
+        if os.path.exists(path) and (job is None or job.done()):
+            return dict(state="done", path=path, progress=1.0, label="Terminé")
+        if job is None or job.done():
+            # jamais demandée, ou rendue puis purgée du cache: à relancer
+            return dict(state="unknown")
+        frac, label = self._progress.get(key, (0.0, ""))
+        return dict(state="running", progress=frac, label=label)
+
+JOBS = ReportJobs()
@@ -0,0 +1,119 @@
+"""
+Classement des prélèvements d'eau par niveau de risque, selon des profils de
+seuils (risk_profiles.toml).
+
+Le même profil s'applique de deux façons équivalentes:
+- `classify(df)`: comparaisons NumPy sur un lot (ingestion, générateur);
+- `case_sql(profile)`: expression CASE paramétrée, pour reclasser tout
+  l'historique en une requête (database.reclassify_water).
+Aucune boucle Python sur les lignes.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_profiles.toml")
+
+# Ordre de gravité croissante (code = position)
+LEVELS = ["Conforme", "A_surveiller", "A_risque"]
+MEASURES = ["ph", "turbidity", "conductivity", "e_coli", "coliforms"]
+
+# ------------------ Profils ------------------
+
+def _parse_profile(name: str, raw: dict) -> dict:
+    """Normalise un profil: règles (code, mesure, "min"|"max", seuil) et mesures absentes (code, mesure)."""
+    rules, missing = [], []
+    for level in LEVELS[1:]:
+        for measure, bounds in raw.get(level, {}).items():
+            if measure not in MEASURES:
+                raise ValueError(f"Profil {name}: mesure inconnue {measure!r} (attendu: {', '.join(MEASURES)})")
+            for bound, value in bounds.items():
+                if bound not in ("min", "max"):
+                    raise ValueError(f"Profil {name}: borne inconnue {bound!r} pour {measure} (min | max)")
+                rules.append((LEVELS.index(level), measure, bound, float(value)))
+    for measure, level in raw.get("missing", {}).items():
+        if measure not in MEASURES or level not in LEVELS:
+            raise ValueError(f"Profil {name}: règle de mesure absente invalide {measure} = {level!r}")
+        missing.append((LEVELS.index(level), measure))
+    unknown = set(raw) - set(LEVELS[1:]) - {"label", "missing"}
+    if unknown:
+        raise ValueError(f"Profil {name}: sections inconnues {', '.join(sorted(unknown))}")
+    return dict(name=name, label=raw.get("label", name), rules=rules, missing=missing)
+
+@lru_cache(maxsize=4)
+def _load(path: str, mtime: float) -> dict:
+    with open(path, "rb") as f:
+        raw = tomllib.load(f)
+    profiles = {name: _parse_profile(name, p) for name, p in raw.get("profiles", {}).items()}
+    active = raw.get("active")
+    if active not in profiles:
+        raise ValueError(f"{path}: profil actif {active!r} absent de [profiles]")
+    return dict(active=active, profiles=profiles)
+
+def load_profiles(path: str = None) -> dict:
+    """{"active": nom, "profiles": {nom: profil}}; relu si le fichier a changé."""
+    path = path or PROFILES_PATH
+    return _load(path, os.path.getmtime(path))
+
+def get_profile(name: str = None, path: str = None) -> dict:
+    """Profil `name` (défaut: profil actif)."""
+    conf = load_profiles(path)
+    name = name or conf["active"]
+    if name not in conf["profiles"]:
+        raise ValueError(f"Profil inconnu: {name} (disponibles: {', '.join(conf['profiles'])})")
+    return conf["profiles"][name]
+
+# ------------------ Classement ------------------
+
+def _measure(df, column: str) -> np.ndarray:
+    # Colonne absente ou non numérique (CSV brut) -> NaN, traité comme mesure manquante
+    if column not in df:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+def classify_codes(df, profile: dict = None) -> np.ndarray:
+    """Code de niveau (index dans LEVELS) de chaque ligne de `df`."""
+    profile = profile or get_profile()
+    codes = np.zeros(len(df), dtype=np.int8)
+    values = {}
+    for code, measure, bound, threshold in profile["rules"]:
+        v = values.setdefault(measure, _measure(df, measure))
+        hit = v < threshold if bound == "min" else v > threshold
+        codes[hit & (codes < code)] = code
+    for code, measure in profile["missing"]:
+        v = values.setdefault(measure, _measure(df, measure))
+        codes[np.isnan(v) & (codes < code)] = code
+    return codes
+
+def classify(df, profile: dict = None) -> np.ndarray:
+    """Niveau de risque (libellés de LEVELS) de chaque ligne de `df`."""
+    return np.array(LEVELS, dtype=object)[classify_codes(df, profile)]
+
+def case_sql(profile: dict = None):
+    """(expression SQL, paramètres) donnant le niveau de risque d'une ligne de water_samples.
+
+    Les NULL ne franchissent aucun seuil (comme NaN côté NumPy); les branches
+    sont testées du niveau le plus grave au moins grave.
+    """
+    profile = profile or get_profile()
+    branches, params = [], []
+    for code in range(len(LEVELS) - 1, 0, -1):
+        conds, cond_params = [], []
+        for c, measure, bound, threshold in profile["rules"]:
+            if c == code:
+                conds.append(f"{measure} {'<' if bound == 'min' else '>'} ?")
+                cond_params.append(threshold)
+        conds += [f"{measure} IS NULL" for c, measure in profile["missing"] if c == code]
+        if conds:
+            branches.append(f"WHEN {' OR '.join(conds)} THEN ?")
+            params += cond_params + [LEVELS[code]]
+    if not branches:
+        return "?", [LEVELS[0]]
+    return f"CASE {' '.join(branches)} ELSE ? END", params + [LEVELS[0]]
@@ -2,10 +2,13 @@
 Génère des données fictives (démo) pour tester le dashboard.
 ⚠️ À remplacer par la vraie ingestion (Kobo/ODK → API → DB) en production.
 """
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 import random
 import numpy as np
+import pandas as pd
 import database as db
+import risk_rules
 
 ZONES = ["Ganvié-Centre", "Sô-Zounko", "Hêvié-Ganvié", "Ahomey-Lokpo", "Vekky", "Djrègbé-Ganvié"]
 ACTIVITIES = ["Pêche", "Commerce", "Artisanat", "Tourisme", "Sans emploi", "Autre"]
@@ -18,23 +21,21 @@ def _rand_point():
     lon = random.uniform(2.38, 2.50)
     return lat, lon
 
-def _risk_level(ph, turb, ecoli):
-    # Règles simplifiées : à adapter avec normes locales/OMS
-    if ecoli is None:
-        return "A_surveiller"
-    if ecoli > 100 or turb > 20 or ph < 6.0 or ph > 8.5:
-        return "A_risque"
-    if ecoli > 10 or turb > 10:
-        return "A_surveiller"
-    return "Conforme"
-
 def seed(n_households=250, n_samples=40, days=120, target=1000):
-    conn = db.get_connection()
+    with db.writer() as conn:
+        _seed(conn, n_households, n_samples, days, target)
+    print(f"✅ Données fictives générées dans {db.DB_PATH}")
+
+def _seed(conn, n_households, n_samples, days, target):
     db.init_db(conn)
     db.upsert_target(conn, int(target))
 
     start = datetime.now() - timedelta(days=int(days))
+    db.insert_households_many(conn, household_rows(n_households, start, days))
+    db.insert_water_samples_many(conn, water_rows(n_samples, start, days))
 
+def household_rows(n_households, start, days):
+    """Génère `n_households` ménages fictifs (dicts), un par un."""
     for _ in range(int(n_households)):
         dt = start + timedelta(days=random.randint(0, int(days)))
         zone = random.choice(ZONES)
@@ -74,8 +75,10 @@ def seed(n_households=250, n_samples=40, days=120, target=1000):
             notes=None,
             **needs
         )
-        db.insert_household(conn, row)
+        yield row
 
+def water_rows(n_samples, start, days):
+    """Génère `n_samples` prélèvements d'eau fictifs (dicts), un par un."""
     for _ in range(int(n_samples)):
         dt = start + timedelta(days=random.randint(0, int(days)))
         zone = random.choice(ZONES)
@@ -88,8 +91,7 @@ def seed(n_households=250, n_samples=40, days=120, target=1000):
         ecoli = int(max(0, random.gauss(30, 60)))
         coliforms = int(max(0, random.gauss(80, 120)))
 
-        risk = _risk_level(ph, turb, ecoli)
-
+        # risk_level est posé à l'ingestion (db.insert_water_samples_many)
         row = dict(
             collected_at=dt.isoformat(),
             zone=zone,
@@ -101,13 +103,132 @@ def seed(n_households=250, n_samples=40, days=120, target=1000):
             conductivity=cond,
             e_coli=ecoli,
             coliforms=coliforms,
-            risk_level=risk,
             comments=None
         )
-        db.insert_water_sample(conn, row)
+        yield row
+
+# ------------------ Générateur vectorisé (grands volumes) ------------------
+# Mêmes distributions que household_rows / water_rows, mais colonne par
+# colonne avec un numpy.random.Generator: reproductible pour une graine et
+# une date de début données, et quelques secondes pour un million de ménages.
+
+NEED_FACTORS = {
+    "needs_water": 1.0,
+    "needs_sanitation": 1.0,
+    "needs_housing": 0.9,
+    "needs_education": 0.8,
+    "needs_health": 0.8,
+    "needs_economic": 1.0,
+}
+
+def _iso_dates(rng, n, start, days):
+    offsets = rng.integers(0, int(days) + 1, size=n).astype("timedelta64[D]")
+    return np.datetime_as_string(np.datetime64(start, "s") + offsets, unit="s")
+
+def generate_households(n, start, days=120, rng=None):
+    """DataFrame de `n` ménages fictifs (colonnes de la table households)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    vuln = rng.choice(np.array(VULN, dtype=object), size=n, p=[0.35, 0.40, 0.25])
+    high = vuln == "Élevé"
+    base_p = np.select([vuln == "Faible", vuln == "Moyen"], [0.35, 0.55], 0.75)
+    df = pd.DataFrame({
+        "collected_at": _iso_dates(rng, n, start, days),
+        "zone": rng.choice(np.array(ZONES, dtype=object), size=n),
+        "lat": rng.uniform(6.40, 6.48, size=n),
+        "lon": rng.uniform(2.38, 2.50, size=n),
+        "hh_size": rng.integers(1, 11, size=n),
+        "main_activity": rng.choice(np.array(ACTIVITIES, dtype=object), size=n),
+        "vulnerability": vuln,
+        "water_improved": (rng.random(n) < np.where(high, 0.35, 0.55)).astype(np.int8),
+        "sanitation": (rng.random(n) < np.where(high, 0.25, 0.45)).astype(np.int8),
+        "children_schooling": (rng.random(n) < np.where(high, 0.55, 0.70)).astype(np.int8),
+        "health_access": (rng.random(n) < np.where(high, 0.45, 0.62)).astype(np.int8),
+    })
+    draws = rng.random((n, len(NEED_FACTORS)))
+    for j, (col, factor) in enumerate(NEED_FACTORS.items()):
+        df[col] = (draws[:, j] < base_p * factor).astype(np.int8)
+    df["notes"] = None
+    # Ordre de collecte, comme à l'ingestion: les index sur la date sont remplis
+    # presque en ajout (~4 s de moins pour 1M ménages sous SQLite)
+    return df.sort_values("collected_at", kind="stable", ignore_index=True)
+
+def generate_water_samples(n, start, days=120, rng=None):
+    """DataFrame de `n` prélèvements fictifs (colonnes de la table water_samples)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    ph = rng.uniform(5.5, 9.0, size=n).round(2)
+    turb = np.maximum(0, rng.normal(12, 6, size=n)).round(1)
+    ecoli = np.maximum(0, rng.normal(30, 60, size=n)).astype(np.int64)
+    df = pd.DataFrame({
+        "collected_at": _iso_dates(rng, n, start, days),
+        "zone": rng.choice(np.array(ZONES, dtype=object), size=n),
+        "lat": rng.uniform(6.40, 6.48, size=n),
+        "lon": rng.uniform(2.38, 2.50, size=n),
+        "season": rng.choice(np.array(SEASONS, dtype=object), size=n),
+        "ph": ph,
+        "turbidity": turb,
+        "conductivity": np.maximum(50, rng.normal(900, 500, size=n)).round(0),
+        "e_coli": ecoli,
+        "coliforms": np.maximum(0, rng.normal(80, 120, size=n)).astype(np.int64),
+        "risk_level": None,
+        "comments": None,
+    })
+    # Même classement qu'à l'ingestion (profil actif de risk_rules)
+    df["risk_level"] = risk_rules.classify(df)
+    return df
+
+def generate_chunks(kind, n, start, days=120, seed=None, chunk_size=250000):
+    """Blocs successifs (DataFrames) de `n` lignes au total, depuis une graine unique."""
+    rng = np.random.default_rng(seed)
+    make = generate_households if kind == "households" else generate_water_samples
+    for offset in range(0, int(n), chunk_size):
+        yield make(min(chunk_size, int(n) - offset), start, days, rng)
+
+def default_start(days):
+    # Minuit: deux exécutions le même jour avec la même graine sont identiques
+    return datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=int(days))
+
+def seed_fast(n_households=1_000_000, n_samples=20_000, days=120, target=1000, seed=None, start=None, conn=None):
+    """Variante vectorisée de seed(), en bloc dans la base (un bloc = une transaction).
+
+    Données régénérables: sous SQLite, chargement sans journal ni fsync
+    (deferred_rollup(journal=False)); un arrêt en cours peut corrompre la base.
+    """
+    start = start or default_start(days)
+    with db.writer() if conn is None else nullcontext(conn) as conn:
+        db.init_db(conn)
+        db.upsert_target(conn, int(target))
+        rng_seeds = np.random.SeedSequence(seed).spawn(2)
+        with db.deferred_rollup(conn, journal=False):
+            for chunk in generate_chunks("households", n_households, start, days, seed=rng_seeds[0]):
+                db.insert_households_many(conn, chunk)
+            for chunk in generate_chunks("water_samples", n_samples, start, days, seed=rng_seeds[1]):
+                db.insert_water_samples_many(conn, chunk)
+
+def generate_to_file(kind, n, path, days=120, seed=None, start=None) -> int:
+    """Écrit `n` lignes générées dans un CSV (.csv / .csv.gz) ou un Parquet (.parquet)."""
+    start = start or default_start(days)
+    chunks = generate_chunks(kind, n, start, days, seed=seed)
+    rows = 0
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
-    conn.close()
-    print("✅ Données fictives générées dans ganvie_durable.db")
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, index=False, header=(i == 0), mode="w" if i == 0 else "a")
+        rows += len(chunk)
+    return rows
 
 if __name__ == "__main__":
     seed()
\ No newline at end of file
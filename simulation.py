@@ -0,0 +1,223 @@
+"""
+Simulation Monte Carlo de scénarios d'intervention (section Insights).
+
+Un scénario donne, pour chaque zone ciblée, un gain visé en points de % par
+levier (eau, assainissement, habitat, éducation, santé, activités
+économiques):
+
+    {"Vekky": {"water": 15, "sanitation": 10}, "Sô-Zounko": {"water": 15}}
+
+Chaque tirage applique le scénario ménage par ménage: dans une zone, les
+ménages éligibles (sans l'équipement, ou ayant le besoin) sont convertis avec
+une probabilité calée sur le gain visé, multipliée par un taux de réalisation
+tiré par zone et par levier (loi Bêta, moyenne 80 %). Une conversion eau ou
+assainissement apporte l'équipement et lève le besoin correspondant; les
+autres leviers lèvent le besoin.
+
+Les ménages d'une même cellule (zone, équipements, combinaison de besoins)
+sont interchangeables: au lieu d'un aléa par ménage et par tirage, chaque
+levier convertit en NumPy un effectif binomial de chaque cellule, qui passe
+dans la cellule d'arrivée (tirages traités par blocs). Les indicateurs sont
+lus sur les cellules finales: leur loi jointe est celle du modèle ménage par
+ménage (simulation_check.py le vérifie), pour un coût indépendant du nombre
+de ménages. La graine est fixe: un même scénario donne
+toujours le même résultat, et les scénarios d'un balayage sont comparés sur
+les mêmes aléas.
+"""
+import os
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import cache
+import database as db
+
+# levier -> (indicateur apporté ou None, besoin levé)
+LEVERS = {
+    "water": ("water_improved", "needs_water"),
+    "sanitation": ("sanitation", "needs_sanitation"),
+    "housing": (None, "needs_housing"),
+    "education": (None, "needs_education"),
+    "health": (None, "needs_health"),
+    "economic": (None, "needs_economic"),
+}
+LEVER_LABELS = dict(zip(LEVERS, ["Eau améliorée", "Assainissement", "Habitat", "Éducation", "Santé", "Activités économiques"]))
+METRICS = ["pct_water", "pct_san", "pct_3needs"]
+RESULT_COLUMNS = ["metric", "actuel", "simule", "ic_bas", "ic_haut"]
+
+DRAWS = 1000
+CI = 0.95
+REALIZATION = (8.0, 2.0)         # loi Bêta du taux de réalisation (moyenne 0,8, écart-type ≈ 0,12)
+BLOCK_CELLS = 8_000_000          # tirages × groupes × besoins levés par bloc (mémoire bornée)
+WORKERS = int(os.environ.get("GANVIE_SIM_WORKERS", "0"))   # processus pour les balayages (0 = aucun)
+
+HOUSEHOLD_COLUMNS = ["household_id", "zone", "water_improved", "sanitation", "needs_mask"]
+
+def household_arrays(h) -> dict:
+    """Tableaux NumPy des ménages filtrés (`h`: zone, water_improved, sanitation, needs_mask)."""
+    codes, zones = pd.factorize(h["zone"].astype(object), sort=True)
+    return dict(
+        zone=codes.astype(np.int32),
+        zones=list(zones),
+        water_improved=(h["water_improved"].fillna(0).to_numpy() == 1),
+        sanitation=(h["sanitation"].fillna(0).to_numpy() == 1),
+        needs_mask=h["needs_mask"].to_numpy().astype(np.uint8),
+    )
+
+def _quantiles(values, ci: float):
+    lo, hi = np.quantile(values, [(1 - ci) / 2, (1 + ci) / 2])
+    return float(lo), float(hi)
+
+# Cellule d'un ménage: bits 0-5 besoins (needs_mask), 6 eau, 7 assainissement,
+# 8 eau au départ, 9 « ≥ 3 besoins » au départ, puis la zone
+WATER_BIT, SAN_BIT, WATER0_BIT, NEEDS3_BIT, ZONE_SHIFT = 1 << 6, 1 << 7, 1 << 8, 1 << 9, 10
+NEEDS_BITS = (1 << len(LEVERS)) - 1
+COUNTS = ["water", "sanitation", "needs3", "left_needs3", "left_needs3_water"]
+
+def _transitions(keys: np.ndarray, lever: str):
+    """(masque des cellules de `keys` éligibles au levier, cellules après conversion)."""
+    indicator, need = LEVERS[lever]
+    bit = 1 << db.NEED_COLUMNS.index(need)
+    if indicator:
+        flag = WATER_BIT if indicator == "water_improved" else SAN_BIT
+        eligible = keys & flag == 0
+        return eligible, (keys[eligible] | flag) & ~bit
+    eligible = keys & bit != 0
+    return eligible, keys[eligible] & ~bit
+
+def draw_counts(h: dict, scenario: dict, draws: int = DRAWS, seed: int = 0) -> dict:
+    """Effectifs tirés du scénario sur les ménages `h` (household_arrays), par tirage.
+
+    Les ménages d'une même cellule (zone, équipements, combinaison de besoins,
+    état de départ) sont interchangeables: chaque levier convertit, par
+    tirage, un effectif binomial de chaque cellule éligible, qui passe dans la
+    cellule d'arrivée. Les indicateurs (COUNTS) sont lus sur les cellules
+    finales: un ménage sorti de « ≥ 3 besoins » est un ménage converti.
+    """
+    n, zones = len(h["zone"]), len(h["zones"])
+    key = ((h["zone"].astype(np.int64) << ZONE_SHIFT) | h["sanitation"] * SAN_BIT | h["water_improved"] * WATER_BIT
+           | h["needs_mask"])
+    initial = np.bincount(key, minlength=zones << ZONE_SHIFT)
+    cells = np.flatnonzero(initial)
+    present = initial[cells]
+    # État de départ porté par la cellule
+    cells = cells | (cells & WATER_BIT != 0) * WATER0_BIT | (analysis.NEED_COUNT_LUT[cells & NEEDS_BITS] >= 3) * NEEDS3_BIT
+
+    # Probabilité de conversion par levier actif et zone (ménages éligibles du levier)
+    zone_of = {z: i for i, z in enumerate(h["zones"])}
+    targets = {zone_of[z]: g for z, g in scenario.items() if z in zone_of}
+    levers = [lv for lv in LEVERS if any(g.get(lv, 0) > 0 for g in targets.values())]
+    per_zone = np.bincount(cells >> ZONE_SHIFT, weights=present, minlength=zones)
+    prob = np.zeros((len(levers), zones))
+    for i, lv in enumerate(levers):
+        src = _transitions(cells, lv)[0]
+        open_zone = np.bincount(cells[src] >> ZONE_SHIFT, weights=present[src], minlength=zones)
+        for z, gains in targets.items():
+            if gains.get(lv, 0) > 0 and open_zone[z]:
+                prob[i, z] = min(1.0, gains[lv] / 100 * per_zone[z] / open_zone[z])
+
+    # Seul le nombre (plafonné à 3) des besoins qu'aucun levier ne touche compte:
+    # ces besoins sont ramenés aux premiers bits libres, ce qui fusionne des cellules
+    touched = sum(1 << db.NEED_COLUMNS.index(LEVERS[lv][1]) for lv in levers)
+    free = [1 << b for b in range(len(db.NEED_COLUMNS)) if not touched >> b & 1]
+    canonical = np.cumsum([0] + free[:3])
+    other = np.minimum(analysis.NEED_COUNT_LUT[cells & NEEDS_BITS & ~touched], 3)
+    cells, merged = np.unique(cells & ~(NEEDS_BITS & ~touched) | canonical[other], return_inverse=True)
+    present = np.bincount(merged, weights=present).astype(np.int64)
+
+    # Cellules atteignables, levier après levier: chaque levier ne tire que sur les cellules
+    # que les leviers précédents ont pu remplir (les leviers sont indépendants: un levier
+    # ne change que son équipement et son besoin, l'ordre est indifférent)
+    reachable, steps = cells, []
+    for i, lv in enumerate(levers):
+        src, dst = _transitions(reachable, lv)
+        src = reachable[src]
+        active = prob[i, src >> ZONE_SHIFT] > 0
+        steps.append((src[active], dst[active]))
+        reachable = np.union1d(reachable, dst[active])
+    start_counts = np.zeros(len(reachable), dtype=np.int64)
+    start_counts[np.searchsorted(reachable, cells)] = present
+    cells, moves = reachable, []
+    for src, dst in steps:
+        # Plusieurs cellules peuvent mener à la même (besoin déjà absent ou non): arrivées regroupées
+        order = np.argsort(dst, kind="stable")
+        arrival, first = np.unique(dst[order], return_index=True)
+        moves.append((np.searchsorted(cells, src), src >> ZONE_SHIFT, order, first, np.searchsorted(cells, arrival)))
+
+    # Indicateurs de chaque cellule finale
+    needs3 = analysis.NEED_COUNT_LUT[cells & NEEDS_BITS] >= 3
+    left = (cells & NEEDS3_BIT != 0) & ~needs3
+    weights = np.column_stack([
+        cells & WATER_BIT != 0,
+        cells & SAN_BIT != 0,
+        needs3,
+        left,
+        left & (cells & WATER_BIT != 0) & (cells & WATER0_BIT == 0),
+    ]).astype(np.int64)
+
+    # Un flux aléatoire par levier: modifier un levier ne change pas les taux de réalisation des autres
+    streams = [np.random.default_rng([seed, list(LEVERS).index(lv)]) for lv in levers]
+    realization = [streams[i].beta(*REALIZATION, size=(draws, zones)) for i in range(len(levers))]
+    out = np.zeros((draws, len(COUNTS)), dtype=np.int64)
+    block = max(1, BLOCK_CELLS // max(1, len(cells) * max(1, len(levers))))
+    for start in range(0, draws, block):
+        stop = min(draws, start + block)
+        counts = np.broadcast_to(start_counts, (stop - start, len(cells))).copy()
+        for i, (src, zone, order, first, arrival) in enumerate(moves):
+            moved = streams[i].binomial(counts[:, src], prob[i, zone] * realization[i][start:stop][:, zone])
+            counts[:, src] -= moved
+            counts[:, arrival] += np.add.reduceat(moved[:, order], first, axis=1)
+        out[start:stop] = counts @ weights
+    return dict(zip(COUNTS, out.T), households=n)
+
+def simulate(h: dict, scenario: dict, draws: int = DRAWS, seed: int = 0, ci: float = CI):
+    """Tirages du scénario sur les ménages `h` (household_arrays).
+
+    Une ligne par indicateur de METRICS: valeur actuelle, moyenne simulée et
+    intervalle de confiance `ci` (quantiles des tirages), en %.
+    """
+    n = len(h["zone"])
+    count = analysis.NEED_COUNT_LUT[h["needs_mask"]]
+    current = {
+        "pct_water": int(h["water_improved"].sum()),
+        "pct_san": int(h["sanitation"].sum()),
+        "pct_3needs": int((count >= 3).sum()),
+    }
+    drawn = draw_counts(h, scenario, draws, seed)
+    values = {"pct_water": drawn["water"], "pct_san": drawn["sanitation"], "pct_3needs": drawn["needs3"]}
+    out = []
+    for m in METRICS:
+        pct = 100 * values[m] / n if n else np.zeros(draws)
+        lo, hi = _quantiles(pct, ci) if draws else (np.nan, np.nan)
+        out.append((m, 100 * current[m] / n if n else 0.0, float(pct.mean()) if draws else np.nan, lo, hi))
+    return pd.DataFrame(out, columns=RESULT_COLUMNS)
+
+def sweep(h: dict, scenarios: list, draws: int = DRAWS, seed: int = 0, workers: int = None):
+    """simulate pour chaque scénario (mêmes aléas); sur `workers` processus si > 1.
+
+    Retourne les résultats concaténés, avec le rang du scénario (colonne `scenario`).
+    """
+    workers = WORKERS if workers is None else workers
+    if workers > 1 and len(scenarios) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(scenarios))) as pool:
+            results = list(pool.map(simulate, repeat(h), scenarios, repeat(draws), repeat(seed)))
+    else:
+        results = [simulate(h, s, draws, seed) for s in scenarios]
+    return pd.concat([r.assign(scenario=i) for i, r in enumerate(results)], ignore_index=True)
+
+# ------------------ Chargement (cache par scénario et version des données) ------------------
+
+@cache.memoize_append("households")
+def _households_for(conn, filters):
+    return db.query_households(conn, filters, columns=HOUSEHOLD_COLUMNS)
+
+@cache.memoize("households")
+def simulate_for(conn, filters, scenario, draws=DRAWS):
+    return simulate(household_arrays(_households_for(conn, filters)), scenario, draws)
+
+@cache.memoize("households")
+def sweep_for(conn, filters, scenarios, draws=DRAWS):
+    return sweep(household_arrays(_households_for(conn, filters)), scenarios, draws)
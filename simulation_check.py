@@ -0,0 +1,150 @@
+"""
+Vérification de la simulation de scénarios contre le modèle ménage par ménage.
+
+simulation.draw_counts tire des effectifs par cellule de ménages
+interchangeables. Ce script rejoue les mêmes scénarios ménage par ménage (un
+aléa par ménage, par levier et par tirage) et compare, pour chaque effectif
+de simulation.COUNTS, la moyenne (écart < 4 erreurs-types), l'écart-type et,
+pour les effectifs conjoints, la corrélation avec le gain d'accès à l'eau.
+Chaque tirage doit aussi être cohérent: un ménage sorti de « ≥ 3 besoins »
+n'en sort que par une conversion. Code de sortie 1 en cas d'écart.
+
+    python simulation_check.py
+    python simulation_check.py --households 5000 --draws 4000
+"""
+import argparse
+import sys
+from datetime import datetime
+
+import numpy as np
+
+import analysis
+import database as db
+import seed_data
+import simulation
+
+START = datetime(2025, 1, 1)
+BLOCK = 200
+
+# ------------------ Modèle ménage par ménage ------------------
+
+def simulate_households(h: dict, scenario: dict, draws: int, seed: int) -> dict:
+    """Effectifs de simulation.COUNTS par tirage, un aléa par ménage."""
+    rng = np.random.default_rng(seed)
+    n, zones = len(h["zone"]), len(h["zones"])
+    zone_of = {z: i for i, z in enumerate(h["zones"])}
+    needs3_start = analysis.NEED_COUNT_LUT[h["needs_mask"]] >= 3
+    per_zone = np.bincount(h["zone"], minlength=zones)
+    levers, prob = [], []
+    for lv, (indicator, need) in simulation.LEVERS.items():
+        bit = db.NEED_COLUMNS.index(need)
+        eligible = ~h[indicator] if indicator else (h["needs_mask"] >> bit & 1 == 1)
+        open_zone = np.bincount(h["zone"], weights=eligible, minlength=zones)
+        p = np.zeros(zones)
+        for z, gains in scenario.items():
+            if z in zone_of and gains.get(lv, 0) > 0 and open_zone[zone_of[z]]:
+                i = zone_of[z]
+                p[i] = min(1.0, gains[lv] / 100 * per_zone[i] / open_zone[i])
+        if p.any():
+            levers.append(lv)
+            prob.append(p)
+
+    out = np.zeros((draws, len(simulation.COUNTS)), dtype=np.int64)
+    for start in range(0, draws, BLOCK):
+        b = min(BLOCK, draws - start)
+        water = np.tile(h["water_improved"], (b, 1))
+        sanitation = np.tile(h["sanitation"], (b, 1))
+        mask = np.tile(h["needs_mask"], (b, 1))
+        for lv, p in zip(levers, prob):
+            indicator, need = simulation.LEVERS[lv]
+            bit = db.NEED_COLUMNS.index(need)
+            realization = rng.beta(*simulation.REALIZATION, size=(b, zones))
+            eligible = {"water_improved": ~water, "sanitation": ~sanitation}.get(indicator, mask >> bit & 1 == 1)
+            hit = eligible & (rng.random((b, n)) < p[h["zone"]] * realization[:, h["zone"]])
+            if indicator == "water_improved":
+                water |= hit
+            elif indicator == "sanitation":
+                sanitation |= hit
+            mask = np.where(hit, mask & ~np.uint8(1 << bit), mask)
+        needs3 = analysis.NEED_COUNT_LUT[mask] >= 3
+        left = needs3_start & ~needs3
+        out[start:start + b] = np.column_stack([
+            water.sum(axis=1),
+            sanitation.sum(axis=1),
+            needs3.sum(axis=1),
+            left.sum(axis=1),
+            (left & water & ~h["water_improved"]).sum(axis=1),
+        ])
+    return dict(zip(simulation.COUNTS, out.T), households=n)
+
+# ------------------ Comparaison ------------------
+
+def scenarios(zones):
+    return {
+        "eau, deux zones": {z: {"water": 15} for z in zones[:2]},
+        "eau + assainissement + santé": {z: {"water": 15, "sanitation": 10, "health": 20} for z in zones[:2]},
+        "tous leviers, gains saturés": {z: dict.fromkeys(simulation.LEVERS, 90) for z in zones},
+        "sans levier": {},
+    }
+
+def _compare(name, cells, ref) -> int:
+    failures = 0
+    for c in simulation.COUNTS:
+        a, b = cells[c].astype(float), ref[c].astype(float)
+        se = np.sqrt(a.var() / len(a) + b.var() / len(b))
+        if abs(a.mean() - b.mean()) > max(4 * se, 1e-9):
+            print(f"ÉCART {name} / {c}: moyenne {a.mean():.2f} ≠ {b.mean():.2f} (erreur-type {se:.2f})")
+            failures += 1
+        if max(a.std(), b.std()) > 0 and not 0.85 < (a.std() + 1e-9) / (b.std() + 1e-9) < 1.18:
+            print(f"ÉCART {name} / {c}: écart-type {a.std():.2f} ≠ {b.std():.2f}")
+            failures += 1
+    # Effectifs conjoints: liés au gain d'eau comme dans le modèle ménage par ménage
+    for c in ("needs3", "left_needs3_water"):
+        if min(cells["water"].std(), cells[c].std(), ref["water"].std(), ref[c].std()) > 0:
+            a = np.corrcoef(cells["water"], cells[c])[0, 1]
+            b = np.corrcoef(ref["water"], ref[c])[0, 1]
+            if abs(a - b) > 0.1:
+                print(f"ÉCART {name} / corrélation eau × {c}: {a:.2f} ≠ {b:.2f}")
+                failures += 1
+    return failures
+
+def _consistency(name, h, drawn) -> int:
+    """Chaque tirage: effectifs conjoints compatibles avec les effectifs marginaux."""
+    water_start = int(h["water_improved"].sum())
+    needs3_start = int((analysis.NEED_COUNT_LUT[h["needs_mask"]] >= 3).sum())
+    checks = [
+        ("≥ 3 besoins = départ − sorties", drawn["needs3"] == needs3_start - drawn["left_needs3"]),
+        ("sorties avec eau ≤ gain d'eau", drawn["left_needs3_water"] <= drawn["water"] - water_start),
+        ("sorties avec eau ≤ sorties", drawn["left_needs3_water"] <= drawn["left_needs3"]),
+    ]
+    failures = 0
+    for label, ok in checks:
+        if not ok.all():
+            print(f"ÉCART {name}: {label} faux sur {int((~ok).sum())} tirage(s)")
+            failures += 1
+    return failures
+
+def run(households: int, draws: int, seed: int) -> int:
+    df = seed_data.generate_households(households, START, rng=np.random.default_rng(seed))
+    needs = df[db.NEED_COLUMNS].fillna(0).to_numpy(dtype=np.int64)
+    df["needs_mask"] = (needs << np.arange(len(db.NEED_COLUMNS))).sum(axis=1)
+    h = simulation.household_arrays(df)
+    failures, checks = 0, 0
+    for name, scenario in scenarios(h["zones"]).items():
+        cells = simulation.draw_counts(h, scenario, draws, seed)
+        ref = simulate_households(h, scenario, draws, seed + 1)
+        failures += _compare(name, cells, ref) + _consistency(name, h, cells) + _consistency(name, h, ref)
+        checks += 2 * len(simulation.COUNTS) + 2 + 6
+    print(f"{checks - failures} vérifications OK, {failures} écart(s)")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulation par cellules contre le modèle ménage par ménage")
+    parser.add_argument("--households", type=int, default=3000)
+    parser.add_argument("--draws", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=2030)
+    args = parser.parse_args(argv)
+    sys.exit(1 if run(args.households, args.draws, args.seed) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Index spatial ménages ↔ points d'eau (exposition aux points à risque).
+
+Les points d'eau sont rangés dans une grille régulière en mètres (projection
+équirectangulaire locale, suffisante à l'échelle de la lagune): les requêtes
+par rayon et du plus proche voisin ne comparent chaque ménage qu'aux points
+des cellules voisines, au lieu de tous les prélèvements. L'index est construit
+une fois par version des données (cache.memoize) et interrogé en bloc,
+vectorisé avec NumPy.
+"""
+import numpy as np
+import pandas as pd
+
+import cache
+import database as db
+import mapping
+
+RADII_M = [100, 250, 500, 1000]
+DEFAULT_RADIUS_M = 250
+NEAREST_MAX_M = 5000          # au-delà: pas de point d'eau « le plus proche »
+RISK_LEVEL = "A_risque"
+QUERY_CHUNK = 200_000         # paires (requête, cellule) examinées par bloc
+DENSE_MAX_CELLS = 4_000_000   # au-delà: table des cellules creuse (recherche dichotomique)
+
+HOUSEHOLD_COLUMNS = ["household_id", "zone", "lat", "lon"]
+WATER_COLUMNS = ["sample_id", "zone", "lat", "lon", "risk_level"]
+
+def _keys(cx, cy):
+    return cy * (1 << 32) + cx
+
+def _group_starts(sorted_ids):
+    return np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+
+# ------------------ Index en grille ------------------
+
+class GridIndex:
+    """Points (lat, lon) rangés par cellule carrée de `cell_m` mètres.
+
+    Les positions retournées par les requêtes sont celles des points dans les
+    tableaux passés au constructeur (les points sans coordonnées sont ignorés).
+    """
+
+    def __init__(self, lat, lon, cell_m=None, ref_lat=None):
+        lat = np.asarray(lat, dtype="float64")
+        lon = np.asarray(lon, dtype="float64")
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        self.ids = np.flatnonzero(valid)
+        self.ref_lat = float(ref_lat if ref_lat is not None else (lat[valid].mean() if valid.any() else 0.0))
+        self.x, self.y = self.project(lat[valid], lon[valid])
+        if cell_m is None:
+            # ~2 points par cellule occupée en moyenne
+            area = (np.ptp(self.x) + 1.0) * (np.ptp(self.y) + 1.0) if len(self.x) else 1.0
+            cell_m = float(np.clip(np.sqrt(2.0 * area / max(len(self.x), 1)), 10.0, 10_000.0))
+        self.cell_m = float(cell_m)
+        cx, cy = self._cells(self.x, self.y)
+        keys = _keys(cx, cy)
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys, self.starts, self.counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        # Table dense (cellule -> rang dans cell_keys) si l'emprise est raisonnable: accès direct
+        self.dense = None
+        if len(cx):
+            self.cx0, self.cy0 = int(cx.min()), int(cy.min())
+            self.ncols, self.nrows = int(cx.max()) - self.cx0 + 1, int(cy.max()) - self.cy0 + 1
+            if self.ncols * self.nrows <= DENSE_MAX_CELLS:
+                self.dense = np.full(self.ncols * self.nrows, -1, dtype=np.int64)
+                ucx, ucy = self.cell_keys % (1 << 32), self.cell_keys // (1 << 32)
+                self.dense[(ucy - self.cy0) * self.ncols + (ucx - self.cx0)] = np.arange(len(self.cell_keys))
+
+    def __len__(self):
+        return len(self.x)
+
+    def __sizeof__(self):
+        # pour le budget mémoire du cache (cache.sizeof)
+        arrays = (self.ids, self.x, self.y, self.order, self.cell_keys, self.starts, self.counts)
+        arrays += (self.dense,) if self.dense is not None else ()
+        return object.__sizeof__(self) + sum(a.nbytes for a in arrays)
+
+    def project(self, lat, lon):
+        y = np.asarray(lat, dtype="float64") * mapping.METERS_PER_DEG_LAT
+        x = np.asarray(lon, dtype="float64") * mapping.METERS_PER_DEG_LAT * np.cos(np.radians(self.ref_lat))
+        return x, y
+
+    def _cells(self, x, y):
+        return np.floor(x / self.cell_m).astype(np.int64), np.floor(y / self.cell_m).astype(np.int64)
+
+    def _pairs(self, qx, qy, offsets):
+        """Paires (requête, point indexé) dont le point est dans une cellule voisine décalée de `offsets`."""
+        cx, cy = self._cells(qx, qy)
+        ncx = (cx[:, None] + offsets[None, :, 0]).ravel()
+        ncy = (cy[:, None] + offsets[None, :, 1]).ravel()
+        qrep = np.repeat(np.arange(len(qx)), len(offsets))
+        if self.dense is not None:
+            col, row = ncx - self.cx0, ncy - self.cy0
+            inside = (col >= 0) & (col < self.ncols) & (row >= 0) & (row < self.nrows)
+            pos = np.full(len(ncx), -1, dtype=np.int64)
+            pos[inside] = self.dense[row[inside] * self.ncols + col[inside]]
+            hit = pos >= 0
+        else:
+            keys = _keys(ncx, ncy)
+            pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+            hit = self.cell_keys[pos] == keys
+        # qrep reste trié: les paires sortent groupées par requête
+        qrep, pos = qrep[hit], pos[hit]
+        cnt = self.counts[pos]
+        within_cell = np.arange(cnt.sum()) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        return np.repeat(qrep, cnt), self.order[np.repeat(self.starts[pos], cnt) + within_cell]
+
+    def count_within(self, lat, lon, radius_m: float) -> np.ndarray:
+        """Nombre de points indexés à moins de `radius_m` mètres de chaque point (lat, lon)."""
+        qx_all, qy_all = self.project(lat, lon)
+        out = np.zeros(len(qx_all), dtype=np.int64)
+        if len(self) == 0:
+            return out
+        reach = int(np.ceil(radius_m / self.cell_m))
+        r = np.arange(-reach, reach + 1)
+        offsets = np.stack(np.meshgrid(r, r), axis=-1).reshape(-1, 2)
+        valid = np.flatnonzero(np.isfinite(qx_all) & np.isfinite(qy_all))
+        step = max(1, QUERY_CHUNK // len(offsets))
+        for lo in range(0, len(valid), step):
+            q = valid[lo:lo + step]
+            qx, qy = qx_all[q], qy_all[q]
+            qi, pi = self._pairs(qx, qy, offsets)
+            dx, dy = self.x[pi] - qx[qi], self.y[pi] - qy[qi]
+            close = dx * dx + dy * dy <= radius_m * radius_m
+            out[q] = np.bincount(qi[close], minlength=len(q))
+        return out
+
+    def nearest(self, lat, lon, max_m: float = NEAREST_MAX_M):
+        """(position du point indexé le plus proche ou -1, distance en mètres ou NaN), par point (lat, lon).
+
+        Recherche par anneaux de cellules: après l'anneau k, un candidat à
+        moins de k × cell_m est forcément le plus proche.
+        """
+        best_pos = np.full(len(lat), -1, dtype=np.int64)
+        best_d = np.full(len(lat), np.inf)
+        if len(self) == 0:
+            return best_pos, np.full(len(lat), np.nan)
+        qx_all, qy_all = self.project(lat, lon)
+        active = np.flatnonzero(np.isfinite(qx_all) & np.isfinite(qy_all))
+        max_ring = int(np.ceil(max_m / self.cell_m)) + 1
+        for k in range(max_ring + 1):
+            if len(active) == 0:
+                break
+            r = np.arange(-k, k + 1)
+            offsets = np.stack(np.meshgrid(r, r), axis=-1).reshape(-1, 2)
+            offsets = offsets[np.maximum(np.abs(offsets[:, 0]), np.abs(offsets[:, 1])) == k]
+            step = max(1, QUERY_CHUNK // len(offsets))
+            for lo in range(0, len(active), step):
+                q = active[lo:lo + step]
+                qi, pi = self._pairs(qx_all[q], qy_all[q], offsets)
+                if len(qi) == 0:
+                    continue
+                d = np.hypot(self.x[pi] - qx_all[q][qi], self.y[pi] - qy_all[q][qi])
+                # plus proche candidat de chaque requête dans cet anneau (paires groupées par requête)
+                starts = _group_starts(qi)
+                mins = np.minimum.reduceat(d, starts)
+                is_min = np.flatnonzero(d == np.repeat(mins, np.diff(np.r_[starts, len(qi)])))
+                first = is_min[_group_starts(qi[is_min])]
+                target = q[qi[first]]
+                better = d[first] < best_d[target]
+                best_d[target[better]] = d[first][better]
+                best_pos[target[better]] = pi[first][better]
+            active = active[(best_d[active] > k * self.cell_m) & (k * self.cell_m < max_m)]
+        far = best_d > max_m
+        best_pos[far] = -1
+        best_d[far] = np.nan
+        return np.where(best_pos >= 0, self.ids[np.maximum(best_pos, 0)], -1), best_d
+
+# ------------------ Exposition des ménages ------------------
+
+def build_indexes(w) -> dict:
+    """Index de tous les points d'eau et des points à risque (`w`: lat, lon, risk_level, ...)."""
+    w = w.dropna(subset=["lat", "lon"]).reset_index(drop=True)
+    risk = w[w["risk_level"] == RISK_LEVEL].reset_index(drop=True)
+    ref_lat = float(w["lat"].mean()) if len(w) else 0.0
+    return dict(
+        points=w,
+        risk_points=risk,
+        all=GridIndex(w["lat"], w["lon"], ref_lat=ref_lat),
+        risk=GridIndex(risk["lat"], risk["lon"], ref_lat=ref_lat),
+    )
+
+def exposure(h, indexes: dict, radius_m: float = DEFAULT_RADIUS_M, max_nearest_m: float = NEAREST_MAX_M):
+    """Une ligne par ménage géolocalisé: points à risque dans le rayon, point d'eau le plus proche."""
+    h = h.dropna(subset=["lat", "lon"]).reset_index(drop=True)
+    risk_points = indexes["risk"].count_within(h["lat"], h["lon"], radius_m)
+    pos, dist = indexes["all"].nearest(h["lat"], h["lon"], max_nearest_m)
+    found = pos >= 0
+    nearest = indexes["points"].iloc[np.maximum(pos, 0)] if len(indexes["points"]) else None
+    out = h.assign(
+        risk_points=risk_points.astype(np.int32),
+        exposed=risk_points > 0,
+        nearest_m=dist.astype("float32"),
+    )
+    if nearest is not None:
+        out["nearest_sample_id"] = pd.Series(np.where(found, nearest["sample_id"].to_numpy(), 0), dtype="Int64").where(found)
+        out["nearest_risk"] = nearest["risk_level"].reset_index(drop=True).where(found)
+    else:
+        out["nearest_sample_id"] = pd.array([pd.NA] * len(out), dtype="Int64")
+        out["nearest_risk"] = pd.Series(pd.Categorical([None] * len(out), categories=db.CATEGORIES["risk_level"]))
+    return out
+
+def _water_filters(filters: dict) -> dict:
+    # La proximité ne s'arrête pas aux limites de zone: tous les points d'eau de la période
+    return {"start": filters.get("start"), "end": filters.get("end")}
+
+@cache.memoize("water_samples")
+def _indexes_for(conn, water_filters):
+    return build_indexes(db.query_water(conn, water_filters, columns=WATER_COLUMNS))
+
+def indexes_for(conn, filters):
+    return _indexes_for(conn, _water_filters(filters))
+
+# Nouveaux ménages seuls: leur exposition est calculée et ajoutée (index inchangé)
+@cache.memoize_append("households", "water_samples")
+def exposure_for(conn, filters, radius_m=DEFAULT_RADIUS_M):
+    h = db.query_households(conn, filters, columns=HOUSEHOLD_COLUMNS)
+    return exposure(h, indexes_for(conn, filters), radius_m)
+
+# ------------------ Synthèses ------------------
+
+def exposure_kpis(e) -> dict:
+    n = len(e)
+    exposed = int(e["exposed"].sum()) if n else 0
+    return dict(
+        households=n,
+        exposed=exposed,
+        pct_exposed=100 * exposed / n if n else 0.0,
+        median_nearest_m=float(e["nearest_m"].median()) if n and e["nearest_m"].notna().any() else float("nan"),
+    )
+
+def exposure_by_zone(e):
+    """Par zone: ménages géolocalisés, exposés (%), distance médiane au point d'eau le plus proche."""
+    columns = ["zone", "menages_geo", "exposes", "exposes_pct", "distance_mediane_m"]
+    if len(e) == 0:
+        return pd.DataFrame(columns=columns)
+    g = e.groupby("zone", observed=True)
+    out = pd.DataFrame({
+        "menages_geo": g.size(),
+        "exposes": g["exposed"].sum(),
+        "distance_mediane_m": g["nearest_m"].median().round(0),
+    }).reset_index()
+    out["exposes_pct"] = (100 * out["exposes"] / out["menages_geo"]).round(1)
+    return out[columns].sort_values("exposes_pct", ascending=False, ignore_index=True)
+
+def exposed_layer_frame(e, cell_m: float = mapping.DEFAULT_CELL_M):
+    """("points" | "grid", frame) des ménages exposés, agrégés en grille au-delà de POINT_THRESHOLD."""
+    x = e.loc[e["exposed"], ["lat", "lon", "zone", "risk_points", "nearest_m"]].reset_index(drop=True)
+    if len(x) <= mapping.POINT_THRESHOLD:
+        return "points", x
+    inv, lat0, lon0 = mapping.grid_cells(x["lat"], x["lon"], cell_m)
+    return "grid", pd.DataFrame({"lat": lat0, "lon": lon0, "count": np.bincount(inv)})